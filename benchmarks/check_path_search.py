@@ -0,0 +1,95 @@
+# check_path_search.py
+"""
+Sprawdzenie optymalności path_search.find_min_length_path.
+
+Na małych losowych siatkach dróg (3×3 – 5×5 węzłów, wagi jak we wtyczce:
+długość / (1 + score)) wynik wyszukiwania jest porównywany z pełnym
+przeglądem wszystkich ścieżek prostych. Zwraca kod 1, gdy koszt różni się
+od optymalnego albo ścieżka nie zostaje znaleziona, choć istnieje — nadaje
+się do uruchamiania jako test:
+
+    python benchmarks/check_path_search.py --cases 300
+"""
+import argparse
+import importlib
+import os
+import random
+import sys
+
+import networkx as nx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PLUGIN_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+
+MIN_LENGTHS = (150.0, 300.0, 500.0, 700.0)
+
+
+def random_grid(size, rng):
+    """
+    Siatka size × size z krawędziami 25–75 m; co trzecia krawędź ma losowy score 0–5.
+    """
+    G = nx.Graph()
+    for i in range(size):
+        for j in range(size):
+            for a, b in (((i, j), (i + 1, j)), ((i, j), (i, j + 1))):
+                if b[0] < size and b[1] < size:
+                    length = 50 * rng.uniform(0.5, 1.5)
+                    score = rng.uniform(0, 5) if rng.random() < 1 / 3 else 0.0
+                    G.add_edge(a, b, length=length, weight=length / (1 + score))
+    return G
+
+
+def brute_force(G, min_length):
+    """
+    Koszt najtańszej ścieżki prostej o długości ≥ min_length (przegląd w głąb
+    od każdego węzła) albo None.
+    """
+    best = float('inf')
+
+    def extend(u, visited, cost, dist):
+        nonlocal best
+        for v, data in G[u].items():
+            if v in visited:
+                continue
+            new_cost, new_dist = cost + data["weight"], dist + data["length"]
+            if new_cost >= best:
+                continue
+            if new_dist >= min_length:
+                best = new_cost
+                continue
+            visited.add(v)
+            extend(v, visited, new_cost, new_dist)
+            visited.discard(v)
+
+    for start in G:
+        extend(start, {start}, 0.0, 0.0)
+    return best if best < float('inf') else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Optymalność wyszukiwania ścieżki o minimalnej długości")
+    parser.add_argument("--cases", type=int, default=100, help="liczba losowych siatek")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    path_search = importlib.import_module(f"{os.path.basename(PLUGIN_DIR)}.path_search")
+    failures = 0
+    for case in range(args.cases):
+        rng = random.Random(args.seed + case)
+        size, min_length = rng.randint(3, 5), rng.choice(MIN_LENGTHS)
+        G = random_grid(size, rng)
+        expected = brute_force(G, min_length)
+        result = path_search.find_min_length_path(G, min_length=min_length, max_labels=None)
+        cost = result[1] if result else None
+        if (expected is None) != (cost is None) or (cost is not None and abs(cost - expected) > 1e-9 * expected):
+            failures += 1
+            print(f"[PATH] przypadek {case}: siatka {size}×{size}, ≥ {min_length:g} m → koszt {cost}, "
+                  f"optymalny {expected}")
+
+    print(f"[PATH] {args.cases - failures}/{args.cases} wyników optymalnych")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
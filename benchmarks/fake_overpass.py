@@ -0,0 +1,175 @@
+# fake_overpass.py
+"""
+Lokalny zamiennik Overpass API dla benchmarków — pobieranie działa bez sieci.
+
+Serwer odpowiada nagranymi odpowiedziami z katalogu recordings (plik
+<sha1 zapytania>.osm albo .json), a dla zapytań bez nagrania zwraca
+syntetyczną sieć scenariusza: drogi dla zapytań o "highway", siedliska
+dla pozostałych (przycinanie do obszaru zapytania zostaje po stronie
+czytającego). Format to OSM XML, jak domyślnie w Overpass — tak czyta
+odpowiedzi overpass_client wtyczki — albo JSON dla zapytań z [out:json].
+Z record=True odpowiedzi syntetyczne są zapisywane jako nagrania, więc
+kolejne przebiegi serwują dokładnie te same dane.
+"""
+import hashlib
+import itertools
+import json
+import os
+import threading
+from xml.sax.saxutils import quoteattr
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from shapely.geometry import Point
+
+
+STATUS = "Connected as: 0\nCurrent time: 2000-01-01T00:00:00Z\nRate limit: 0\n2 slots available now.\n"
+
+
+def overpass_elements(network, roads=True, habitats=True):
+    """
+    Elementy OSM (słowniki jak w odpowiedzi JSON Overpass) syntetycznej sieci
+    (synthetic.py): drogi i/lub siedliska, węzły przed drogami.
+    """
+    ids = itertools.count(1)
+    node_ids = {}
+    elements = []
+
+    def node(lon, lat):
+        key = (round(lon, 7), round(lat, 7))
+        if key not in node_ids:
+            node_ids[key] = next(ids)
+            elements.append({"type": "node", "id": node_ids[key], "lat": key[1], "lon": key[0]})
+        return node_ids[key]
+
+    for line, highway in (network["ways"] if roads else []):
+        refs = [node(lon, lat) for lon, lat in line]
+        elements.append({"type": "way", "id": next(ids), "nodes": refs, "tags": {"highway": highway}})
+
+    tags = {
+        "landuse_forest": {"landuse": "forest"},
+        "natural_water": {"natural": "water"},
+        "natural_cave_entrance": {"natural": "cave_entrance"},
+    }
+    for key, geoms in (network["habitats"].items() if habitats else []):
+        for geom in geoms:
+            if isinstance(geom, Point):
+                elements.append({"type": "node", "id": next(ids), "lat": geom.y, "lon": geom.x, "tags": tags[key]})
+            else:
+                refs = [node(lon, lat) for lon, lat in geom.exterior.coords]
+                elements.append({"type": "way", "id": next(ids), "nodes": refs, "tags": tags[key]})
+
+    # osmnx oczekuje węzłów przed drogami
+    elements.sort(key=lambda e: e["type"] != "node")
+    return elements
+
+
+def overpass_json(network, roads=True, habitats=True):
+    """
+    Odpowiedź Overpass w formacie JSON.
+    """
+    return json.dumps({"version": 0.6, "generator": "fake_overpass",
+                       "elements": overpass_elements(network, roads, habitats)})
+
+
+def overpass_xml(network, roads=True, habitats=True):
+    """
+    Odpowiedź Overpass w formacie OSM XML.
+    """
+    def tags(element):
+        return "".join(f"<tag k={quoteattr(k)} v={quoteattr(v)}/>" for k, v in element.get("tags", {}).items())
+
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<osm version="0.6" generator="fake_overpass">']
+    for e in overpass_elements(network, roads, habitats):
+        if e["type"] == "node":
+            lines.append(f'<node id="{e["id"]}" lat="{e["lat"]}" lon="{e["lon"]}">{tags(e)}</node>')
+        else:
+            refs = "".join(f'<nd ref="{ref}"/>' for ref in e["nodes"])
+            lines.append(f'<way id="{e["id"]}">{refs}{tags(e)}</way>')
+    lines.append("</osm>")
+    return "\n".join(lines)
+
+
+class FakeOverpass:
+    """
+    Serwer HTTP w wątku tła; użycie jako context manager:
+
+        with FakeOverpass(network) as server:
+            source = osm_sources.OverpassSource(use_cache=False, endpoint=server.endpoint)
+    """
+
+    def __init__(self, network=None, recordings=None, record=False, host="127.0.0.1", port=0):
+        self.network = network
+        self.recordings = recordings
+        self.record = record
+        self.requests = 0
+        self._synthetic = {}
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, body, content_type):
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _query(self, query):
+                if urlparse(self.path).path.endswith("/status"):
+                    self._reply(STATUS, "text/plain")
+                    return
+                as_json = "[out:json]" in query
+                self._reply(server.response(query), "application/json" if as_json else "application/osm3s+xml")
+
+            def do_GET(self):
+                self._query(parse_qs(urlparse(self.path).query).get("data", [""])[0])
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+                self._query(parse_qs(body).get("data", [body])[0])
+
+            def log_message(self, format, *args):
+                pass  # bez wpisów na stderr przy każdym zapytaniu
+
+        return Handler
+
+    def response(self, query):
+        self.requests += 1
+        as_json = "[out:json]" in query
+        roads = "highway" in query
+        key = hashlib.sha1(query.encode("utf-8")).hexdigest()
+        extension = ".json" if as_json else ".osm"
+        path = os.path.join(self.recordings, key + extension) if self.recordings else None
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                return f.read()
+
+        kind = (as_json, roads)
+        if kind not in self._synthetic:
+            network = self.network or {"ways": [], "habitats": {}}
+            render = overpass_json if as_json else overpass_xml
+            self._synthetic[kind] = render(network, roads=roads, habitats=not roads)
+        if path and self.record:
+            os.makedirs(self.recordings, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self._synthetic[kind])
+        return self._synthetic[kind]
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
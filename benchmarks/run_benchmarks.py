@@ -0,0 +1,226 @@
+# run_benchmarks.py
+"""
+Benchmarki etapów wtyczki na syntetycznych sieciach dróg (bez QGIS).
+
+Dla każdego scenariusza (grid / rural / coastal) mierzone są etapy:
+budowa grafów tablicowych (CSRGraph), wyszukiwanie transektu o minimalnej
+długości, score krawędzi, dopasowanie końców transektów do grafu, łączenie
+transektów (macierz odległości + kolejność), trasy CompactRouter oraz
+— jeśli są osmnx i QGIS — pobieranie ścieżką wtyczki (overpass_client)
+z lokalnego zamiennika Overpass. Wagi grafu odcinków są w metrach, jak
+w road_graph. Mierzony jest też czas ładowania wtyczki (startup_time.py).
+Wynik (czas i szczytowe zużycie pamięci każdego etapu) trafia do pliku
+JSON, np.:
+
+    python benchmarks/run_benchmarks.py --scenario all --size 30 --output bench.json
+"""
+import argparse
+import importlib
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import networkx as nx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PLUGIN_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+
+import startup_time  # noqa: E402
+import synthetic  # noqa: E402
+from fake_overpass import FakeOverpass  # noqa: E402
+
+
+def plugin_module(name):
+    """
+    Importuje moduł wtyczki jako część pakietu (moduły używają importów względnych).
+    """
+    return importlib.import_module(f"{os.path.basename(PLUGIN_DIR)}.{name}")
+
+
+def measure(fn, repeat=1):
+    """
+    Zwraca (wynik, statystyki): najkrótszy czas z repeat przebiegów oraz
+    szczytowe zużycie pamięci (tracemalloc) z osobnego przebiegu.
+    """
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {"seconds": round(min(times), 6), "peak_mib": round(peak / 2 ** 20, 3)}
+
+
+def buffer_subgraph(G, radius):
+    """
+    Podgraf dróg w promieniu radius metrów od środka sieci — odpowiednik warstwy dróg jednego bufora.
+    """
+    lon0, lat0 = synthetic.CENTER
+    scale = synthetic.METERS_PER_DEGREE
+    nodes = [n for n in G.nodes()
+             if math.hypot((n[0] - lon0) * scale * math.cos(math.radians(lat0)), (n[1] - lat0) * scale) <= radius]
+    return G.subgraph(nodes).copy()
+
+
+def bench_scenario(name, args):
+    path_search = plugin_module("path_search")
+    habitat_scoring = plugin_module("habitat_scoring")
+    graph_index = plugin_module("graph_index")
+    tour_optimizer = plugin_module("tour_optimizer")
+    compact_routing = plugin_module("compact_routing")
+    csr_graph = plugin_module("csr_graph")
+
+    stages = {}
+    network, stages["generate"] = measure(lambda: synthetic.SCENARIOS[name](args.size, seed=args.seed))
+
+    def build():
+        return (synthetic.feature_graph(network, args.seed), synthetic.segment_graph(network),
+                synthetic.edges_gdf(network), synthetic.habitat_gdfs(network))
+    (features, segments, edges, habitats), stages["build_graphs"] = measure(build)
+
+    # Grafy tablicowe, na których pracują silniki tras wtyczki (road_graph zwraca CSRGraph)
+    buffer_graph = buffer_subgraph(features, args.buffer_radius)
+    (buffer_csr, segments_csr), stages["csr_build"] = measure(
+        lambda: (csr_graph.CSRGraph.from_networkx(buffer_graph), csr_graph.CSRGraph.from_networkx(segments)))
+    segments_csr.graph.update(segments.graph)  # heurystyka i układ jak z road_graph
+    stages["csr_build"].update(segment_mib=round(segments_csr.nbytes / 2 ** 20, 3))
+
+    # Transekt ≥ min_length w drogach jednego bufora
+    found, stages["min_length_path"] = measure(
+        lambda: path_search.find_min_length_path(buffer_csr, min_length=args.min_length), args.repeat)
+    stages["min_length_path"].update(nodes=buffer_graph.number_of_nodes(), found=found is not None)
+
+    _, stages["score_edges"] = measure(
+        lambda: habitat_scoring.score_edges(edges, habitats, args.max_distance), args.repeat)
+
+    # Łączenie transektów: dopasowanie końców, macierz odległości, kolejność
+    endpoints_xy = [p for pair in synthetic.transects(network, args.transects, args.seed) for p in pair]
+
+    def snap():
+        index = graph_index.GraphIndex(segments_csr)
+        return [index.nearest_node(p, max_dist=1200) for p in endpoints_xy]
+    endpoints, stages["snap_endpoints"] = measure(snap, args.repeat)
+
+    def connect():
+        distances = tour_optimizer.EndpointDistances(segments_csr, endpoints)
+        tour = tour_optimizer.optimize_tour(distances.matrix, time_budget=args.time_budget)
+        legs = [distances.path(*tour_optimizer.leg(a, b)) for a, b in zip(tour, tour[1:])]
+        return tour_optimizer.tour_cost(distances.matrix, tour), legs
+    (cost, _), stages["connect_transects"] = measure(connect, args.repeat)
+    stages["connect_transects"].update(transects=len(endpoints) // 2, tour_cost=float(cost))
+
+    router, stages["compact_router_build"] = measure(
+        lambda: compact_routing.CompactRouter(segments, heuristic=segments.graph["heuristic"]))
+    rng = random.Random(args.seed)
+    nodes = list(segments.nodes())
+    queries = [(rng.choice(nodes), rng.choice(nodes)) for _ in range(args.queries)]
+
+    def route():
+        for s, t in queries:
+            try:
+                router.shortest_path(s, t)
+            except nx.NetworkXNoPath:
+                pass
+    _, stages["compact_router_queries"] = measure(route, args.repeat)
+    stages["compact_router_queries"].update(queries=len(queries), compact_nodes=router.graph.number_of_nodes())
+
+    stages["download"] = bench_download(network, args)
+
+    return {
+        "size": args.size,
+        "ways": len(network["ways"]),
+        "segment_nodes": segments.number_of_nodes(),
+        "segment_edges": segments.number_of_edges(),
+        "stages": stages,
+    }
+
+
+def bench_download(network, args):
+    """
+    Pobranie dróg i siedlisk obszaru bufora ścieżką wtyczki (osm_sources.OverpassSource:
+    overpass_client i osmnx *_from_xml, bez cache na dysku) z lokalnego zamiennika Overpass.
+    Wymaga osmnx i QGIS (osm_tools importuje qgis.core).
+    """
+    try:
+        osm_sources = plugin_module("osm_sources")
+    except ImportError as e:
+        return {"skipped": f"brak {e.name}"}
+
+    area = synthetic.buffer_polygon(args.buffer_radius)
+    with FakeOverpass(network, recordings=args.recordings, record=args.record) as server:
+        source = osm_sources.OverpassSource(use_cache=False, endpoint=server.endpoint)
+
+        def download():
+            return source.road_edges(area), source.habitats(area, margin=args.max_distance)
+        (edges, habitats), stats = measure(download, args.repeat)
+        stats.update(edges=len(edges), habitats=sum(len(gdf) for gdf in habitats.values()),
+                     requests=server.requests)
+    return stats
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=PLUGIN_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarki Bat Transects na syntetycznych sieciach dróg")
+    parser.add_argument("--scenario", choices=[*synthetic.SCENARIOS, "all"], default="all")
+    parser.add_argument("--size", type=int, default=30, help="liczba skrzyżowań w jednym kierunku")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="przebiegi do pomiaru czasu (zapisywany najkrótszy)")
+    parser.add_argument("--buffer-radius", type=float, default=500.0)
+    parser.add_argument("--min-length", type=float, default=500.0)
+    parser.add_argument("--max-distance", type=float, default=100.0)
+    parser.add_argument("--transects", type=int, default=40)
+    parser.add_argument("--time-budget", type=float, default=2.0)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--recordings", default=os.path.join(BENCH_DIR, "recordings"),
+                        help="katalog nagranych odpowiedzi Overpass")
+    parser.add_argument("--record", action="store_true", help="zapisz brakujące odpowiedzi jako nagrania")
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args(argv)
+
+    scenarios = list(synthetic.SCENARIOS) if args.scenario == "all" else [args.scenario]
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "parameters": vars(args),
+        "scenarios": {},
+    }
+    print("[BENCH] startup...")
+    report["startup"] = startup_time.measure_startup()
+    for name, stats in report["startup"].items():
+        print(f"  {name:24s} {stats}")
+
+    for name in scenarios:
+        print(f"[BENCH] {name} (size={args.size})...")
+        report["scenarios"][name] = result = bench_scenario(name, args)
+        for stage, stats in result["stages"].items():
+            print(f"  {stage:24s} {stats}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[BENCH] Zapisano {args.output}")
+
+
+if __name__ == "__main__":
+    main()
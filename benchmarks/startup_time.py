@@ -0,0 +1,96 @@
+# startup_time.py
+"""
+Pomiar czasu ładowania wtyczki przy starcie QGIS.
+
+W osobnym procesie (czysty sys.modules) importowany jest moduł main
+wtyczki — tak jak robi to classFactory — i sprawdzane, czy nie zostały
+załadowane ciężkie zależności (osmnx, geopandas, ...), które powinny być
+importowane dopiero po wywołaniu akcji. Dla porównania mierzony jest czas
+importu samych zależności. Bez QGIS pomiar wtyczki jest pomijany.
+
+Zwraca kod 1, gdy przy starcie ładowane są ciężkie moduły albo import trwa
+dłużej niż --max-seconds, więc nadaje się do uruchamiania jako test:
+
+    python benchmarks/startup_time.py --max-seconds 0.5
+"""
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PLUGIN_DIR = os.path.dirname(BENCH_DIR)
+
+# Moduły, których wtyczka nie powinna ładować przy starcie
+HEAVY_MODULES = ["osmnx", "geopandas", "networkx", "pandas", "shapely", "pyproj", "scipy"]
+
+CHILD = r"""
+import json, sys, time
+sys.path.insert(0, {parent!r})
+try:
+    for name in {preload!r}:
+        __import__(name)
+except ImportError as e:
+    print(json.dumps({{"skipped": f"brak {{e.name}}"}}))
+    sys.exit(0)
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": round(seconds, 6),
+                  "heavy_modules": sorted(m for m in {heavy!r} if m in sys.modules)}}))
+"""
+
+
+def import_time(modules, preload=()):
+    """
+    Czas importu modules w świeżym procesie; preload jest importowany przed
+    pomiarem (np. qgis.core, który QGIS ma już załadowany przy starcie wtyczek).
+    """
+    code = CHILD.format(parent=os.path.dirname(PLUGIN_DIR), preload=list(preload), modules=list(modules),
+                        heavy=HEAVY_MODULES)
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else result.returncode}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure_startup():
+    package = os.path.basename(PLUGIN_DIR)
+    installed = [name for name in HEAVY_MODULES if importlib.util.find_spec(name) is not None]
+    dependencies = import_time(installed)
+    dependencies["missing"] = sorted(set(HEAVY_MODULES) - set(installed))
+    return {
+        "plugin_import": import_time([f"{package}.main"], preload=["qgis.core", "qgis.PyQt.QtWidgets"]),
+        "dependencies_import": dependencies,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Czas ładowania wtyczki Bat Transects")
+    parser.add_argument("--max-seconds", type=float, default=None, help="limit czasu importu wtyczki")
+    args = parser.parse_args(argv)
+
+    stats = measure_startup()
+    for name, value in stats.items():
+        print(f"  {name:24s} {value}")
+
+    plugin = stats["plugin_import"]
+    if "skipped" in plugin:
+        return 0
+    if "error" in plugin:
+        print(f"[STARTUP] Błąd importu wtyczki: {plugin['error']}")
+        return 1
+    if plugin["heavy_modules"]:
+        print(f"[STARTUP] Przy starcie ładowane są ciężkie moduły: {', '.join(plugin['heavy_modules'])}")
+        return 1
+    if args.max_seconds is not None and plugin["seconds"] > args.max_seconds:
+        print(f"[STARTUP] Import wtyczki trwa {plugin['seconds']:.3f} s (limit {args.max_seconds} s)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+# synthetic.py
+"""
+Syntetyczne sieci dróg i siedliska do benchmarków (bez QGIS i bez sieci).
+
+Każdy scenariusz zwraca słownik {"ways": [(lista (lon, lat), highway)],
+"habitats": {klucz warstwy osm_tools.habitat_layers: [geometrie Shapely]}}.
+Wielkość sieci ustala parametr size (liczba skrzyżowań w jednym kierunku).
+"""
+import math
+
+import geopandas as gpd
+import networkx as nx
+import numpy as np
+import shapely
+from scipy.spatial import Delaunay
+from shapely.geometry import LineString, Point, Polygon
+
+CENTER = (21.0, 52.0)  # (lon, lat)
+METERS_PER_DEGREE = 111320.0
+HIGHWAYS = ["residential", "tertiary", "track", "service", "unclassified", "path"]
+
+
+def _to_lonlat(xy):
+    """
+    Zamienia współrzędne w metrach (względem CENTER) na (lon, lat).
+    """
+    xy = np.asarray(xy, dtype=float)
+    lon = CENTER[0] + xy[..., 0] / (METERS_PER_DEGREE * math.cos(math.radians(CENTER[1])))
+    lat = CENTER[1] + xy[..., 1] / METERS_PER_DEGREE
+    return np.stack((lon, lat), axis=-1)
+
+
+def _subdivide(a, b, rng, pieces=3, jitter=5.0):
+    """
+    Dzieli odcinek a–b (metry) na kilka części z losowym przesunięciem wierzchołków.
+    """
+    t = np.linspace(0, 1, pieces + 1)[:, None]
+    points = a + (b - a) * t
+    points[1:-1] += rng.normal(0, jitter, size=(pieces - 1, 2))
+    return points
+
+
+def _habitats(rng, extent, count):
+    forests = [Point(rng.uniform(-extent, extent, 2)).buffer(rng.uniform(50, 250), 8) for _ in range(count)]
+    waters = [Point(rng.uniform(-extent, extent, 2)).buffer(rng.uniform(20, 120), 8) for _ in range(count // 2)]
+    caves = [Point(rng.uniform(-extent, extent, 2)) for _ in range(max(count // 5, 1))]
+    to_lonlat = lambda g: shapely.transform(g, lambda c: _to_lonlat(c))
+    return {
+        "landuse_forest": [to_lonlat(g) for g in forests],
+        "natural_water": [to_lonlat(g) for g in waters],
+        "natural_cave_entrance": [to_lonlat(g) for g in caves],
+    }
+
+
+def grid_network(size=30, spacing=100.0, seed=0):
+    """
+    Siatka ulic (teren zabudowany): size × size skrzyżowań co spacing metrów.
+    """
+    rng = np.random.default_rng(seed)
+    half = (size - 1) * spacing / 2
+    ways = []
+    for i in range(size):
+        for j in range(size):
+            a = np.array([i * spacing - half, j * spacing - half])
+            for di, dj in ((1, 0), (0, 1)):
+                if i + di < size and j + dj < size:
+                    b = a + np.array([di * spacing, dj * spacing])
+                    ways.append((_to_lonlat(_subdivide(a, b, rng)).tolist(), str(rng.choice(HIGHWAYS))))
+    return {"ways": ways, "habitats": _habitats(rng, half, size)}
+
+
+def rural_network(size=30, spacing=300.0, seed=0):
+    """
+    Rzadka sieć wiejska: losowe skrzyżowania, drzewo rozpinające triangulacji
+    Delaunaya plus część pozostałych krawędzi, długie kręte odcinki.
+    """
+    rng = np.random.default_rng(seed)
+    half = size * spacing / 2
+    points = rng.uniform(-half, half, size=(size * size, 2))
+    tri = Delaunay(points)
+    G = nx.Graph()
+    for simplex in tri.simplices:
+        for k in range(3):
+            u, v = simplex[k], simplex[(k + 1) % 3]
+            G.add_edge(u, v, weight=float(np.hypot(*(points[u] - points[v]))))
+    kept = nx.minimum_spanning_tree(G)
+    extra = [(u, v) for u, v in G.edges() if not kept.has_edge(u, v) and rng.random() < 0.25]
+    kept.add_edges_from(extra)
+
+    ways = []
+    for u, v in kept.edges():
+        line = _subdivide(points[u], points[v], rng, pieces=6, jitter=15.0)
+        ways.append((_to_lonlat(line).tolist(), str(rng.choice(HIGHWAYS))))
+    return {"ways": ways, "habitats": _habitats(rng, half, size)}
+
+
+def coastal_network(size=30, spacing=100.0, seed=0):
+    """
+    Sieć nadmorska: siatka ulic ucięta falistą linią brzegu (dużo ślepych
+    końców), morze jako wielki wielokąt wody.
+    """
+    rng = np.random.default_rng(seed)
+    network = grid_network(size, spacing, seed)
+    half = (size - 1) * spacing / 2
+
+    xs = np.linspace(-half - spacing, half + spacing, 64)
+    coast = np.column_stack((xs, half * 0.3 * np.sin(xs / half * 3) + rng.normal(0, spacing / 4, len(xs))))
+    sea = Polygon(np.vstack((coast, [[xs[-1], 3 * half], [xs[0], 3 * half]])))
+    sea_lonlat = shapely.transform(sea, lambda c: _to_lonlat(c))
+
+    network["ways"] = [(line, highway) for line, highway in network["ways"]
+                       if not LineString(line).intersects(sea_lonlat)]
+    network["habitats"]["natural_water"].append(sea_lonlat)
+    return network
+
+
+SCENARIOS = {
+    "grid": grid_network,
+    "rural": rural_network,
+    "coastal": coastal_network,
+}
+
+
+# --- Struktury jak w kodzie wtyczki -----------------------------------------------------------
+
+def _haversine_lengths(coords):
+    lon1, lat1, lon2, lat2 = map(np.radians, (coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1]))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 6371000 * 2 * np.arcsin(np.sqrt(a))
+
+
+def feature_graph(network, seed=0):
+    """
+    Graf jak road_graph.build_feature_graph: krawędź na drogę, długość w metrach,
+    waga obniżana losowym score.
+    """
+    rng = np.random.default_rng(seed)
+    G = nx.Graph()
+    for line, _ in network["ways"]:
+        coords = np.asarray(line)
+        length = float(_haversine_lengths(coords).sum())
+        score = rng.exponential(0.3)
+        G.add_edge(tuple(line[0]), tuple(line[-1]), weight=length / (1 + score), length=length,
+                   geometry=LineString(line))
+    return G
+
+
+def segment_graph(network):
+    """
+    Graf jak road_graph.build_segment_graph: krawędź na odcinek, waga w metrach
+    (długość po kuli — w granicach ułamka procenta od geodezyjnej), węzły (lon, lat).
+    """
+    G = nx.Graph(heuristic="geodesic", geographic=True)
+    for line, _ in network["ways"]:
+        lengths = _haversine_lengths(np.asarray(line))
+        for a, b, length in zip(line, line[1:], lengths.tolist()):
+            G.add_edge(tuple(a), tuple(b), weight=length, geometry=LineString([a, b]))
+    return G
+
+
+def buffer_polygon(radius):
+    """
+    Koło o promieniu radius metrów wokół CENTER w (lon, lat) — obszar jak bufor wtyczki.
+    """
+    return shapely.transform(Point(0, 0).buffer(radius, 16), lambda c: _to_lonlat(c))
+
+
+def edges_gdf(network):
+    """
+    Krawędzie jak z ox.graph_to_gdfs (EPSG:4326, kolumna highway).
+    """
+    return gpd.GeoDataFrame(
+        {"highway": [highway for _, highway in network["ways"]]},
+        geometry=[LineString(line) for line, _ in network["ways"]],
+        crs="EPSG:4326"
+    )
+
+
+def habitat_gdfs(network):
+    return {key: gpd.GeoDataFrame(geometry=geoms, crs="EPSG:4326") for key, geoms in network["habitats"].items()}
+
+
+def transects(network, count=20, seed=0):
+    """
+    Losowe drogi sieci jako transekty: lista (start, koniec) w (lon, lat).
+    """
+    rng = np.random.default_rng(seed)
+    picked = rng.choice(len(network["ways"]), size=min(count, len(network["ways"])), replace=False)
+    return [(tuple(network["ways"][i][0][0]), tuple(network["ways"][i][0][-1])) for i in picked]
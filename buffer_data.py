@@ -0,0 +1,152 @@
+# buffer_data.py
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from . import instrumentation
+from .habitat_scoring import build_habitat_rasters, sample_points, exposure_score
+from .geometry_convert import to_qgs_features
+from .osm_tools import habitat_layers, expand_polygon, explode_tag_values, osm_ids
+
+
+# Liczba buforów trzymanych w pamięci (najdawniej używane są usuwane)
+DEFAULT_MAX_BUFFERS = 256
+
+
+class BufferData:
+    """
+    Surowe dane bufora (krawędzie dróg i siedliska pobrane z marginesem
+    margin metrów) razem z wynikami pośrednimi, które zależą tylko od części
+    parametrów: rozwinięte wartości highway, rastry odległości od siedlisk
+    (wspólne rastry obszaru badań albo liczone dla bufora) i odległości
+    w punktach próbkowania wzdłuż krawędzi — te nie zależą od zasięgu.
+
+    Zmiana wykluczonych typów dróg, wybranych siedlisk albo zasięgu (nie
+    większego niż margin) przelicza więc tylko filtr i score, bez ponownego
+    pobierania danych. Metody mogą być wołane z wątków zadań QgsTask.
+    """
+
+    def __init__(self, polygon, edges, habitats, margin, rasters=None):
+        self.polygon = polygon
+        self.edges = edges
+        self.habitats = {key: gdf[gdf.is_valid] for key, gdf in habitats.items()}
+        self.margin = margin
+
+        if 'highway' in edges.columns:
+            self.highway_values = explode_tag_values(edges['highway'])
+        else:
+            self.highway_values = pd.Series([""] * len(edges)).explode()
+        self.highway = self.highway_values.groupby(level=0).first().to_numpy()
+
+        self._rasters = rasters
+        self._samples = None
+        self._subsets = {}
+        self._distances = {}
+        self._lock = threading.Lock()
+
+    def rasters(self):
+        if self._rasters is None:
+            with instrumentation.stage("habitat_rasters"):
+                self._rasters = build_habitat_rasters(self.habitats, self.edges, self.margin)
+        return self._rasters
+
+    def _sample_points(self, crs):
+        if self._samples is None:
+            self._samples = sample_points(self.edges.geometry.to_crs(crs).values)
+            instrumentation.count("edge_samples", len(self._samples[0]))
+        return self._samples
+
+    def habitat_subset(self, key, max_distance):
+        """
+        Obiekty warstwy key w buforze powiększonym o max_distance (jak przy pobieraniu z tym marginesem).
+        """
+        gdf = self.habitats[key]
+        if max_distance >= self.margin:
+            return gdf
+        cache_key = (key, max_distance)
+        if cache_key not in self._subsets:
+            area = expand_polygon(self.polygon, max_distance)
+            self._subsets[cache_key] = gdf.iloc[gdf.sindex.query(area, predicate="intersects")]
+        return self._subsets[cache_key]
+
+    def scores(self, key, max_distance):
+        """
+        Ekspozycja każdej krawędzi na warstwę key (średni score próbek co kilka metrów).
+        """
+        raster = self.rasters().get(key)
+        if raster is None or self.edges.empty:
+            return np.zeros(len(self.edges))
+        edge_idx, x, y, counts = self._sample_points(raster.crs)
+        if key not in self._distances:
+            self._distances[key] = raster.sample(x, y)
+        return exposure_score(self._distances[key], edge_idx, counts, max_distance)
+
+    def result(self, buffer_id, excluded_highway_types, environment_preferences, max_distance):
+        """
+        Filtr dróg i score dla parametrów; zwraca słownik jak osm_tools.process_buffer.
+        """
+        with self._lock:
+            env_results = []
+            scores = np.zeros(len(self.edges))
+            for key in self.habitats:
+                _, env_type, geom_type = habitat_layers[key]
+                if environment_preferences and not environment_preferences.get(env_type, False):
+                    continue  # Pomijaj nie wybrane
+
+                gdf = self.habitat_subset(key, max_distance)
+                if gdf.empty:
+                    continue
+                feats = to_qgs_features(gdf.geometry, [osm_ids(gdf)])
+                env_results.append((key, geom_type, feats))
+                instrumentation.count("habitat_features", len(feats))
+
+                with instrumentation.stage("scoring", buffer_id):
+                    scores = scores + self.scores(key, max_distance)
+
+        excluded = self.highway_values.isin(excluded_highway_types).groupby(level=0).any().to_numpy()
+        with instrumentation.stage("features", buffer_id):
+            features = to_qgs_features(
+                self.edges.geometry[~excluded],
+                [pd.Series(self.highway[~excluded]).fillna("").astype(str), scores[~excluded].tolist()]
+            )
+        return {"buffer_id": buffer_id, "env": env_results, "roads": features}
+
+
+_store = OrderedDict()
+_store_lock = threading.Lock()
+
+
+def make_key(data_source, polygon, buffer_distance):
+    """
+    Klucz danych bufora: źródło danych (współdzielone przez osm_sources.get_source),
+    geometria bufora i promień pobierania dróg.
+    """
+    return id(data_source), polygon.wkb, float(buffer_distance)
+
+
+def get(key, margin):
+    """
+    Zwraca dane bufora pobrane z marginesem co najmniej margin albo None.
+    """
+    with _store_lock:
+        data = _store.get(key)
+        if data is None or data.margin < margin:
+            return None
+        _store.move_to_end(key)
+        return data
+
+
+def put(key, data, max_buffers=DEFAULT_MAX_BUFFERS):
+    with _store_lock:
+        _store[key] = data
+        _store.move_to_end(key)
+        while len(_store) > max_buffers:
+            _store.popitem(last=False)
+    return data
+
+
+def clear():
+    with _store_lock:
+        _store.clear()
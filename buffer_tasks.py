@@ -0,0 +1,197 @@
+# buffer_tasks.py
+from functools import partial
+
+from qgis.core import QgsApplication, QgsTask, Qgis
+from PyQt5.QtWidgets import QProgressBar, QPushButton
+
+from . import buffer_data
+from . import instrumentation
+from . import log
+from . import osm_sources
+from . import osm_tools
+
+
+# Limit równoległych zadań — publiczne serwery Overpass przydzielają ok. 2 sloty na adres IP
+DEFAULT_MAX_CONCURRENT = 2
+
+
+def _run_buffer(task, *args):
+    # QgsTask.fromFunction przekazuje zadanie jako pierwszy argument
+    buffer_id = args[1]
+    with instrumentation.stage("buffer_total", buffer_id), instrumentation.profile(f"buffer_{buffer_id}"):
+        return osm_tools.process_buffer(*args, task=task)
+
+
+class BufferBatch:
+    """
+    Przetwarza bufory w tle jako zadania QgsTask.
+
+    Pobieranie i liczenie score (osm_tools.process_buffer) działa w wątkach
+    roboczych, co najwyżej max_concurrent naraz. Wyniki trafiają w wątku
+    głównym po zakończeniu zadania do wspólnych warstw output
+    (output_layers.GeoPackageOutput), a bez niego do osobnych warstw
+    tymczasowych (osm_tools.add_buffer_layers).
+    Postęp i przycisk "Anuluj" są widoczne na pasku komunikatów QGIS.
+    """
+
+    def __init__(self, iface, buffers, crs, buffer_distance, excluded_types=None, environment_preferences=None,
+                 data_source=None, use_study_area=True, max_concurrent=DEFAULT_MAX_CONCURRENT, on_done=None,
+                 output=None):
+        self.iface = iface
+        self.buffers = list(buffers)
+        self.crs = crs
+        self.buffer_distance = buffer_distance
+        self.excluded_types = excluded_types
+        self.environment_preferences = environment_preferences
+        self.data_source = data_source
+        self.use_study_area = use_study_area
+        self.max_concurrent = max_concurrent
+        self.on_done = on_done
+        self.output = output
+
+        self.study_area = None
+        self.queue = []
+        self.running = {}
+        self.total = len(self.buffers) + (1 if use_study_area else 0)
+        self.completed = 0
+        self.failed = 0
+        self.canceled = False
+
+        self.message = None
+        self.progress_bar = None
+        self.report = None
+
+    def start(self):
+        self.report = instrumentation.start_run("buffers")
+        self.report.count("buffers", len(self.buffers))
+        # Przy zmianie samych parametrów dane buforów są już w pamięci — obszar badań nie jest potrzebny
+        if self.use_study_area and self._all_cached():
+            self.use_study_area = False
+            self.total -= 1
+        self._show_progress()
+        if self.use_study_area and self.buffers:
+            task = QgsTask.fromFunction(
+                "Bat Transects: pobieranie obszaru badań",
+                self._download_study_area,
+                on_finished=self._study_area_finished,
+                flags=QgsTask.CanCancel
+            )
+            self.running["study_area"] = task
+            QgsApplication.taskManager().addTask(task)
+        else:
+            self._enqueue_buffers()
+
+    def cancel(self):
+        self.canceled = True
+        self.queue = []
+        for task in list(self.running.values()):
+            task.cancel()
+
+    def _all_cached(self):
+        source = self.data_source if self.data_source is not None else osm_sources.get_source()
+        margin = osm_tools.parse_max_distance(self.environment_preferences)
+        for _, geom in self.buffers:
+            key = buffer_data.make_key(source, osm_tools.qgs_to_shapely_polygon(geom), self.buffer_distance)
+            if buffer_data.get(key, margin) is None:
+                return False
+        return True
+
+    # --- Zadania -----------------------------------------------------------------------------
+
+    def _download_study_area(self, task):
+        with instrumentation.profile("study_area"):
+            return osm_tools.download_osm_study_area(
+                [g for _, g in self.buffers],
+                env_margin=osm_tools.parse_max_distance(self.environment_preferences),
+                data_source=self.data_source,
+                task=task
+            )
+
+    def _study_area_finished(self, exception, result=None):
+        self.running.pop("study_area", None)
+        self._step()
+        if self.canceled:
+            self._finish()
+            return
+        if exception is not None:
+            # Bez obszaru badań każdy bufor pobiera dane osobno
+            log.error(f"Pobieranie obszaru badań nie powiodło się → {exception}")
+        else:
+            self.study_area = result
+        self._enqueue_buffers()
+
+    def _enqueue_buffers(self):
+        self.queue = list(self.buffers)
+        self._launch_next()
+
+    def _launch_next(self):
+        while self.queue and len(self.running) < self.max_concurrent and not self.canceled:
+            buffer_id, buffer_geom = self.queue.pop(0)
+            task = QgsTask.fromFunction(
+                f"Bat Transects: bufor {buffer_id}",
+                _run_buffer,
+                buffer_geom, buffer_id, self.buffer_distance,
+                self.excluded_types, self.environment_preferences, self.study_area, self.data_source,
+                on_finished=partial(self._buffer_finished, buffer_id),
+                flags=QgsTask.CanCancel
+            )
+            self.running[buffer_id] = task
+            QgsApplication.taskManager().addTask(task)
+
+        if not self.queue and not self.running:
+            self._finish()
+
+    def _buffer_finished(self, buffer_id, exception, result=None):
+        self.running.pop(buffer_id, None)
+        self._step()
+        if exception is not None:
+            self.failed += 1
+            log.error(f"Bufor {buffer_id} → {exception}")
+        elif result is not None and not self.canceled:
+            with instrumentation.stage("write_layers", buffer_id):
+                if self.output is not None:
+                    if not self.output.add_buffer_result(result):
+                        self.failed += 1
+                else:
+                    osm_tools.add_buffer_layers(result, self.crs, self.iface)
+        self._launch_next()
+
+    # --- Postęp ------------------------------------------------------------------------------
+
+    def _show_progress(self):
+        bar = self.iface.messageBar()
+        self.message = bar.createMessage("Bat Transects", "Przetwarzanie buforów...")
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setMaximum(max(self.total, 1))
+        self.message.layout().addWidget(self.progress_bar)
+        cancel_button = QPushButton("Anuluj")
+        cancel_button.clicked.connect(self.cancel)
+        self.message.layout().addWidget(cancel_button)
+        bar.pushWidget(self.message, Qgis.Info)
+
+    def _step(self):
+        self.completed += 1
+        if self.progress_bar is not None:
+            self.progress_bar.setValue(self.completed)
+
+    def _finish(self):
+        if self.running:
+            return
+        if self.message is not None:
+            self.iface.messageBar().popWidget(self.message)
+            self.message = None
+        if self.output is not None:
+            self.output.refresh()
+        if self.report is not None:
+            self.report.count("buffers_failed", self.failed)
+            instrumentation.finish_run(self.report)
+            self.report = None
+
+        if self.canceled:
+            self.iface.messageBar().pushMessage("Anulowano", "Przetwarzanie buforów przerwane.", level=Qgis.Warning)
+            return
+        if self.failed:
+            self.iface.messageBar().pushMessage(
+                "OSM", f"Nie udało się przetworzyć {self.failed} z {len(self.buffers)} buforów.", level=Qgis.Warning)
+        if self.on_done is not None:
+            self.on_done()
@@ -0,0 +1,231 @@
+# compact_routing.py
+import hashlib
+import heapq
+import itertools
+from math import hypot
+
+import networkx as nx
+import numpy as np
+
+from . import osm_cache
+from .csr_graph import CSRGraph
+from .geodesy import haversine
+
+
+# Heurystyki dla wag geodezyjnych są zaniżane o 1% — odległość na kuli albo
+# w odwzorowaniu może nieznacznie przekraczać długość na elipsoidzie
+HEURISTIC_MARGIN = 0.99
+
+
+class CompactRouter:
+    """
+    Szybkie wyszukiwanie tras w grafie dróg z węzłem w każdym wierzchołku linii.
+
+    Łańcuchy węzłów stopnia 2 są zwijane do pojedynczych krawędzi między
+    skrzyżowaniami (zwykle kilkukrotnie mniej węzłów), a trasy szuka A*
+    z heurystyką odległości prostoliniowej. heuristic=True: odległość
+    w jednostkach warstwy, dopuszczalna, gdy waga krawędzi nie jest mniejsza
+    od jej długości prostoliniowej. Dla wag w metrach (geodezyjnych, jak
+    w road_graph.build_segment_graph): "geodesic" — haversine między węzłami
+    (lon, lat), "metric" — odległość w metrycznym układzie warstwy, obie
+    zaniżone o HEURISTIC_MARGIN. Dla innych wag należy podać heuristic=False
+    (wtedy to zwykła Dijkstra).
+
+    Trasa jest zwracana jako lista węzłów pierwotnego grafu. Końce leżące
+    wewnątrz łańcucha są dołączane tymczasowymi krawędziami do jego końców.
+    Router odpowiada stanowi grafu z chwili budowy — późniejsze zmiany grafu
+    networkx (np. podział krawędzi przez snap_to_edge) nie są w nim widoczne;
+    CSRGraph.split_edge usuwa router z G.graph, więc get_router buduje nowy.
+    """
+
+    def __init__(self, G, weight="weight", heuristic=True):
+        self.weight = weight
+        self.heuristic = heuristic
+        self.graph = nx.Graph()
+        self.chains = []  # (węzły łańcucha, skumulowane wagi)
+        self.chain_of = {}  # węzeł wewnętrzny → (numer łańcucha, pozycja)
+        self._compact(G)
+
+    # --- Budowa ------------------------------------------------------------------------------
+
+    def _walk(self, G, start, first, visited):
+        nodes = [start, first]
+        costs = [0.0, G[start][first].get(self.weight, 1.0)]
+        visited.add(frozenset((start, first)))
+        while G.degree(nodes[-1]) == 2 and nodes[-1] != start:
+            current = nodes[-1]
+            nxt = next(n for n in G[current] if n != nodes[-2])
+            if frozenset((current, nxt)) in visited:
+                break
+            visited.add(frozenset((current, nxt)))
+            nodes.append(nxt)
+            costs.append(costs[-1] + G[current][nxt].get(self.weight, 1.0))
+        return nodes, costs
+
+    def _add_chain(self, nodes, costs):
+        chain_id = len(self.chains)
+        self.chains.append((nodes, costs))
+        for pos in range(1, len(nodes) - 1):
+            self.chain_of[nodes[pos]] = (chain_id, pos)
+
+        u, v = nodes[0], nodes[-1]
+        if u == v:
+            return  # pętla nie skraca żadnej trasy między skrzyżowaniami
+        existing = self.graph.get_edge_data(u, v)
+        if existing is None or existing["weight"] > costs[-1]:
+            self.graph.add_edge(u, v, weight=costs[-1], head=u, path=nodes)
+
+    def _compact(self, G):
+        for node in G.nodes():
+            if G.degree(node) != 2:
+                self.graph.add_node(node)
+
+        visited = set()
+        for junction in list(self.graph.nodes()):
+            for neighbor in G[junction]:
+                if frozenset((junction, neighbor)) not in visited:
+                    self._add_chain(*self._walk(G, junction, neighbor, visited))
+
+        # Składowe będące samymi cyklami — dowolny węzeł staje się skrzyżowaniem
+        for u, v in G.edges():
+            if frozenset((u, v)) not in visited:
+                self.graph.add_node(u)
+                self.chain_of.pop(u, None)
+                self._add_chain(*self._walk(G, u, v, visited))
+
+    # --- Zapytania ---------------------------------------------------------------------------
+
+    def _attach(self, node, tag, extra):
+        """
+        Zwraca węzeł zwiniętego grafu dla węzła pierwotnego; węzeł wewnątrz
+        łańcucha jest zastępowany węzłem tymczasowym `tag` z krawędziami do
+        końców łańcucha (dopisywanymi do listy extra).
+        """
+        if node in self.graph:
+            return node
+        if node not in self.chain_of:
+            raise nx.NodeNotFound(f"Węzeł {node} nie należy do grafu")
+        chain_id, pos = self.chain_of[node]
+        nodes, costs = self.chains[chain_id]
+        extra.append((tag, nodes[0], costs[pos], nodes[pos::-1]))
+        extra.append((tag, nodes[-1], costs[-1] - costs[pos], nodes[pos:]))
+        return tag
+
+    def _coords(self, node, virtual):
+        return virtual.get(node, node)
+
+    def shortest_path(self, source, target):
+        """
+        Zwraca listę węzłów najkrótszej trasy w pierwotnym grafie.
+        Rzuca nx.NetworkXNoPath, gdy trasy brak.
+        """
+        if source == target:
+            return [source]
+
+        extra = []
+        s = self._attach(source, ("source",), extra)
+        t = self._attach(target, ("target",), extra)
+        virtual = {("source",): source, ("target",): target}
+
+        # Oba końce w tym samym łańcuchu — dodatkowo bezpośredni przejazd wzdłuż niego
+        if s != source and t != target and self.chain_of[source][0] == self.chain_of[target][0]:
+            chain_id, ps = self.chain_of[source]
+            pt = self.chain_of[target][1]
+            nodes, costs = self.chains[chain_id]
+            path = nodes[ps:pt + 1] if ps <= pt else nodes[pt:ps + 1][::-1]
+            extra.append((s, t, abs(costs[pt] - costs[ps]), path))
+
+        adjacency = {}
+        for a, b, cost, path in extra:
+            adjacency.setdefault(a, []).append((b, cost, a, path))
+            adjacency.setdefault(b, []).append((a, cost, a, path))
+
+        tx, ty = self._coords(t, virtual)
+
+        def h(node):
+            if not self.heuristic:
+                return 0.0
+            x, y = self._coords(node, virtual)
+            if self.heuristic == "geodesic":
+                return HEURISTIC_MARGIN * haversine((x, y), (tx, ty))
+            if self.heuristic == "metric":
+                return HEURISTIC_MARGIN * hypot(x - tx, y - ty)
+            return hypot(x - tx, y - ty)
+
+        counter = itertools.count()
+        heap = [(h(s), next(counter), 0.0, s)]
+        best = {s: 0.0}
+        parent = {s: None}
+        closed = set()
+        while heap:
+            _, _, cost, u = heapq.heappop(heap)
+            if u == t:
+                break
+            if u in closed:
+                continue
+            closed.add(u)
+            neighbors = [(v, d["weight"], d["head"], d["path"]) for v, d in self.graph[u].items()] \
+                if u in self.graph else []
+            for v, w, head, path in itertools.chain(neighbors, adjacency.get(u, ())):
+                nc = cost + w
+                if nc < best.get(v, float('inf')):
+                    best[v] = nc
+                    parent[v] = (u, head, path)
+                    heapq.heappush(heap, (nc + h(v), next(counter), nc, v))
+        else:
+            raise nx.NetworkXNoPath(f"Brak trasy z {source} do {target}")
+
+        # Odtwarzanie trasy w pierwotnym grafie
+        pieces = []
+        node = t
+        while parent[node] is not None:
+            u, head, path = parent[node]
+            pieces.append(path if head == u else path[::-1])
+            node = u
+        result = [source]
+        for path in reversed(pieces):
+            result.extend(path[1:])
+        return result
+
+
+def graph_fingerprint(G, weight="weight"):
+    """
+    Skrót zawartości grafu (krawędzie z wagami) — klucz cache na dysku.
+    """
+    if isinstance(G, CSRGraph):
+        data = np.column_stack((G.coords[G.edge_u], G.coords[G.edge_v], G.edge_attrs[weight]))
+        return hashlib.sha1(data.tobytes()).hexdigest()
+    data = np.array([(*u, *v, d.get(weight, 1.0)) for u, v, d in G.edges(data=True)], dtype=float)
+    return hashlib.sha1(data.tobytes()).hexdigest()
+
+
+def get_router(G, weight="weight", heuristic=None, use_cache=True):
+    """
+    Zwraca CompactRouter dla grafu: z G.graph, z cache na dysku (po skrócie
+    zawartości grafu) albo budując go i zapisując do obu. Dla CSRGraph router
+    działa na jego kopii networkx, więc przyjmuje i zwraca węzły (x, y)
+    (CSRGraph.node_key / node_id). Bez heuristic — rodzaj heurystyki zapisany
+    w G.graph["heuristic"] przez budującego graf, domyślnie True.
+    """
+    if heuristic is None:
+        heuristic = G.graph.get("heuristic", True)
+    key = ("_router", weight, heuristic)
+    router = G.graph.get(key)
+    if router is not None:
+        return router
+
+    cache_key = None
+    if use_cache:
+        cache_key = osm_cache.make_key("compact_router", [], {
+            "graph": graph_fingerprint(G, weight), "weight": weight, "heuristic": heuristic
+        })
+        router = osm_cache.get_cache().get(cache_key)
+
+    if router is None:
+        source = G.to_networkx() if isinstance(G, CSRGraph) else G
+        router = CompactRouter(source, weight=weight, heuristic=heuristic)
+        if use_cache:
+            osm_cache.get_cache().put(cache_key, router)
+
+    G.graph[key] = router
+    return router
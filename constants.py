@@ -0,0 +1,26 @@
+# constants.py
+# Stałe bez ciężkich zależności — importowane przy starcie wtyczki (menu, algorytmy Processing)
+
+# Typy dróg i kolory
+road_styles = {
+    'motorway': '255,0,0',
+    'primary': '255,128,0',
+    'secondary': '255,200,0',
+    'tertiary': '255,0,255',
+    'residential': '200,200,200',
+    'track': '0,255,0',
+    'path': '0,128,255',
+    'service': '160,160,160',
+    'unclassified': '100,100,100',
+    'footway': '100,100,255'
+}
+
+# Warstwy środowiskowe: klucz warstwy -> (tag OSM, preferencja w UI, typ geometrii warstwy)
+habitat_layers = {
+    'landuse_forest': (('landuse', 'forest'), 'forest', 'Polygon'),
+    'natural_water': (('natural', 'water'), 'water', 'Polygon'),
+    'natural_cave_entrance': (('natural', 'cave_entrance'), 'cave', 'Point'),
+}
+
+# Domyślny czas optymalizacji kolejności transektów
+DEFAULT_TIME_BUDGET = 2.0  # sekundy
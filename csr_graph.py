@@ -0,0 +1,267 @@
+# csr_graph.py
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+
+def range_indices(starts, counts):
+    """
+    Indeksy elementów z kolejnych zakresów [start, start + count) sklejone w jedną tablicę.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+    within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + within
+
+
+class CSRGraph:
+    """
+    Nieskierowany graf dróg w tablicach NumPy.
+
+    Węzły to liczby 0..n-1 ze współrzędnymi w coords. Sąsiedztwo jest
+    w formacie CSR: sąsiedzi węzła i to indices[indptr[i]:indptr[i + 1]],
+    a edge_of podaje numer krawędzi każdego wpisu. Atrybuty krawędzi
+    (weight, length, ...) to tablice w edge_attrs. Geometrie krawędzi leżą
+    w jednej płaskiej tablicy edge_coords: krawędź e to wiersze
+    edge_offsets[e]:edge_offsets[e + 1], od węzła edge_u[e] do edge_v[e].
+    Bez edge_coords krawędź jest odcinkiem prostym między węzłami — tak jest
+    w grafie odcinków, który nie trzyma współrzędnych poza węzłami.
+
+    Pętle są pomijane, a z równoległych krawędzi zostaje ta o najmniejszym
+    atrybucie weight. Słownik graph (jak G.graph w networkx) przechowuje
+    struktury pochodne, np. indeks przestrzenny albo CompactRouter.
+    """
+
+    def __init__(self, coords, edge_u, edge_v, edge_attrs=None, weight="weight", edge_coords=None,
+                 edge_offsets=None):
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        edge_u = np.asarray(edge_u, dtype=np.int64)
+        edge_v = np.asarray(edge_v, dtype=np.int64)
+        edge_attrs = {name: np.asarray(values, dtype=float) for name, values in (edge_attrs or {}).items()}
+
+        # Bez pętli; z równoległych krawędzi najtańsza (kolejność krawędzi zachowana)
+        lo, hi = np.minimum(edge_u, edge_v), np.maximum(edge_u, edge_v)
+        cost = edge_attrs.get(weight, np.zeros(len(edge_u)))
+        order = np.lexsort((cost, hi, lo))
+        order = order[lo[order] != hi[order]]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (lo[order][1:] != lo[order][:-1]) | (hi[order][1:] != hi[order][:-1])
+        keep = np.sort(order[first])
+
+        self.coords = coords
+        self.edge_u = edge_u[keep].astype(np.int32)
+        self.edge_v = edge_v[keep].astype(np.int32)
+        self.edge_attrs = {name: values[keep] for name, values in edge_attrs.items()}
+        self.weight = weight
+
+        self.edge_coords = None
+        self.edge_offsets = None
+        if edge_coords is not None:
+            edge_offsets = np.asarray(edge_offsets, dtype=np.int64)
+            counts = np.diff(edge_offsets)[keep]
+            self.edge_coords = np.asarray(edge_coords, dtype=float).reshape(-1, 2)[
+                range_indices(edge_offsets[keep], counts)]
+            self.edge_offsets = np.concatenate(([0], np.cumsum(counts)))
+
+        self._build_adjacency()
+        self.graph = {}
+        self._node_ids = None
+
+    def _build_adjacency(self):
+        n, m = len(self.coords), len(self.edge_u)
+        ends = np.concatenate((self.edge_u, self.edge_v))
+        order = np.argsort(ends, kind="stable")
+        self.indices = np.concatenate((self.edge_v, self.edge_u))[order]
+        self.edge_of = np.concatenate((np.arange(m), np.arange(m)))[order].astype(np.int32)
+        self.indptr = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(np.bincount(ends, minlength=n), out=self.indptr[1:])
+
+    @classmethod
+    def from_networkx(cls, G, weight="weight", attrs=("length",)):
+        """
+        Zamienia graf networkx o węzłach (x, y) na CSRGraph. Węzły dostają
+        numery w kolejności G.nodes(); geometrie krawędzi (atrybut geometry)
+        trafiają do płaskiej tablicy, zorientowane od pierwszego końca.
+        """
+        nodes = list(G.nodes())
+        index = {node: i for i, node in enumerate(nodes)}
+        names = [weight] + [name for name in attrs if name != weight]
+        edge_u, edge_v, geoms = [], [], []
+        values = {name: [] for name in names}
+        for u, v, data in G.edges(data=True):
+            edge_u.append(index[u])
+            edge_v.append(index[v])
+            geoms.append(data.get("geometry"))
+            for name in names:
+                values[name].append(data.get(name, 1.0 if name == weight else 0.0))
+
+        edge_coords = edge_offsets = None
+        if any(geom is not None for geom in geoms):
+            parts = []
+            for u, v, geom in zip(edge_u, edge_v, geoms):
+                part = np.asarray(geom.coords)[:, :2] if geom is not None else np.array([nodes[u], nodes[v]])
+                if tuple(part[0]) != tuple(nodes[u]):
+                    part = part[::-1]  # orientacja od edge_u
+                parts.append(part)
+            edge_offsets = np.concatenate(([0], np.cumsum([len(part) for part in parts])))
+            edge_coords = np.concatenate(parts) if parts else np.zeros((0, 2))
+        return cls(np.array(nodes, dtype=float), edge_u, edge_v, values, weight=weight,
+                   edge_coords=edge_coords, edge_offsets=edge_offsets)
+
+    def to_networkx(self):
+        """
+        Graf networkx o węzłach (x, y) z atrybutami i geometrią krawędzi — dla
+        narzędzi, które go wymagają (CompactRouter, snap_to_edge).
+        """
+        import networkx as nx
+        from shapely.geometry import LineString
+
+        G = nx.Graph()
+        keys = [tuple(xy) for xy in self.coords.tolist()]
+        G.add_nodes_from(keys)
+        attrs = {name: values.tolist() for name, values in self.edge_attrs.items()}
+        for e, (u, v) in enumerate(zip(self.edge_u.tolist(), self.edge_v.tolist())):
+            data = {name: values[e] for name, values in attrs.items()}
+            G.add_edge(keys[u], keys[v], geometry=LineString(self.edge_line(e)), **data)
+        return G
+
+    # --- Dostęp ------------------------------------------------------------------------------
+
+    def number_of_nodes(self):
+        return len(self.coords)
+
+    def number_of_edges(self):
+        return len(self.edge_u)
+
+    @property
+    def nbytes(self):
+        """
+        Rozmiar tablic grafu w bajtach (bez słownika graph).
+        """
+        arrays = [self.coords, self.edge_u, self.edge_v, self.indices, self.edge_of, self.indptr,
+                  *self.edge_attrs.values()]
+        if self.edge_coords is not None:
+            arrays += [self.edge_coords, self.edge_offsets]
+        return sum(a.nbytes for a in arrays)
+
+    def node_key(self, node):
+        """
+        Współrzędne węzła jako krotka (x, y).
+        """
+        return tuple(self.coords[node].tolist())
+
+    def node_id(self, key):
+        """
+        Numer węzła o współrzędnych key albo None.
+        """
+        if self._node_ids is None:
+            self._node_ids = {xy: i for i, xy in enumerate(map(tuple, self.coords.tolist()))}
+        return self._node_ids.get(tuple(key))
+
+    def neighbors(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def find_edge(self, u, v):
+        """
+        Numer krawędzi między węzłami u i v albo None.
+        """
+        start = self.indptr[u]
+        hits = np.flatnonzero(self.indices[start:self.indptr[u + 1]] == v)
+        return int(self.edge_of[start + hits[0]]) if len(hits) else None
+
+    def edge_line(self, edge, reverse=False):
+        """
+        Współrzędne krawędzi (tablica k × 2) od edge_u do edge_v albo odwrotnie.
+        """
+        if self.edge_coords is None:
+            coords = self.coords[[self.edge_u[edge], self.edge_v[edge]]]
+        else:
+            coords = self.edge_coords[self.edge_offsets[edge]:self.edge_offsets[edge + 1]]
+        return coords[::-1] if reverse else coords
+
+    def matrix(self, attr=None):
+        """
+        Macierz sąsiedztwa scipy (CSR, obie strony każdej krawędzi) z atrybutem
+        attr (domyślnie weight) jako wagą. Jawne zera nie są w csgraph
+        krawędziami, więc wagi są podnoszone do minimalnej dodatniej.
+        """
+        attr = attr or self.weight
+        key = ("_matrix", attr)
+        if key not in self.graph:
+            data = np.maximum(self.edge_attrs[attr][self.edge_of], 1e-12)
+            n = self.number_of_nodes()
+            self.graph[key] = csr_matrix((data, self.indices, self.indptr), shape=(n, n))
+        return self.graph[key]
+
+    # --- Zmiany ------------------------------------------------------------------------------
+
+    def split_edge(self, edge, fraction, point, first_coords=None, second_coords=None):
+        """
+        Dzieli krawędź edge nowym węzłem o współrzędnych point, leżącym w części
+        fraction krawędzi licząc od edge_u: krawędź edge zostaje skrócona do
+        (edge_u, nowy węzeł), a (nowy węzeł, edge_v) jest dopisywana jako
+        ostatnia. Atrybuty weight i length są rozdzielane proporcjonalnie do
+        fraction, pozostałe kopiowane — jak przy podziale krawędzi networkx
+        w GraphIndex.snap_to_edge. first_coords / second_coords to geometrie
+        obu części (potrzebne, gdy graf ma edge_coords).
+
+        Macierze i CompactRouter zapisane w graph są usuwane (zbudują się od
+        nowa z nowym węzłem); pozostałe wpisy, np. indeks przestrzenny, zostają.
+        Zwraca numer nowego węzła.
+        """
+        node = len(self.coords)
+        v = self.edge_v[edge]
+        self.coords = np.vstack((self.coords, np.asarray(point, dtype=float).reshape(1, 2)))
+        self.edge_v = np.append(self.edge_v, v).astype(np.int32)
+        self.edge_v[edge] = node
+        self.edge_u = np.append(self.edge_u, node).astype(np.int32)
+        for name, values in self.edge_attrs.items():
+            second = values[edge]
+            if name in (self.weight, "length"):
+                second = values[edge] * (1 - fraction)
+                values[edge] *= fraction
+            self.edge_attrs[name] = np.append(values, second)
+
+        if self.edge_coords is not None:
+            start, end = self.edge_offsets[edge], self.edge_offsets[edge + 1]
+            first = np.asarray(first_coords, dtype=float).reshape(-1, 2)
+            second = np.asarray(second_coords, dtype=float).reshape(-1, 2)
+            counts = np.diff(self.edge_offsets)
+            counts[edge] = len(first)
+            self.edge_coords = np.concatenate((self.edge_coords[:start], first, self.edge_coords[end:], second))
+            self.edge_offsets = np.concatenate(([0], np.cumsum(np.append(counts, len(second)))))
+
+        self._build_adjacency()
+        self._node_ids = None
+        for key in [key for key in self.graph if isinstance(key, tuple) and key[0] in ("_matrix", "_router")]:
+            del self.graph[key]
+        return node
+
+    # --- Trasy -------------------------------------------------------------------------------
+
+    def path_geometries(self, nodes):
+        """
+        Geometrie (LineString) kolejnych krawędzi trasy po węzłach nodes,
+        zorientowane zgodnie z kierunkiem przejazdu.
+        """
+        from shapely.geometry import LineString
+
+        geometries = []
+        for u, v in zip(nodes, nodes[1:]):
+            edge = self.find_edge(u, v)
+            if edge is not None:
+                geometries.append(LineString(self.edge_line(edge, reverse=self.edge_u[edge] != u)))
+        return geometries
+
+    def shortest_path(self, source, target, attr=None):
+        """
+        Lista węzłów najkrótszej trasy source → target (Dijkstra scipy) albo None, gdy trasy brak.
+        """
+        _, pred = dijkstra(self.matrix(attr), directed=True, indices=source, return_predecessors=True)
+        nodes = [target]
+        while nodes[-1] != source:
+            previous = pred[nodes[-1]]
+            if previous < 0:
+                return None
+            nodes.append(int(previous))
+        return nodes[::-1]
@@ -0,0 +1,89 @@
+# dependencies.py
+import importlib.util
+import re
+from importlib import metadata
+
+from . import log
+
+
+# Moduł -> (pakiet pip, minimalna wersja albo None)
+REQUIRED = {
+    "numpy": ("numpy", None),
+    "scipy": ("scipy", None),
+    "pandas": ("pandas", None),
+    "shapely": ("shapely", "2.0"),
+    "pyproj": ("pyproj", None),
+    "geopandas": ("geopandas", None),
+    "networkx": ("networkx", None),
+    "osmnx": ("osmnx", None),
+    "requests": ("requests", None),
+}
+
+# Opcjonalne: moduł -> do czego jest potrzebny
+OPTIONAL = {
+    "pyrosm": "odczyt plików .osm.pbf",
+    "pyinstrument": "profilowanie (BAT_TRANSECTS_PROFILE=pyinstrument)",
+}
+
+_problems = None
+
+
+def _version_tuple(version):
+    return tuple(int(part) for part in re.findall(r"\d+", version)[:3])
+
+
+def find_problems():
+    """
+    Zwraca listę problemów z wymaganymi pakietami (brak albo za stara wersja).
+    Sprawdza tylko find_spec i metadane pakietów — niczego nie importuje,
+    więc jest tanie także przy starcie QGIS. Wynik jest zapamiętywany.
+    """
+    global _problems
+    if _problems is None:
+        problems = []
+        for module, (package, min_version) in REQUIRED.items():
+            if importlib.util.find_spec(module) is None:
+                problems.append((package, "brak pakietu"))
+                continue
+            if min_version is None:
+                continue
+            try:
+                version = metadata.version(package)
+            except metadata.PackageNotFoundError:
+                continue
+            if _version_tuple(version) < _version_tuple(min_version):
+                problems.append((package, f"wersja {version}, wymagana ≥ {min_version}"))
+        for module, purpose in OPTIONAL.items():
+            if importlib.util.find_spec(module) is None:
+                log.debug(f"Brak opcjonalnego pakietu {module} — potrzebny do: {purpose}")
+        _problems = problems
+    return _problems
+
+
+def problems_message():
+    """
+    Komunikat o problemach z zależnościami (z poleceniem instalacji) albo None, gdy wszystko jest.
+    """
+    problems = find_problems()
+    if not problems:
+        return None
+    details = ", ".join(f"{package} ({problem})" for package, problem in problems)
+    command = "python3 -m pip install --upgrade " + " ".join(package for package, _ in problems)
+    return f"Brakujące lub nieaktualne zależności: {details}. Zainstaluj je w Pythonie QGIS: {command}"
+
+
+def check(iface=None):
+    """
+    True, gdy wymagane pakiety są dostępne. W przeciwnym razie zapisuje
+    komunikat w logu (i na pasku komunikatów QGIS, gdy podano iface)
+    i zwraca False.
+    """
+    message = problems_message()
+    if message is None:
+        return True
+
+    log.error(message)
+    if iface is not None:
+        from qgis.core import Qgis
+        iface.messageBar().pushMessage("Bat Transects", message, level=Qgis.Critical)
+    return False
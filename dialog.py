@@ -34,6 +34,10 @@ class Ui_BatTransectsDialog(object):
         self.bufferLineEdit = QtWidgets.QLineEdit(self.basicTab)
         self.bufferLineEdit.setObjectName("bufferLineEdit")
         self.basicLayout.addWidget(self.bufferLineEdit)
+        self.checkStudyArea = QtWidgets.QCheckBox(self.basicTab)
+        self.checkStudyArea.setChecked(True)
+        self.checkStudyArea.setObjectName("checkStudyArea")
+        self.basicLayout.addWidget(self.checkStudyArea)
         self.generateButton = QtWidgets.QPushButton(self.basicTab)
         self.generateButton.setObjectName("generateButton")
         self.basicLayout.addWidget(self.generateButton)
@@ -107,6 +111,18 @@ class Ui_BatTransectsDialog(object):
         self.lineEditMaxDistance = QtWidgets.QLineEdit(self.advancedTab)
         self.lineEditMaxDistance.setObjectName("lineEditMaxDistance")
         self.advancedLayout.addWidget(self.lineEditMaxDistance)
+        self.labelDataSource = QtWidgets.QLabel(self.advancedTab)
+        self.labelDataSource.setObjectName("labelDataSource")
+        self.advancedLayout.addWidget(self.labelDataSource)
+        self.lineEditDataSource = QtWidgets.QLineEdit(self.advancedTab)
+        self.lineEditDataSource.setObjectName("lineEditDataSource")
+        self.advancedLayout.addWidget(self.lineEditDataSource)
+        self.labelOutput = QtWidgets.QLabel(self.advancedTab)
+        self.labelOutput.setObjectName("labelOutput")
+        self.advancedLayout.addWidget(self.labelOutput)
+        self.lineEditOutput = QtWidgets.QLineEdit(self.advancedTab)
+        self.lineEditOutput.setObjectName("lineEditOutput")
+        self.advancedLayout.addWidget(self.lineEditOutput)
         self.tabWidget.addTab(self.advancedTab, "")
         self.mainLayout.addWidget(self.tabWidget)
 
@@ -119,6 +135,7 @@ class Ui_BatTransectsDialog(object):
         BatTransectsDialog.setWindowTitle(_translate("BatTransectsDialog", "Bat Transects"))
         self.labelLayer.setText(_translate("BatTransectsDialog", "Wybierz warstwę punktową:"))
         self.labelBuffer.setText(_translate("BatTransectsDialog", "Promień bufora (m):"))
+        self.checkStudyArea.setText(_translate("BatTransectsDialog", "Pobierz dane OSM jednorazowo dla całego obszaru"))
         self.generateButton.setText(_translate("BatTransectsDialog", "Generuj transekty"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.basicTab), _translate("BatTransectsDialog", "Basic"))
         self.groupExcludeRoads.setTitle(_translate("BatTransectsDialog", "Wyklucz typy dróg"))
@@ -139,4 +156,6 @@ class Ui_BatTransectsDialog(object):
         self.checkAbandoned.setText(_translate("BatTransectsDialog", "Pustostany"))
         self.labelDistance.setText(_translate("BatTransectsDialog", "Maksymalna odległość (m):"))
         self.lineEditMaxDistance.setText(_translate("BatTransectsDialog", "100"))
+        self.labelDataSource.setText(_translate("BatTransectsDialog", "Lokalny plik danych OSM (.osm, .osm.pbf, .gpkg) albo adres serwera Overpass – puste = publiczny Overpass:"))
+        self.labelOutput.setText(_translate("BatTransectsDialog", "Zapisz wyniki do GeoPackage (.gpkg) – puste = warstwy tymczasowe:"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.advancedTab), _translate("BatTransectsDialog", "Advanced"))
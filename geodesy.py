@@ -0,0 +1,94 @@
+# geodesy.py
+from math import radians, cos, sin, asin, sqrt
+
+import numpy as np
+import pyproj
+import shapely
+
+
+EARTH_RADIUS = 6371000
+WGS84 = "EPSG:4326"
+
+
+def haversine(p1, p2):
+    """
+    Odległość (m) po kuli między punktami (lon, lat).
+    """
+    lon1, lat1 = p1
+    lon2, lat2 = p2
+    dlon = radians(lon2 - lon1)
+    dlat = radians(lat2 - lat1)
+    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
+    return EARTH_RADIUS * 2 * asin(sqrt(a))
+
+
+def as_pyproj_crs(crs=None):
+    """
+    Układ pyproj z QgsCoordinateReferenceSystem, kodu ("EPSG:2180"), WKT albo
+    pyproj.CRS. Bez układu (albo z nieprawidłowym) — WGS84.
+    """
+    if crs is None:
+        return pyproj.CRS.from_user_input(WGS84)
+    if hasattr(crs, "toWkt"):  # QgsCoordinateReferenceSystem
+        if not crs.isValid():
+            return pyproj.CRS.from_user_input(WGS84)
+        crs = crs.authid() or crs.toWkt()
+    return pyproj.CRS.from_user_input(crs)
+
+
+def _geodetic(coords, crs):
+    """
+    Elipsoida układu crs i współrzędne coords (n × 2, x/y jak w QGIS)
+    przeliczone na długość i szerokość geograficzną tego układu.
+    """
+    crs = as_pyproj_crs(crs)
+    geod = crs.get_geod() or pyproj.Geod(ellps="WGS84")
+    if crs.is_geographic:
+        return geod, coords[:, 0], coords[:, 1]
+    # Transformer nie jest bezpieczny dla wątków — osobny na każde wywołanie
+    transformer = pyproj.Transformer.from_crs(crs, crs.geodetic_crs, always_xy=True)
+    lon, lat = transformer.transform(coords[:, 0], coords[:, 1])
+    return geod, np.asarray(lon), np.asarray(lat)
+
+
+def pair_lengths(a, b, crs=None):
+    """
+    Długości geodezyjne (m) między odpowiadającymi sobie punktami tablic
+    a i b (n × 2, w układzie crs) — jedno wywołanie pyproj.Geod dla wszystkich par.
+    """
+    a = np.asarray(a, dtype=float).reshape(-1, 2)
+    b = np.asarray(b, dtype=float).reshape(-1, 2)
+    if len(a) == 0:
+        return np.zeros(0)
+    geod, lon, lat = _geodetic(np.concatenate((a, b)), crs)
+    n = len(a)
+    _, _, dist = geod.inv(lon[:n], lat[:n], lon[n:], lat[n:])
+    return np.asarray(dist, dtype=float)
+
+
+def part_lengths(coords, coord_part, crs=None, minlength=0):
+    """
+    Długości geodezyjne (m) linii podanych jako wierzchołki coords z numerami
+    linii coord_part (jak z shapely.get_coordinates(..., return_index=True)).
+    Zwraca tablicę indeksowaną numerem linii.
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    coord_part = np.asarray(coord_part, dtype=np.int64)
+    if len(coords) < 2:
+        return np.zeros(max(minlength, coord_part.max() + 1 if len(coord_part) else 0))
+    same_part = coord_part[1:] == coord_part[:-1]
+    segments = np.zeros(len(coords) - 1)
+    segments[same_part] = pair_lengths(coords[:-1][same_part], coords[1:][same_part], crs)
+    return np.bincount(coord_part[:-1], weights=segments, minlength=max(minlength, coord_part.max() + 1))
+
+
+def line_lengths(geometries, crs=None):
+    """
+    Długości geodezyjne (m) geometrii liniowych Shapely w układzie crs; dla
+    geometrii wieloczęściowych — suma części.
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    parts, part_geometry = shapely.get_parts(geometries, return_index=True)
+    coords, coord_part = shapely.get_coordinates(parts, return_index=True)
+    lengths = part_lengths(coords, coord_part, crs, minlength=len(parts))
+    return np.bincount(part_geometry, weights=lengths[:len(parts)], minlength=len(geometries))
@@ -0,0 +1,57 @@
+# geometry_convert.py
+import numpy as np
+import shapely
+from qgis.core import QgsGeometry, QgsFeature
+
+
+def to_qgs_geometries(geoms):
+    """
+    Konwertuje tablicę / GeoSeries geometrii Shapely na listę QgsGeometry.
+    Serializacja do WKB odbywa się jednym wywołaniem shapely.to_wkb.
+    """
+    result = []
+    for wkb in shapely.to_wkb(np.asarray(geoms, dtype=object)):
+        geom = QgsGeometry()
+        geom.fromWkb(wkb)
+        result.append(geom)
+    return result
+
+
+def to_qgs_geometry(geom):
+    """
+    Konwertuje pojedynczą geometrię Shapely na QgsGeometry (przez WKB).
+    """
+    qgs_geom = QgsGeometry()
+    qgs_geom.fromWkb(shapely.to_wkb(geom))
+    return qgs_geom
+
+
+def to_qgs_features(geoms, columns):
+    """
+    Buduje listę QgsFeature z geometrii Shapely i kolumn atrybutów
+    (sekwencji w kolejności pól warstwy) w jednym przebiegu, bez iterrows.
+    Wynik nadaje się do pojedynczego wywołania provider.addFeatures().
+    """
+    columns = [list(col) for col in columns]
+    features = []
+    for geom, attrs in zip(to_qgs_geometries(geoms), zip(*columns)):
+        feat = QgsFeature()
+        feat.setGeometry(geom)
+        feat.setAttributes(list(attrs))
+        features.append(feat)
+    return features
+
+
+def from_qgs_geometries(qgs_geoms):
+    """
+    Konwertuje geometrie QGIS (np. z layer.getFeatures()) na tablicę geometrii
+    Shapely; parsowanie WKB odbywa się jednym wywołaniem shapely.from_wkb.
+    """
+    return shapely.from_wkb([bytes(g.asWkb()) for g in qgs_geoms])
+
+
+def from_qgs_geometry(qgs_geom):
+    """
+    Konwertuje pojedynczą QgsGeometry na geometrię Shapely (przez WKB).
+    """
+    return shapely.from_wkb(bytes(qgs_geom.asWkb()))
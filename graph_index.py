@@ -0,0 +1,200 @@
+# graph_index.py
+from math import radians, cos, hypot
+
+import numpy as np
+import shapely
+from scipy.spatial import cKDTree
+from shapely.geometry import LineString, Point
+from shapely.ops import substring
+
+from .csr_graph import CSRGraph
+from .geodesy import EARTH_RADIUS, haversine
+
+
+def _xy(point):
+    """
+    Zwraca współrzędne (x, y) z QgsPointXY albo krotki.
+    """
+    if hasattr(point, "x") and callable(point.x):
+        return point.x(), point.y()
+    return point[0], point[1]
+
+
+class GraphIndex:
+    """
+    Indeks przestrzenny węzłów (i krawędzi) grafu dróg: networkx z węzłami-
+    krotkami (x, y) albo CSRGraph (węzły to numery, współrzędne w coords).
+
+    geographic mówi, czy współrzędne to (lon, lat); bez podania jest brane
+    z G.graph["geographic"] (zapisywanego przez road_graph wg układu warstwy),
+    a gdy go brak — True. Węzły geograficzne są rzutowane do lokalnego układu
+    równoodległościowego (metry), a odległość zwracanych kandydatów jest na
+    koniec liczona dokładnie (haversine). Węzły w układzie odwzorowanym trafiają
+    do indeksu bez zmian, a odległości są euklidesowe w jednostkach układu
+    (w metrach dla układów metrycznych). Zapytania o najbliższy węzeł / k
+    najbliższych węzłów kosztują O(log n) dzięki drzewu KD.
+
+    snap_to_edge przyciąga punkt do najbliższego punktu na krawędzi, dzieląc ją
+    nowym węzłem (w CSRGraph przez split_edge); indeks krawędzi (STRtree)
+    budowany jest przy pierwszym użyciu.
+    """
+
+    def __init__(self, G, geographic=None):
+        self.G = G
+        self.geographic = G.graph.get("geographic", True) if geographic is None else geographic
+        if isinstance(G, CSRGraph):
+            self.nodes = range(G.number_of_nodes())
+            coords = G.coords
+        else:
+            self.nodes = list(G.nodes())
+            coords = np.array(self.nodes, dtype=float).reshape(-1, 2)
+        self.coords = coords
+        self.lat0 = radians(coords[:, 1].mean()) if len(coords) and self.geographic else 0.0
+        self.tree = cKDTree(self._project(coords)) if len(coords) else None
+
+        self._edges = None
+        self._edge_tree = None
+        self._splits = {}
+
+    def _project(self, coords):
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        if not self.geographic:
+            return coords
+        coords = np.radians(coords)
+        return np.column_stack((
+            coords[:, 0] * EARTH_RADIUS * cos(self.lat0),
+            coords[:, 1] * EARTH_RADIUS,
+        ))
+
+    def _distance(self, p1, p2):
+        if self.geographic:
+            return haversine(p1, p2)
+        return hypot(p2[0] - p1[0], p2[1] - p1[1])
+
+    # --- Węzły -------------------------------------------------------------------------------
+
+    def k_nearest_nodes(self, point, k=1, max_dist=None):
+        """
+        Zwraca do k najbliższych węzłów jako listę (węzeł, odległość — w metrach
+        albo w jednostkach układu odwzorowanego),
+        posortowaną rosnąco i ograniczoną do max_dist.
+        """
+        if self.tree is None:
+            return []
+        xy = _xy(point)
+        k = min(k, len(self.nodes))
+        _, idx = self.tree.query(self._project(xy)[0], k=k)
+        idx = np.atleast_1d(idx)
+
+        result = []
+        for i in idx:
+            node = self.nodes[i]
+            dist = self._distance(xy, self.coords[i])
+            if max_dist is None or dist <= max_dist:
+                result.append((node, dist))
+        result.sort(key=lambda item: item[1])
+        return result
+
+    def nearest_node(self, point, max_dist=None):
+        """
+        Zwraca najbliższy węzeł albo None, gdy jest dalej niż max_dist metrów.
+        """
+        found = self.k_nearest_nodes(point, k=1, max_dist=max_dist)
+        return found[0][0] if found else None
+
+    # --- Krawędzie ---------------------------------------------------------------------------
+
+    def _build_edge_tree(self):
+        self._edges = []
+        if isinstance(self.G, CSRGraph):
+            for e, (u, v) in enumerate(zip(self.G.edge_u.tolist(), self.G.edge_v.tolist())):
+                self._edges.append((u, v, LineString(self.G.edge_line(e))))
+        else:
+            for u, v, data in self.G.edges(data=True):
+                geom = data.get("geometry") or LineString([u, v])
+                if tuple(geom.coords[0][:2]) != tuple(u):
+                    u, v = v, u  # orientacja zgodna z geometrią
+                self._edges.append((u, v, geom))
+        self._edge_tree = shapely.STRtree(
+            [LineString(self._project(np.asarray(geom.coords)[:, :2])) for _, _, geom in self._edges])
+
+    def snap_to_edge(self, point, max_dist=None):
+        """
+        Przyciąga punkt do najbliższego punktu na krawędzi grafu. Krawędź jest
+        dzielona nowym węzłem (waga rozdzielana proporcjonalnie do długości),
+        który jest zwracany (dla CSRGraph — jego numer). Zwraca None, gdy
+        krawędź jest dalej niż max_dist.
+        """
+        if self._edge_tree is None:
+            self._build_edge_tree()
+        if not self._edges:
+            return None
+
+        xy = _xy(point)
+        p = Point(self._project(xy)[0])
+        edge_id = int(self._edge_tree.nearest(p))
+
+        # Krawędź mogła już zostać podzielona — wybierz najbliższy jej fragment
+        pieces = self._splits.get(edge_id, [self._edges[edge_id]])
+        piece_lines = [LineString(self._project(np.asarray(g.coords)[:, :2])) for _, _, g in pieces]
+        k = min(range(len(pieces)), key=lambda i: piece_lines[i].distance(p))
+        u, v, geom = pieces[k]
+        line = piece_lines[k]
+
+        fraction = line.project(p, normalized=True)
+        snapped = geom.interpolate(fraction, normalized=True)
+        new_node = (snapped.x, snapped.y)
+        if max_dist is not None and self._distance(xy, new_node) > max_dist:
+            return None
+
+        if fraction <= 0.0:
+            return u
+        if fraction >= 1.0:
+            return v
+        first = substring(geom, 0, fraction, normalized=True)
+        second = substring(geom, fraction, 1, normalized=True)
+
+        if isinstance(self.G, CSRGraph):
+            existing = self.G.node_id(new_node)
+            if existing is not None:
+                return existing
+            edge = self.G.find_edge(u, v)
+            first_coords, second_coords = np.asarray(first.coords)[:, :2], np.asarray(second.coords)[:, :2]
+            if self.G.edge_u[edge] == u:
+                new_node = self.G.split_edge(edge, fraction, new_node, first_coords, second_coords)
+            else:
+                # Krawędź CSRGraph zapisana od v — podział liczony od jej początku
+                new_node = self.G.split_edge(edge, 1 - fraction, new_node, second_coords[::-1], first_coords[::-1])
+            return self._add_split(edge_id, pieces, k, u, v, new_node, first, second)
+
+        if new_node in self.G:
+            return new_node
+        data = dict(self.G.get_edge_data(u, v) or {})
+        data.setdefault("weight", line.length)
+        first_data = dict(data, geometry=first)
+        second_data = dict(data, geometry=second)
+        for key in ("weight", "length"):
+            if key in data:
+                first_data[key] = data[key] * fraction
+                second_data[key] = data[key] * (1 - fraction)
+
+        self.G.remove_edge(u, v)
+        self.G.add_edge(u, new_node, **first_data)
+        self.G.add_edge(new_node, v, **second_data)
+        return self._add_split(edge_id, pieces, k, u, v, new_node, first, second)
+
+    def _add_split(self, edge_id, pieces, k, u, v, new_node, first, second):
+        # Fragment k krawędzi edge_id zastąpiony dwiema częściami — kolejne przyciągania widzą podział
+        self._splits[edge_id] = pieces[:k] + [(u, new_node, first), (new_node, v, second)] + pieces[k + 1:]
+        return new_node
+
+
+def get_graph_index(G):
+    """
+    Zwraca indeks grafu, budując go raz i przechowując w G.graph.
+    """
+    index = G.graph.get("_graph_index")
+    if index is None:
+        index = GraphIndex(G)
+        G.graph["_graph_index"] = index
+    return index
@@ -0,0 +1,184 @@
+# habitat_scoring.py
+import math
+
+import numpy as np
+import shapely
+from scipy import ndimage
+
+
+DEFAULT_CELL_SIZE = 5.0  # m
+# Górny limit komórek rastra (float32, ok. 16 MB) — dla dużych obszarów badań rośnie rozmiar komórki
+MAX_RASTER_CELLS = 4_000_000
+DEFAULT_SAMPLE_STEP = 10.0  # m
+
+
+class HabitatRaster:
+    """
+    Raster odległości (w metrach) od najbliższego obiektu warstwy siedlisk,
+    trzymany jako tablica NumPy w metrycznym układzie crs.
+
+    Obiekty są rasteryzowane (wnętrza poligonów oraz kontury i punkty, żeby
+    nie gubić obiektów węższych od komórki), a odległość liczy transformata
+    odległości euklidesowej (scipy.ndimage.distance_transform_edt). Raster
+    nie zależy od zasięgu max_distance, więc można go liczyć raz dla całego
+    obszaru badań i próbkować dowolnie wiele razy. Części obiektów spoza
+    rastra są pomijane — raster obejmuje krawędzie z marginesem co najmniej
+    max_distance, więc leżą one i tak poza zasięgiem score.
+    """
+
+    def __init__(self, geometries, bounds, crs, cell_size=DEFAULT_CELL_SIZE, max_cells=MAX_RASTER_CELLS):
+        minx, miny, maxx, maxy = bounds
+        width_m = max(maxx - minx, cell_size)
+        height_m = max(maxy - miny, cell_size)
+        cell_size = max(cell_size, math.sqrt(width_m * height_m / max_cells))
+
+        self.crs = crs
+        self.cell_size = cell_size
+        self.x0 = minx
+        self.y0 = miny
+        self.width = max(int(math.ceil(width_m / cell_size)), 1)
+        self.height = max(int(math.ceil(height_m / cell_size)), 1)
+
+        mask = self._rasterize(geometries)
+        if mask.any():
+            self.distance = ndimage.distance_transform_edt(~mask, sampling=cell_size).astype(np.float32)
+        else:
+            self.distance = np.full((self.height, self.width), np.inf, dtype=np.float32)
+
+    def _cells(self, x, y, clip=True):
+        """
+        Wiersze i kolumny komórek punktów x, y. Z clip=True punkty spoza rastra
+        dostają najbliższą komórkę brzegową (dla próbkowania), bez — indeksy
+        poza zakresem [0, height) × [0, width).
+        """
+        cols = np.floor((np.asarray(x) - self.x0) / self.cell_size).astype(np.int64)
+        rows = np.floor((np.asarray(y) - self.y0) / self.cell_size).astype(np.int64)
+        if clip:
+            cols = np.clip(cols, 0, self.width - 1)
+            rows = np.clip(rows, 0, self.height - 1)
+        return rows, cols
+
+    def _rasterize(self, geometries):
+        mask = np.zeros((self.height, self.width), dtype=bool)
+        for geom in geometries:
+            if geom is None or geom.is_empty:
+                continue
+            polygonal = geom.geom_type in ("Polygon", "MultiPolygon")
+
+            # Kontury i punkty — obiekty węższe od komórki też trafiają do rastra
+            outline = shapely.boundary(geom) if polygonal else geom
+            coords = shapely.get_coordinates(shapely.segmentize(outline, self.cell_size / 2))
+            if len(coords):
+                # Wierzchołki spoza rastra są pomijane — przycięte do brzegu udawałyby siedlisko na krawędzi
+                rows, cols = self._cells(coords[:, 0], coords[:, 1], clip=False)
+                inside = (rows >= 0) & (rows < self.height) & (cols >= 0) & (cols < self.width)
+                mask[rows[inside], cols[inside]] = True
+
+            if polygonal:
+                # Wnętrze: środki komórek z obwiedni obiektu
+                bx0, by0, bx1, by1 = geom.bounds
+                rows0, cols0 = self._cells(bx0, by0)
+                rows1, cols1 = self._cells(bx1, by1)
+                ys = self.y0 + (np.arange(rows0, rows1 + 1) + 0.5) * self.cell_size
+                xs = self.x0 + (np.arange(cols0, cols1 + 1) + 0.5) * self.cell_size
+                grid_x, grid_y = np.meshgrid(xs, ys)
+                inside = shapely.contains_xy(geom, grid_x, grid_y)
+                mask[rows0:rows1 + 1, cols0:cols1 + 1] |= inside
+        return mask
+
+    def sample(self, x, y):
+        """
+        Odległości (m) w punktach o współrzędnych x, y (w układzie rastra).
+        """
+        return self.distance[self._cells(x, y)].astype(float)
+
+
+def build_habitat_rasters(env_gdfs, gdf_edges, margin, cell_size=DEFAULT_CELL_SIZE):
+    """
+    Rastry odległości dla każdej warstwy siedlisk ({klucz: HabitatRaster}) w układzie UTM
+    krawędzi, obejmujące krawędzie z marginesem margin metrów.
+    """
+    if gdf_edges.empty:
+        return {}
+    metric_crs = gdf_edges.estimate_utm_crs()
+    minx, miny, maxx, maxy = gdf_edges.geometry.to_crs(metric_crs).total_bounds
+    bounds = (minx - margin, miny - margin, maxx + margin, maxy + margin)
+    return {
+        key: HabitatRaster(gdf.geometry.to_crs(metric_crs).values, bounds, metric_crs, cell_size)
+        for key, gdf in env_gdfs.items()
+    }
+
+
+def sample_points(edges_m, step=DEFAULT_SAMPLE_STEP):
+    """
+    Punkty próbkowania co ok. step metrów wzdłuż krawędzi: środki równych
+    odcinków, więc każda próbka reprezentuje taką samą część długości.
+    Interpolacja na współrzędnych wierzchołków w NumPy (bez wywołań GEOS na punkt).
+    Zwraca (indeks krawędzi próbki, x, y, liczba próbek każdej krawędzi).
+    """
+    coords, owner = shapely.get_coordinates(np.asarray(edges_m, dtype=object), return_index=True)
+    # Długości odcinków między kolejnymi wierzchołkami; "odcinki" między krawędziami mają długość 0
+    seg_len = np.hypot(*np.diff(coords, axis=0).T) * (owner[1:] == owner[:-1])
+    cum = np.concatenate([[0.0], np.cumsum(seg_len)])
+
+    lengths = np.bincount(owner[:-1], weights=seg_len, minlength=len(edges_m))
+    first = np.searchsorted(owner, np.arange(len(edges_m)))
+    counts = np.maximum(np.ceil(lengths / step).astype(np.int64), 1)
+
+    edge_idx = np.repeat(np.arange(len(edges_m)), counts)
+    within = np.arange(len(edge_idx)) - np.repeat(np.cumsum(counts) - counts, counts)
+    along = cum[first][edge_idx] + (within + 0.5) / counts[edge_idx] * lengths[edge_idx]
+
+    k = np.searchsorted(cum, along, side="right") - 1
+    k = np.clip(k, 0, len(coords) - 2) if len(coords) > 1 else np.zeros_like(k)
+    seg = seg_len[k] if len(seg_len) else np.zeros(len(k))
+    t = np.divide(along - cum[k], seg, out=np.zeros(len(k)), where=seg > 0)
+    start = coords[k]
+    end = coords[np.minimum(k + 1, len(coords) - 1)]
+    x = start[:, 0] + t * (end[:, 0] - start[:, 0])
+    y = start[:, 1] + t * (end[:, 1] - start[:, 1])
+    return edge_idx, x, y, counts
+
+
+def proximity_score(distances, max_distance):
+    """
+    Score jednej warstwy: 1 / (odległość + 1) w zasięgu max_distance, poza nim 0.
+    """
+    close = distances < max_distance
+    scores = np.zeros(len(distances))
+    scores[close] = 1 / (distances[close] + 1)  # im bliżej, tym wyższy score
+    return scores
+
+
+def exposure_score(sample_distances, edge_idx, counts, max_distance):
+    """
+    Średni score próbek każdej krawędzi — ekspozycja na siedlisko ważona długością.
+    """
+    total = np.bincount(edge_idx, weights=proximity_score(sample_distances, max_distance), minlength=len(counts))
+    return total / counts
+
+
+def score_edges(gdf_edges, env_gdfs, max_distance, step=DEFAULT_SAMPLE_STEP):
+    """
+    Liczy score bliskości siedlisk dla wszystkich krawędzi naraz.
+
+    Dla każdej warstwy środowiskowej budowany jest raster odległości
+    (HabitatRaster), próbkowany co step metrów wzdłuż każdej krawędzi.
+    Każda warstwa dodaje średnią z 1 / (odległość + 1) po próbkach
+    w zasięgu max_distance, więc krawędź biegnąca wzdłuż lasu dostaje
+    wyższy score niż krawędź, która dotyka go w jednym punkcie.
+
+    Zwraca tablicę NumPy o długości len(gdf_edges).
+    """
+    scores = np.zeros(len(gdf_edges))
+    if gdf_edges.empty or not env_gdfs:
+        return scores
+
+    rasters = build_habitat_rasters(env_gdfs, gdf_edges, max_distance)
+    metric_crs = next(iter(rasters.values())).crs
+    edge_idx, x, y, counts = sample_points(gdf_edges.geometry.to_crs(metric_crs).values, step)
+
+    for raster in rasters.values():
+        scores += exposure_score(raster.sample(x, y), edge_idx, counts, max_distance)
+
+    return scores
@@ -0,0 +1,248 @@
+# instrumentation.py
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from . import log
+
+
+DEFAULT_REPORT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "bat_transects", "reports")
+# Profiler włączany zmienną środowiskową: "cprofile" albo "pyinstrument"
+PROFILER_ENV = "BAT_TRANSECTS_PROFILE"
+# W procesie może działać tylko jeden profiler naraz (od Pythona 3.12 drugi
+# cProfile.enable() z innego wątku kończy się błędem), więc blok profilowany
+# równolegle z innym jest tylko mierzony
+_profile_lock = threading.Lock()
+
+
+class RunReport:
+    """
+    Pomiary jednego uruchomienia: czas etapów (łącznie i dla każdego bufora)
+    oraz liczniki (np. krawędzie, węzły, rozwinięte etykiety wyszukiwania).
+    Etapy mogą być mierzone równolegle z wielu wątków (zadania QgsTask).
+
+    Z profiler="cprofile" / "pyinstrument" profile() zapisuje profil bloku
+    kodu do katalogu raportu (.prof dla cProfile, .html dla pyinstrument).
+    Profilowany jest jeden blok naraz — bloki z innych wątków, które zaczną
+    się w tym czasie, są pomijane.
+    """
+
+    def __init__(self, name, profiler=None, report_dir=DEFAULT_REPORT_DIR):
+        self.name = name
+        self.profiler = profiler
+        self.report_dir = report_dir
+        self.started = time.time()
+        self.run_id = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started)) + f"-{name}"
+        self.duration = None
+
+        self.stages = {}
+        self.buffers = {}
+        self.counters = {}
+        self.profiles = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, buffer_id=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                stats = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0})
+                stats["calls"] += 1
+                stats["seconds"] += elapsed
+                stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+                if buffer_id is not None:
+                    per_buffer = self.buffers.setdefault(str(buffer_id), {})
+                    per_buffer[name] = per_buffer.get(name, 0.0) + elapsed
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def profile(self, name):
+        if self.profiler is None:
+            yield
+            return
+        if not _profile_lock.acquire(blocking=False):
+            log.debug(f"Profil {name} pominięty — trwa profilowanie innego bloku")
+            yield
+            return
+        try:
+            with self._profiled(name):
+                yield
+        finally:
+            _profile_lock.release()
+
+    @contextmanager
+    def _profiled(self, name):
+        if self.profiler == "cprofile":
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                path = self._profile_path(name, "prof")
+                profiler.dump_stats(path)
+                self._add_profile(path)
+        elif self.profiler == "pyinstrument":
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                path = self._profile_path(name, "html")
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(profiler.output_html())
+                self._add_profile(path)
+        else:
+            yield
+
+    def _profile_path(self, name, extension):
+        os.makedirs(self.report_dir, exist_ok=True)
+        return os.path.join(self.report_dir, f"{self.run_id}-{name}.{extension}")
+
+    def _add_profile(self, path):
+        with self._lock:
+            self.profiles.append(path)
+
+    def finish(self):
+        self.duration = time.time() - self.started
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                "duration": self.duration,
+                "profiler": self.profiler,
+                "stages": {k: dict(v) for k, v in self.stages.items()},
+                "buffers": {k: dict(v) for k, v in self.buffers.items()},
+                "counters": dict(self.counters),
+                "profiles": list(self.profiles),
+            }
+
+    def save(self):
+        """
+        Zapisuje raport JSON w katalogu raportów i zwraca ścieżkę pliku.
+        """
+        os.makedirs(self.report_dir, exist_ok=True)
+        path = os.path.join(self.report_dir, f"{self.run_id}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        return path
+
+    def summary(self):
+        """
+        Krótkie podsumowanie: etapy od najdłuższego i liczniki.
+        """
+        data = self.to_dict()
+        lines = [f"{self.name}: {data['duration'] or 0:.2f} s"]
+        for name, stats in sorted(data["stages"].items(), key=lambda item: -item[1]["seconds"]):
+            lines.append(f"  {name}: {stats['seconds']:.2f} s ({stats['calls']}×, max {stats['max_seconds']:.2f} s)")
+        for name, value in sorted(data["counters"].items()):
+            lines.append(f"  {name}: {value}")
+        return "\n".join(lines)
+
+
+_active = None
+_active_lock = threading.Lock()
+
+
+def start_run(name, profiler=None):
+    """
+    Rozpoczyna nowe uruchomienie; kolejne stage()/count() trafiają do jego raportu.
+    Bez podanego profilera używana jest wartość zmiennej BAT_TRANSECTS_PROFILE.
+    """
+    global _active
+    if profiler is None:
+        profiler = os.environ.get(PROFILER_ENV) or None
+    report = RunReport(name, profiler=profiler)
+    with _active_lock:
+        _active = report
+    return report
+
+
+def finish_run(report, log_summary=True):
+    """
+    Kończy uruchomienie: zapisuje raport JSON i (opcjonalnie) podsumowanie
+    w panelu logów QGIS. Zwraca ścieżkę raportu.
+    """
+    global _active
+    with _active_lock:
+        if _active is report:
+            _active = None
+    report.finish()
+    try:
+        path = report.save()
+    except OSError as e:
+        log.error(f"Nie udało się zapisać raportu → {e}")
+        path = None
+
+    if log_summary:
+        log.info(f"{report.summary()}\nRaport: {path}")
+    return path
+
+
+def active_report():
+    return _active
+
+
+def stage(name, buffer_id=None):
+    """
+    Mierzy czas bloku w aktywnym raporcie (bez aktywnego raportu nic nie robi).
+    """
+    report = _active
+    return report.stage(name, buffer_id) if report is not None else nullcontext()
+
+
+def count(name, value=1):
+    report = _active
+    if report is not None:
+        report.count(name, value)
+
+
+def profile(name):
+    report = _active
+    return report.profile(name) if report is not None else nullcontext()
+
+
+@contextmanager
+def run(name):
+    """
+    Mierzy samodzielną operację: gdy żadne uruchomienie nie trwa, rozpoczyna
+    i kończy własne (z raportem), w przeciwnym razie jest etapem bieżącego.
+    """
+    if _active is not None:
+        with stage(name):
+            yield
+        return
+
+    report = start_run(name)
+    try:
+        with report.stage(name), report.profile(name):
+            yield
+    finally:
+        finish_run(report)
+
+
+def measured(name):
+    """
+    Dekorator: wywołanie funkcji mierzone jak w run(name).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with run(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,96 @@
+# log.py
+import os
+import time
+
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+# Poziom ustawiany zmienną środowiskową, np. BAT_TRANSECTS_LOG_LEVEL=DEBUG
+LEVEL_ENV = "BAT_TRANSECTS_LOG_LEVEL"
+TAG = "Bat Transects"
+
+_level = {name: level for level, name in LEVEL_NAMES.items()}.get(os.environ.get(LEVEL_ENV, "").upper(), INFO)
+
+
+def set_level(level):
+    global _level
+    _level = level
+
+
+def is_enabled(level):
+    """
+    Pozwala pominąć budowanie kosztownego komunikatu, który i tak nie zostanie zapisany.
+    """
+    return level >= _level
+
+
+def _emit(level, message):
+    if level < _level:
+        return
+    try:
+        from qgis.core import QgsMessageLog, Qgis
+    except ImportError:
+        print(f"[{LEVEL_NAMES[level]}] {message}")
+        return
+    qgis_level = {DEBUG: Qgis.Info, INFO: Qgis.Info, WARNING: Qgis.Warning, ERROR: Qgis.Critical}[level]
+    # QgsMessageLog jest bezpieczny wątkowo — można go wołać z zadań QgsTask
+    QgsMessageLog.logMessage(message, TAG, qgis_level)
+
+
+def debug(message):
+    _emit(DEBUG, message)
+
+
+def info(message):
+    _emit(INFO, message)
+
+
+def warning(message):
+    _emit(WARNING, message)
+
+
+def error(message):
+    _emit(ERROR, message)
+
+
+class Progress:
+    """
+    Postęp z ograniczoną częstotliwością odświeżania.
+
+    Przekazuje wartości do obiektu z setProgress/isCanceled (QgsFeedback,
+    QgsProcessingFeedback, QgsTask) najwyżej co min_interval sekund i tylko
+    przy zmianie o co najmniej min_step punktów procentowych, więc można go
+    wywoływać w gorących pętlach. start/end mapują lokalne 0–100 na fragment
+    postępu nadrzędnego (np. jeden bufor z wielu). Sam też ma interfejs
+    setProgress/isCanceled, więc może zastąpić zadanie w process_buffer.
+    """
+
+    def __init__(self, feedback=None, start=0.0, end=100.0, min_interval=0.2, min_step=1.0):
+        self.feedback = feedback
+        self.start = start
+        self.end = end
+        self.min_interval = min_interval
+        self.min_step = min_step
+        self._last_value = None
+        self._last_time = 0.0
+
+    def setProgress(self, progress):
+        if self.feedback is None:
+            return
+        value = self.start + (self.end - self.start) * min(max(progress, 0.0), 100.0) / 100.0
+        now = time.monotonic()
+        if self._last_value is not None and value < self.end:
+            if abs(value - self._last_value) < self.min_step or now - self._last_time < self.min_interval:
+                return
+        self._last_value = value
+        self._last_time = now
+        self.feedback.setProgress(value)
+
+    def step(self, done, total):
+        """
+        Postęp jako done z total kroków.
+        """
+        self.setProgress(done / total * 100.0 if total else 100.0)
+
+    def isCanceled(self):
+        return self.feedback is not None and self.feedback.isCanceled()
@@ -3,15 +3,17 @@ from qgis.PyQt.QtWidgets import QAction
 from qgis.PyQt.QtGui import QIcon
 from qgis.core import Qgis
 
-from .osm_tools import download_osm_environment_layers
 from PyQt5.QtGui import QColor
 
 from . import resources
-from . import osm_tools
-from . import routing_tools
+from . import dependencies
+from . import instrumentation
+from . import log
 from .bat_transects_dialog import BatTransectsDialog
+from .processing_provider import BatTransectsProvider
 
 from qgis.core import (
+    QgsApplication,
     QgsProject,
     QgsMapLayer,
     QgsWkbTypes,
@@ -37,8 +39,16 @@ class BatTransectsPlugin:
         self.iface = iface
         self.action = None
         self.route_action = None
+        self.provider = None
+
+    def initProcessing(self):
+        # Algorytmy Processing (także dla qgis_process, bez interfejsu)
+        self.provider = BatTransectsProvider()
+        QgsApplication.processingRegistry().addProvider(self.provider)
 
     def initGui(self):
+        self.initProcessing()
+
         # Ikona przycisku
         icon = QIcon(":/icon.png")
 
@@ -77,6 +87,8 @@ class BatTransectsPlugin:
 
     def unload(self):
         # Usuwanie przy wyłączaniu wtyczki
+        if self.provider is not None:
+            QgsApplication.processingRegistry().removeProvider(self.provider)
         self.iface.removePluginMenu("&Bat Transects", self.action)
         self.iface.removeToolBarIcon(self.action)
         self.iface.removePluginMenu("&Bat Transects", self.route_action)
@@ -85,6 +97,8 @@ class BatTransectsPlugin:
         self.iface.removePluginMenu("Bat Transect Plugin", self.connect_transects_action)
 
     def run(self):
+        if not dependencies.check(self.iface):
+            return
         self.dialog = BatTransectsDialog()
 
         # Załaduj listę punktowych warstw z projektu
@@ -100,6 +114,10 @@ class BatTransectsPlugin:
         self.dialog.show()
 
     def generate_transects(self):
+        # Ciężkie moduły (osmnx, geopandas...) są ładowane dopiero przy pierwszym użyciu, nie przy starcie QGIS
+        from .buffer_tasks import BufferBatch
+        from .output_layers import fingerprint
+
         layer = self.dialog.layerComboBox.currentData()
         buffer_distance = float(self.dialog.bufferLineEdit.text())
 
@@ -107,6 +125,10 @@ class BatTransectsPlugin:
             self.iface.messageBar().pushMessage("Błąd", "Brak warstwy lub nieprawidłowy bufor.", level=Qgis.Critical)
             return
 
+        data_source = self.get_data_source()
+        if data_source is None:
+            return
+
         source_crs = layer.crs()
         map_crs = QgsCoordinateReferenceSystem("EPSG:3857")  # układ metryczny
         transform_to_buffer = QgsCoordinateTransform(source_crs, map_crs, QgsProject.instance())
@@ -120,68 +142,83 @@ class BatTransectsPlugin:
         provider.addAttributes([QgsField("id", QVariant.Int)])
         buffer_layer.updateFields()
 
-        for i, feature in enumerate(layer.getFeatures()):
+        excluded_types = []
+        if self.dialog.checkMotorway.isChecked():
+            excluded_types.append("motorway")
+        if self.dialog.checkPrimary.isChecked():
+            excluded_types.append("primary")
+        if self.dialog.checkSecondary.isChecked():
+            excluded_types.append("secondary")
+        if self.dialog.checkTertiary.isChecked():
+            excluded_types.append("tertiary")
+        if self.dialog.checkResidential.isChecked():
+            excluded_types.append("residential")
+        if self.dialog.checkTrack.isChecked():
+            excluded_types.append("track")
+        if self.dialog.checkPath.isChecked():
+            excluded_types.append("path")
+        if self.dialog.checkService.isChecked():
+            excluded_types.append("service")
+        if self.dialog.checkUnclassified.isChecked():
+            excluded_types.append("unclassified")
+        if self.dialog.checkFootway.isChecked():
+            excluded_types.append("footway")
+
+        # Odczytujemy preferencje środowiskowe z UI
+        environment_preferences = {
+            'forest': self.dialog.checkForest.isChecked(),
+            'water': self.dialog.checkWater.isChecked(),
+            'cave': self.dialog.checkCave.isChecked(),
+            'abandoned': self.dialog.checkAbandoned.isChecked(),
+            'max_distance': self.dialog.lineEditMaxDistance.text()
+        }
+
+        params = (sorted(excluded_types), environment_preferences, self.dialog.lineEditDataSource.text().strip())
+        buffers = []
+        fingerprints = {}
+        for feature in layer.getFeatures():
             geom = feature.geometry()
             if geom.isEmpty():
                 continue
+            # Identyfikator obiektu jest stały między uruchomieniami — potrzebny do przetwarzania przyrostowego
+            buffer_id = feature.id()
+            point_fingerprint = fingerprint(geom, buffer_distance, *params)
 
             if not crs_is_metric:
                 geom.transform(transform_to_buffer)
 
             buffer_geom = geom.buffer(buffer_distance, 16)
             if buffer_geom is None or buffer_geom.isEmpty():
-                print(f"[DEBUG] Punkt {i + 1} → bufor pusty lub None!")
+                log.debug(f"Punkt {buffer_id} → bufor pusty lub None!")
                 continue
+            # Odcisk tylko punktów z buforem — pusty bufor nie jest oznaczany jako przetworzony
+            fingerprints[buffer_id] = point_fingerprint
 
             if not crs_is_metric:
                 buffer_geom.transform(transform_back)
 
             new_feature = QgsFeature()
             new_feature.setGeometry(buffer_geom)
-            new_feature.setAttributes([i + 1])
+            new_feature.setAttributes([buffer_id])
             provider.addFeature(new_feature)
-
-            excluded_types = []
-            if self.dialog.checkMotorway.isChecked():
-                excluded_types.append("motorway")
-            if self.dialog.checkPrimary.isChecked():
-                excluded_types.append("primary")
-            if self.dialog.checkSecondary.isChecked():
-                excluded_types.append("secondary")
-            if self.dialog.checkTertiary.isChecked():
-                excluded_types.append("tertiary")
-            if self.dialog.checkResidential.isChecked():
-                excluded_types.append("residential")
-            if self.dialog.checkTrack.isChecked():
-                excluded_types.append("track")
-            if self.dialog.checkPath.isChecked():
-                excluded_types.append("path")
-            if self.dialog.checkService.isChecked():
-                excluded_types.append("service")
-            if self.dialog.checkUnclassified.isChecked():
-                excluded_types.append("unclassified")
-            if self.dialog.checkFootway.isChecked():
-                excluded_types.append("footway")
-
-            # Odczytujemy preferencje środowiskowe z UI
-            environment_preferences = {
-                'forest': self.dialog.checkForest.isChecked(),
-                'water': self.dialog.checkWater.isChecked(),
-                'cave': self.dialog.checkCave.isChecked(),
-                'abandoned': self.dialog.checkAbandoned.isChecked(),
-                'max_distance': self.dialog.lineEditMaxDistance.text()
-            }
-
-            osm_tools.download_osm_roads_for_buffer(
-                buffer_geom,
-                source_crs,
-                self.iface,
-                i + 1,
-                buffer_distance,
-                excluded_types,
-                environment_preferences
-            )
-            print(f"[DEBUG] Wywołuję OSM download dla punktu {i + 1}, bufor: {buffer_geom.asWkt()[:100]}...")
+            buffers.append((buffer_id, buffer_geom))
+
+        output = self.get_output()
+        buffers = self.changed_buffers(output, buffers, fingerprints)
+
+        # Pobieranie i score w tle (opcjonalnie jedno pobranie dla całego obszaru badań)
+        self.batch = BufferBatch(
+            self.iface,
+            buffers,
+            source_crs,
+            buffer_distance,
+            excluded_types,
+            environment_preferences,
+            data_source=data_source,
+            use_study_area=self.dialog.checkStudyArea.isChecked(),
+            output=output
+        )
+        self.batch.start()
 
         buffer_layer.updateExtents()
 
@@ -198,11 +235,63 @@ class BatTransectsPlugin:
 
         self.dialog.close()
 
+    def get_data_source(self):
+        """
+        Zwraca źródło danych OSM wybrane w zakładce Advanced (plik lokalny albo Overpass).
+        """
+        from . import osm_sources
+
+        path = self.dialog.lineEditDataSource.text()
+        try:
+            return osm_sources.get_source(path)
+        except (FileNotFoundError, ValueError) as e:
+            self.iface.messageBar().pushMessage("Błąd", str(e), level=Qgis.Critical)
+            return None
+
+    def get_output(self):
+        """
+        Zwraca wspólne warstwy GeoPackage z zakładki Advanced albo None (osobne warstwy tymczasowe).
+        """
+        from .output_layers import GeoPackageOutput
+
+        path = self.dialog.lineEditOutput.text().strip()
+        if not path:
+            return None
+        if not path.lower().endswith(".gpkg"):
+            path += ".gpkg"
+        try:
+            return GeoPackageOutput(path).open()
+        except RuntimeError as e:
+            self.iface.messageBar().pushMessage(
+                "Błąd", f"{e} – wyniki trafią do warstw tymczasowych.", level=Qgis.Warning)
+            return None
+
+    def changed_buffers(self, output, buffers, fingerprints):
+        """
+        Z wyjściem GeoPackage zostawia tylko bufory punktów nowych i zmienionych
+        (wyniki usuniętych punktów są kasowane), bez niego — wszystkie.
+        """
+        if output is None:
+            return buffers
+        changed = set(output.sync(fingerprints))
+        if not changed:
+            self.iface.messageBar().pushMessage("OK", "Brak zmienionych punktów – wyniki są aktualne.",
+                                                level=Qgis.Info)
+        return [(buffer_id, geom) for buffer_id, geom in buffers if buffer_id in changed]
+
     def run_route_search(self):
+        if not dependencies.check(self.iface):
+            return
+        from . import routing_tools
+
         layer = self.iface.activeLayer()
         routing_tools.find_min_500m_path_in_layer(layer, self.iface)
 
     def run_connect_transects(self):
+        if not dependencies.check(self.iface):
+            return
+        from . import routing_tools
+
         transect_layer = self.iface.activeLayer()
         if not transect_layer:
             self.iface.messageBar().pushMessage("Błąd", "Nie wybrano warstwy transektów!", level=Qgis.Critical)
@@ -222,6 +311,8 @@ class BatTransectsPlugin:
         routing_tools.connect_transects_via_osm(transect_layer, road_layer, self.iface)
 
     def run_all_steps(self):
+        if not dependencies.check(self.iface):
+            return
         self.dialog = BatTransectsDialog()
 
         layers = [layer for layer in QgsProject.instance().mapLayers().values()
@@ -252,37 +343,61 @@ class BatTransectsPlugin:
         self.dialog.close()
 
     def generate_and_process(self, selected_layer, buffer_distance):
+        from .buffer_tasks import BufferBatch
+        from .output_layers import fingerprint
+
+        data_source = self.get_data_source()
+        if data_source is None:
+            return
+
         source_crs = selected_layer.crs()
         map_crs = QgsCoordinateReferenceSystem("EPSG:3857")
         transform_to_buffer = QgsCoordinateTransform(source_crs, map_crs, QgsProject.instance())
         transform_back = QgsCoordinateTransform(map_crs, source_crs, QgsProject.instance())
         crs_is_metric = source_crs.mapUnits() == QgsUnitTypes.DistanceMeters
-        print(f"[DEBUG] CRS warstwy: {source_crs.authid()}, metryczne: {crs_is_metric}")
+        log.debug(f"CRS warstwy: {source_crs.authid()}, metryczne: {crs_is_metric}")
 
         buffer_layer = QgsVectorLayer("Polygon?crs=" + source_crs.authid(), "Bufory transektów", "memory")
         provider = buffer_layer.dataProvider()
         provider.addAttributes([QgsField("id", QVariant.Int)])
         buffer_layer.updateFields()
 
-        for i, feature in enumerate(selected_layer.getFeatures()):
+        params = (None, None, self.dialog.lineEditDataSource.text().strip())
+        buffers = []
+        fingerprints = {}
+        for feature in selected_layer.getFeatures():
             geom = feature.geometry()
             if geom.isEmpty():
                 continue
+            buffer_id = feature.id()
+            point_fingerprint = fingerprint(geom, buffer_distance, *params)
 
             if not crs_is_metric:
                 geom.transform(transform_to_buffer)
 
             buffer_geom = geom.buffer(buffer_distance, 16)
+            if buffer_geom is None or buffer_geom.isEmpty():
+                log.debug(f"Punkt {buffer_id} → bufor pusty lub None!")
+                continue
+            # Odcisk tylko punktów z buforem — pusty bufor nie jest oznaczany jako przetworzony
+            fingerprints[buffer_id] = point_fingerprint
 
             if not crs_is_metric:
                 buffer_geom.transform(transform_back)
 
             new_feature = QgsFeature()
             new_feature.setGeometry(buffer_geom)
-            new_feature.setAttributes([i + 1])
+            new_feature.setAttributes([buffer_id])
             provider.addFeature(new_feature)
+            buffers.append((buffer_id, buffer_geom))
 
-            osm_tools.download_osm_roads_for_buffer(buffer_geom, source_crs, self.iface, i + 1, buffer_distance)
+        output = self.get_output()
+        buffers = self.changed_buffers(output, buffers, fingerprints)
+
+        self.batch = BufferBatch(self.iface, buffers, source_crs, buffer_distance, data_source=data_source,
+                                 use_study_area=self.dialog.checkStudyArea.isChecked(),
+                                 on_done=self.finish_generate_and_process, output=output)
+        self.batch.start()
 
         buffer_layer.updateExtents()
         symbol = QgsFillSymbol.createSimple(
@@ -292,6 +407,26 @@ class BatTransectsPlugin:
 
         self.iface.messageBar().pushMessage("Sukces", "Dodano warstwę buforów.", level=Qgis.Success)
 
+    def finish_generate_and_process(self):
+        # Wywoływane po przetworzeniu wszystkich buforów w tle
+        from . import routing_tools
+
+        output = self.batch.output
+        if output is not None:
+            # Drogi wszystkich buforów są w jednej warstwie — ścieżka szukana osobno dla każdego buffer_id
+            found = 0
+            with instrumentation.run("find_min_path"):
+                processed = [buffer_id for buffer_id, _ in self.batch.buffers]
+                for buffer_id, result in routing_tools.min_length_paths_by_group(
+                        output.layers["roads"], "buffer_id", values=processed):
+                    if result:
+                        output.add_route(buffer_id, *result)
+                        found += 1
+            output.refresh()
+            self.iface.messageBar().pushMessage(
+                "OK", f"Znaleziono trasy dla {found} z {len(self.batch.buffers)} buforów.", level=Qgis.Success)
+            return
+
         for lyr in QgsProject.instance().mapLayers().values():
             if lyr.name().lower().startswith("trasa") or "transekt" in lyr.name().lower():
                 routing_tools.find_min_500m_path_in_layer(lyr, self.iface)
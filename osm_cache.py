@@ -0,0 +1,163 @@
+# osm_cache.py
+import hashlib
+import json
+import math
+import os
+import pickle
+import threading
+import time
+
+from . import instrumentation
+from . import log
+
+
+# Domyślne ustawienia cache
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "bat_transects")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # 512 MB
+DEFAULT_TTL = 30 * 24 * 3600  # 30 dni
+DEFAULT_TILE_SIZE = 0.002  # stopnie (~220 m szerokości geograficznej)
+
+METERS_PER_DEGREE = 111320.0
+
+
+def snap_bbox(bounds, tile_size=DEFAULT_TILE_SIZE):
+    """
+    Rozszerza bbox (minx, miny, maxx, maxy) w stopniach do siatki kafli,
+    dzięki czemu sąsiednie bufory trafiają w te same klucze cache.
+    """
+    minx, miny, maxx, maxy = bounds
+    return (
+        round(math.floor(minx / tile_size) * tile_size, 6),
+        round(math.floor(miny / tile_size) * tile_size, 6),
+        round(math.ceil(maxx / tile_size) * tile_size, 6),
+        round(math.ceil(maxy / tile_size) * tile_size, 6),
+    )
+
+
+def snap_point(lat, lon, dist, tile_size=DEFAULT_TILE_SIZE):
+    """
+    Przyciąga punkt (lat, lon) do środka kafla i powiększa promień (w metrach)
+    o połowę przekątnej kafla, tak aby pobrany obszar nadal obejmował pierwotny.
+    """
+    tile_lat = (math.floor(lat / tile_size) + 0.5) * tile_size
+    tile_lon = (math.floor(lon / tile_size) + 0.5) * tile_size
+    half_h = tile_size / 2 * METERS_PER_DEGREE
+    half_w = tile_size / 2 * METERS_PER_DEGREE * math.cos(math.radians(lat))
+    snapped_dist = math.ceil(dist + math.hypot(half_h, half_w))
+    return (round(tile_lat, 6), round(tile_lon, 6)), snapped_dist
+
+
+def make_key(kind, extent, tags=None):
+    """
+    Buduje klucz cache z rodzaju danych, zakresu (kafel) i zestawu tagów.
+    """
+    payload = json.dumps([kind, list(extent), tags or {}], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class OsmCache:
+    """
+    Trwały cache na dysku dla grafów dróg i warstw środowiskowych.
+
+    Każdy wpis to osobny plik pickle. Czas modyfikacji pliku pełni rolę
+    znacznika ostatniego użycia (LRU), a czas utworzenia zapisany we wpisie
+    służy do wygaszania (TTL). Po każdym zapisie najdawniej używane wpisy są
+    usuwane, dopóki łączny rozmiar nie zmieści się w max_bytes.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".pkl")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            instrumentation.count("osm_cache_misses")
+            return None
+        except Exception as e:
+            log.error(f"Uszkodzony wpis cache {key} → {e}")
+            self._remove(path)
+            return None
+
+        if self.ttl is not None and time.time() - entry["created"] > self.ttl:
+            self._remove(path)
+            instrumentation.count("osm_cache_misses")
+            return None
+
+        try:
+            os.utime(path, None)  # oznacz jako ostatnio użyty
+        except FileNotFoundError:
+            pass
+        instrumentation.count("osm_cache_hits")
+        return entry["data"]
+
+    def put(self, key, data):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"  # zapisy z wielu wątków
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump({"created": time.time(), "data": data}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            instrumentation.count("osm_cache_bytes_written", os.path.getsize(tmp_path))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            log.error(f"Nie udało się zapisać wpisu cache {key} → {e}")
+            self._remove(tmp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        """
+        Usuwa najdawniej używane wpisy, aż rozmiar cache spadnie poniżej max_bytes.
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".pkl"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".pkl"):
+                self._remove(os.path.join(self.cache_dir, name))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+_default_cache = None
+
+
+def get_cache():
+    """
+    Zwraca współdzieloną instancję cache z domyślnymi ustawieniami.
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = OsmCache()
+    return _default_cache
@@ -0,0 +1,168 @@
+# osm_sources.py
+import os
+import threading
+from abc import ABC, abstractmethod
+
+import osmnx as ox
+import geopandas as gpd
+
+from . import log
+from . import overpass_client
+from .osm_tools import (
+    habitat_tags, expand_polygon, split_habitat_layers, features_from_xml,
+    download_osm_road_graph, download_osm_road_graph_for_polygon, download_osm_environment_layers
+)
+
+
+class OverpassSource:
+    """
+    Źródło danych online: Overpass API (z cache na dysku). endpoint pozwala
+    wskazać inny serwer, np. lokalny mirror; zapytania idą przez wspólnego
+    klienta overpass_client (limit równoległych zapytań, ponowienia).
+    """
+
+    def __init__(self, use_cache=True, endpoint=None):
+        self.use_cache = use_cache
+        self.client = overpass_client.get_client(endpoint)
+
+    def road_edges(self, polygon, buffer_distance=None):
+        """
+        Zwraca krawędzie dróg (GeoDataFrame w EPSG:4326) przecinające wielokąt.
+        Z buffer_distance pobiera graf wokół centroidu bufora, bez — dla całego wielokąta.
+        """
+        if buffer_distance is None:
+            G = download_osm_road_graph_for_polygon(polygon, use_cache=self.use_cache, client=self.client)
+        else:
+            G = download_osm_road_graph(polygon, buffer_distance, use_cache=self.use_cache, client=self.client)
+        edges = ox.graph_to_gdfs(G, nodes=False, edges=True)
+        return edges.iloc[edges.sindex.query(polygon, predicate="intersects")]
+
+    def habitats(self, polygon, margin=0):
+        return download_osm_environment_layers(polygon, margin=margin, use_cache=self.use_cache, client=self.client)
+
+
+class LocalSource(ABC):
+    """
+    Źródło danych offline: cały plik jest wczytywany raz (przy pierwszym
+    zapytaniu), a wycinanie dla bufora to zapytanie do indeksu przestrzennego.
+
+    Klasy pochodne implementują _load(), zwracające (krawędzie dróg, obiekty
+    środowiskowe) jako GeoDataFrame z kolumnami tagów OSM.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._edges = None
+        self._habitats = None
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _load(self):
+        """
+        Wczytuje cały plik: zwraca (krawędzie dróg, obiekty środowiskowe) jako GeoDataFrame.
+        """
+
+    def _data(self):
+        with self._lock:  # bufory przetwarzane równolegle czekają na jedno wczytanie
+            if self._edges is None:
+                log.debug(f"Wczytuję lokalne dane OSM: {self.path}")
+                edges, habitats = self._load()
+                self._habitats = habitats.to_crs(epsg=4326)
+                self._edges = edges.to_crs(epsg=4326)
+        return self._edges, self._habitats
+
+    def road_edges(self, polygon, buffer_distance=None):
+        edges, _ = self._data()
+        return edges.iloc[edges.sindex.query(polygon, predicate="intersects")]
+
+    def habitats(self, polygon, margin=0):
+        _, habitats = self._data()
+        area = expand_polygon(polygon, margin)
+        return split_habitat_layers(habitats.iloc[habitats.sindex.query(area, predicate="intersects")])
+
+
+class OsmXmlSource(LocalSource):
+    """
+    Wyciąg OSM w formacie XML (.osm), wczytywany przez osmnx.
+    """
+
+    def _load(self):
+        # Cały wyciąg — także drogi spoza największej składowej spójności
+        G = ox.graph_from_xml(self.path, simplify=True, retain_all=True)
+        edges = ox.graph_to_gdfs(G, nodes=False, edges=True)
+        habitats = features_from_xml(self.path, tags=habitat_tags())
+        return edges, habitats
+
+
+class PbfSource(LocalSource):
+    """
+    Wyciąg OSM w formacie .osm.pbf, wczytywany przez pyrosm (opcjonalna zależność).
+    """
+
+    def _load(self):
+        try:
+            from pyrosm import OSM
+        except ImportError:
+            raise RuntimeError("Odczyt plików .osm.pbf wymaga pakietu pyrosm (python3 -m pip install pyrosm)")
+
+        osm = OSM(self.path)
+        nodes, ways = osm.get_network(network_type="all", nodes=True)
+        G = osm.to_graph(nodes, ways, graph_type="networkx", osmnx_compatible=True)
+        G = ox.simplify_graph(G)
+        edges = ox.graph_to_gdfs(G, nodes=False, edges=True)
+        habitats = osm.get_data_by_custom_criteria(
+            custom_filter=habitat_tags(), filter_type="keep",
+            keep_nodes=True, keep_ways=True, keep_relations=True
+        )
+        if habitats is None:
+            habitats = gpd.GeoDataFrame(geometry=[], crs="EPSG:4326")
+        return edges, habitats
+
+
+class GeoPackageSource(LocalSource):
+    """
+    Przygotowana paczka GeoPackage z warstwami:
+    - roads: linie z atrybutem `highway`, podzielone na skrzyżowaniach,
+    - habitats: obiekty z kolumnami tagów OSM (`landuse`, `natural`).
+    """
+
+    def __init__(self, path, roads_layer="roads", habitats_layer="habitats"):
+        super().__init__(path)
+        self.roads_layer = roads_layer
+        self.habitats_layer = habitats_layer
+
+    def _load(self):
+        edges = gpd.read_file(self.path, layer=self.roads_layer)
+        habitats = gpd.read_file(self.path, layer=self.habitats_layer)
+        return edges, habitats
+
+
+_sources = {}
+
+
+def get_source(path=None):
+    """
+    Zwraca źródło danych dla ścieżki pliku (wg rozszerzenia) albo Overpass,
+    gdy ścieżka jest pusta lub jest adresem http(s) serwera Overpass (np.
+    lokalnego mirrora). Źródła są współdzielone, więc plik jest wczytywany
+    tylko raz na sesję QGIS.
+    """
+    path = (path or "").strip()
+    if path not in _sources:
+        lower = path.lower()
+        if not path:
+            source = OverpassSource()
+        elif lower.startswith(("http://", "https://")):
+            source = OverpassSource(endpoint=path)
+        elif not os.path.exists(path):
+            raise FileNotFoundError(f"Nie znaleziono pliku danych OSM: {path}")
+        elif lower.endswith(".pbf"):
+            source = PbfSource(path)
+        elif lower.endswith((".osm", ".xml")):
+            source = OsmXmlSource(path)
+        elif lower.endswith(".gpkg"):
+            source = GeoPackageSource(path)
+        else:
+            raise ValueError(f"Nieobsługiwany format danych OSM: {path}")
+        _sources[path] = source
+    return _sources[path]
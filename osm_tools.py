@@ -1,10 +1,11 @@
 # osm_tools.py
+import os
+
 import osmnx as ox
 import networkx as nx
 from shapely.geometry import Polygon
 from qgis.core import (
-    QgsVectorLayer, QgsProject, QgsFeature, QgsField,
-    QgsGeometry, Qgis,
+    QgsVectorLayer, QgsProject, QgsField,
     QgsRendererCategory, QgsLineSymbol, QgsCategorizedSymbolRenderer
 )
 from PyQt5.QtCore import QVariant
@@ -12,145 +13,406 @@ from PyQt5.QtCore import QVariant
 from shapely.geometry import shape
 from shapely.ops import transform
 import pyproj
-from qgis.core import QgsSpatialIndex, QgsFeatureRequest
-from collections.abc import Iterable
 import geopandas as gpd
+import pandas as pd
+import math
 
+from . import instrumentation
+from . import log
+from . import osm_cache
+from .constants import road_styles, habitat_layers
+from .geometry_convert import from_qgs_geometry
 
-# Typy dróg i kolory
-road_styles = {
-    'motorway': '255,0,0',
-    'primary': '255,128,0',
-    'secondary': '255,200,0',
-    'tertiary': '255,0,255',
-    'residential': '200,200,200',
-    'track': '0,255,0',
-    'path': '0,128,255',
-    'service': '160,160,160',
-    'unclassified': '100,100,100',
-    'footway': '100,100,255'
-}
 
-def download_osm_environment_layers(polygon):
+def habitat_tags():
     """
-    Pobiera warstwy środowiskowe z OSM w granicach danego wielokąta.
+    Zwraca słownik tagów OSM wszystkich warstw środowiskowych, np. {"natural": ["water", ...]}.
     """
-    bbox = polygon.bounds  # (minx, miny, maxx, maxy)
+    tags = {}
+    for (key, value), _, _ in habitat_layers.values():
+        tags.setdefault(key, []).append(value)
+    return tags
 
-    tags = {
-        "landuse": ["forest"],
-        "natural": ["water", "cave_entrance"]
-    }
 
-    all_layers = {}
+def expand_polygon(polygon, margin):
+    """
+    Powiększa wielokąt w EPSG:4326 o margines podany w metrach
+    (przeliczony na stopnie długości geograficznej, czyli z zapasem).
+    """
+    if not margin:
+        return polygon
+    lat = polygon.centroid.y
+    return polygon.buffer(margin / (osm_cache.METERS_PER_DEGREE * math.cos(math.radians(lat))))
 
-    for key, values in tags.items():
-        for value in values:
-            try:
-                gdf = ox.geometries_from_bbox(bbox[3], bbox[1], bbox[2], bbox[0], {key: value})
-                if not gdf.empty:
-                    all_layers[f"{key}_{value}"] = gdf
-            except Exception as e:
-                print(f"[ERROR] Failed to download {key}={value} → {e}")
 
+def split_habitat_layers(gdf):
+    """
+    Dzieli wynik zbiorczego zapytania na warstwy wg tagu. Obiekty punktowe
+    (np. wejścia do jaskiń) zostają punktami, z warstw powierzchniowych
+    usuwane są geometrie inne niż poligony.
+    """
+    all_layers = {}
+    for layer_key, ((key, value), _, geom_type) in habitat_layers.items():
+        if key not in gdf.columns:
+            continue
+        sub = gdf[gdf[key] == value]
+        if geom_type == 'Point':
+            sub = sub.set_geometry(sub.geometry.representative_point())
+        else:
+            sub = sub[sub.geom_type.isin(['Polygon', 'MultiPolygon'])]
+        if not sub.empty:
+            all_layers[layer_key] = sub
     return all_layers
 
-def flatten(value):
+
+# Filtr dróg jak network_type='all' w osmnx
+ROAD_FILTER = '["highway"]["area"!~"yes"]["highway"!~"abandoned|construction|no|planned|platform|proposed|raceway|razed"]'
+# Tolerancja upraszczania wielokątów w zapytaniach (stopnie, ok. 10 m)
+POLY_TOLERANCE = 0.0001
+
+
+def overpass_polygons(area, tolerance=POLY_TOLERANCE):
     """
-    Rekurencyjnie spłaszcza dowolnie zagnieżdżoną strukturę listową,
-    ignorując stringi i bajty jako iterowalne.
+    Filtry (poly:"lat lon ...") Overpass dla każdej części wielokąta. Części są
+    uproszczone po powiększeniu o tolerancję, więc nadal obejmują oryginał.
     """
-    if isinstance(value, Iterable) and not isinstance(value, (str, bytes)):
-        result = []
-        for item in value:
-            result.extend(flatten(item))
-        return result
-    else:
-        return [value]
+    parts = area.geoms if area.geom_type == "MultiPolygon" else [area]
+    filters = []
+    for part in parts:
+        outline = part.buffer(tolerance).simplify(tolerance)
+        if outline.geom_type == "MultiPolygon":
+            outline = outline.convex_hull
+        coords = " ".join(f"{lat:.6f} {lon:.6f}" for lon, lat in outline.exterior.coords[:-1])
+        filters.append(f'(poly:"{coords}")')
+    return filters
 
 
-def download_osm_roads_for_buffer(
-        qgs_geometry, crs, iface, buffer_id, buffer_distance,
-        excluded_highway_types=None, environment_preferences=None
-):
+def read_overpass_xml(content, reader, **kwargs):
+    """
+    Wczytuje odpowiedź Overpass (OSM XML) funkcją osmnx czytającą pliki (*_from_xml).
+    """
+    import tempfile
+
+    fd, path = tempfile.mkstemp(suffix=".osm")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        return reader(path, **kwargs)
+    finally:
+        os.remove(path)
+
+
+def features_from_xml(path, polygon=None, tags=None):
+    # osmnx 1.x: geometries_from_xml, od 1.5: features_from_xml
+    reader = getattr(ox, "features_from_xml", None) or ox.geometries_from_xml
+    return reader(path, polygon=polygon, tags=tags)
+
+
+def download_osm_environment_layers(polygon, margin=0, use_cache=True, client=None):
+    """
+    Pobiera warstwy środowiskowe z OSM w granicach danego wielokąta
+    (powiększonego o margin metrów) jednym zapytaniem dla wszystkich tagów
+    (po jednym na każdą część wielokąta, wysyłanych równolegle).
+    Wynik trafia do cache na dysku i jest dzielony lokalnie wg tagu.
+    Błąd pobierania (po ponowieniach) jest zgłaszany wyjątkiem OverpassError.
+    """
+    from shapely import wkt as shapely_wkt
+    from . import overpass_client
+
+    area = expand_polygon(polygon, margin)
+    tags = habitat_tags()
+
+    cache = osm_cache.get_cache() if use_cache else None
+    cache_key = osm_cache.make_key(
+        "habitat", osm_cache.snap_bbox(area.bounds),
+        {"tags": tags, "area": shapely_wkt.dumps(area, rounding_precision=6)}
+    )
+    gdf = cache.get(cache_key) if cache else None
+    if gdf is None:
+        client = client or overpass_client.get_client()
+        polys = overpass_polygons(area)
+        queries = []
+        for poly in polys:
+            selectors = "".join(f'nwr["{key}"="{value}"]{poly};' for key, values in tags.items() for value in values)
+            queries.append(f"({selectors});(._;>;);out;")
+        parts = [read_overpass_xml(content, features_from_xml, polygon=area, tags=tags)
+                 for content in client.query_many(queries)]
+        parts = [part for part in parts if not part.empty]
+        if parts:
+            gdf = pd.concat(parts)
+            gdf = gdf[~gdf.index.duplicated()]
+        else:
+            gdf = gpd.GeoDataFrame(geometry=[], crs="EPSG:4326")
+        if cache:
+            cache.put(cache_key, gdf)
+
+    return split_habitat_layers(gdf)
+
+
+def download_osm_road_graph(polygon, buffer_distance, use_cache=True, client=None):
+    """
+    Pobiera graf dróg OSM wokół centroidu wielokąta (prostokąt o połowie boku dist).
+    Punkt środkowy jest przyciągany do siatki kafli, a graf trafia do cache na dysku.
+    """
+    from . import overpass_client
+
+    centroid = polygon.centroid
+    center_latlon, dist = osm_cache.snap_point(centroid.y, centroid.x, buffer_distance)
+
+    cache = osm_cache.get_cache() if use_cache else None
+    cache_key = osm_cache.make_key("roads", (*center_latlon, dist), {"network_type": "all", "simplify": True})
+    G = cache.get(cache_key) if cache else None
+    if G is None:
+        lat, lon = center_latlon
+        dlat = dist / osm_cache.METERS_PER_DEGREE
+        dlon = dist / (osm_cache.METERS_PER_DEGREE * math.cos(math.radians(lat)))
+        bbox = f"({lat - dlat:.6f},{lon - dlon:.6f},{lat + dlat:.6f},{lon + dlon:.6f})"
+        client = client or overpass_client.get_client()
+        content = client.query(f"(way{ROAD_FILTER}{bbox};);(._;>;);out;")
+        G = read_overpass_xml(content, ox.graph_from_xml, simplify=True)
+        if cache:
+            cache.put(cache_key, G)
+    return G
+
+
+def download_osm_road_graph_for_polygon(area, use_cache=True, client=None):
+    """
+    Pobiera graf dróg OSM w granicach wielokąta (np. całego obszaru badań).
+    Każda część wielokąta to osobne zapytanie, wysyłane równolegle. Graf
+    zachowuje wszystkie składowe spójności (retain_all) — drogi bufora
+    połączone z resztą sieci tylko poza wielokątem nie mogą zniknąć.
+    """
+    from shapely import wkt as shapely_wkt
+    from . import overpass_client
+
+    cache = osm_cache.get_cache() if use_cache else None
+    cache_key = osm_cache.make_key(
+        "roads_area", osm_cache.snap_bbox(area.bounds),
+        {"area": shapely_wkt.dumps(area, rounding_precision=6), "network_type": "all", "simplify": True,
+         "retain_all": True}
+    )
+    G = cache.get(cache_key) if cache else None
+    if G is None:
+        client = client or overpass_client.get_client()
+        queries = [f"(way{ROAD_FILTER}{poly};);(._;>;);out;" for poly in overpass_polygons(area)]
+        G = nx.compose_all([read_overpass_xml(content, ox.graph_from_xml, simplify=True, retain_all=True)
+                            for content in client.query_many(queries)])
+        if cache:
+            cache.put(cache_key, G)
+    return G
+
+
+def qgs_to_shapely_polygon(qgs_geometry):
+    """
+    Konwertuje poligon QGIS (bufor) na Shapely Polygon.
+    """
     from shapely.geometry import Polygon as ShapelyPolygon
 
-    if excluded_highway_types is None:
-        excluded_highway_types = []
-    excluded_highway_types = [str(v) for v in excluded_highway_types]
+    geom = from_qgs_geometry(qgs_geometry)
+    if geom.geom_type == "MultiPolygon":
+        geom = geom.geoms[0]
+    return ShapelyPolygon(geom.exterior)
 
-    # 1. Konwersja QGIS geometry -> Shapely Polygon
-    shapely_geom = qgs_geometry.asPolygon()
-    if not shapely_geom:
-        shapely_geom = qgs_geometry.asMultiPolygon()[0]
-    polygon = ShapelyPolygon(shapely_geom[0])
-
-    # 2. Pobierz wybrane warstwy środowiskowe z OSM
-    env_gdfs_all = download_osm_environment_layers(polygon)
-    env_layers = {}
-    env_indexes = {}
-    for key, gdf in env_gdfs_all.items():
-        env_type = key.split('_')[-1]
-        if environment_preferences and not environment_preferences.get(env_type, False):
-            continue  # Pomijaj nie wybrane
-
-        gdf_qgs = QgsVectorLayer("Polygon?crs=EPSG:4326", key, "memory")
-        prov = gdf_qgs.dataProvider()
-        prov.addAttributes([QgsField("osm_id", QVariant.String)])
-        gdf_qgs.updateFields()
 
-        feats = []
-        for _, row in gdf.iterrows():
-            if row.geometry.is_valid:
-                feat = QgsFeature()
-                feat.setGeometry(QgsGeometry.fromWkt(row.geometry.wkt))
-                feat.setAttributes([str(row.get("osmid", ""))])
-                feats.append(feat)
-        prov.addFeatures(feats)
-        gdf_qgs.updateExtents()
-        QgsProject.instance().addMapLayer(gdf_qgs)
+def download_osm_study_area(
+        qgs_geometries, use_convex_hull=False, env_margin=0, data_source=None, task=None
+):
+    """
+    Pobiera drogi i warstwy środowiskowe jednorazowo dla całego obszaru badań
+    (suma lub otoczka wypukła wszystkich buforów).
+
+    Zwraca słownik {"edges": GeoDataFrame krawędzi, "env": {klucz: GeoDataFrame},
+    "rasters": {klucz: HabitatRaster}}, z którego download_osm_roads_for_buffer
+    wycina dane dla pojedynczych buforów. Rastry odległości od siedlisk są
+    liczone raz dla całego obszaru i wspólne dla wszystkich buforów.
+
+    task (QgsTask) jest sprawdzany między pobieraniem dróg, siedlisk i liczeniem
+    rastrów — po anulowaniu zwracane jest None.
+    """
+    from shapely.ops import unary_union
+    from . import osm_sources
+    from .habitat_scoring import build_habitat_rasters
 
-        env_layers[env_type] = gdf_qgs
-        env_indexes[env_type] = QgsSpatialIndex(gdf_qgs.getFeatures())
+    if data_source is None:
+        data_source = osm_sources.get_source()
+
+    polygons = [qgs_to_shapely_polygon(g) for g in qgs_geometries]
+    area = unary_union(polygons)
+    if use_convex_hull:
+        area = area.convex_hull
+
+    def canceled(progress):
+        if task is None:
+            return False
+        task.setProgress(progress)
+        return task.isCanceled()
 
-    # Pobierz max dystans z GUI, domyślnie 100
-    max_distance = 100
+    with instrumentation.stage("study_area_roads"):
+        gdf_edges = data_source.road_edges(area)
+    if canceled(40):
+        return None
+    with instrumentation.stage("study_area_habitats"):
+        env_gdfs = data_source.habitats(area, margin=env_margin)
+    instrumentation.count("study_area_edges", len(gdf_edges))
+    if canceled(80):
+        return None
+    with instrumentation.stage("study_area_rasters"):
+        rasters = build_habitat_rasters({key: gdf[gdf.is_valid] for key, gdf in env_gdfs.items()},
+                                        gdf_edges, env_margin)
+
+    if canceled(100):
+        return None
+
+    log.debug(f"Obszar badań: {len(polygons)} buforów, {len(gdf_edges)} krawędzi")
+    return {"edges": gdf_edges, "env": env_gdfs, "rasters": rasters}
+
+
+def clip_study_area(study_area, polygon, margin=0):
+    """
+    Wycina z danych obszaru badań krawędzie przecinające bufor oraz obiekty
+    środowiskowe z bufora powiększonego o margin metrów (jak przy pobieraniu
+    pojedynczego bufora), korzystając z indeksów przestrzennych GeoDataFrame.
+    """
+    edges = study_area["edges"]
+    gdf_edges = edges.iloc[edges.sindex.query(polygon, predicate="intersects")]
+
+    env_area = expand_polygon(polygon, margin)
+    env_gdfs = {}
+    for key, gdf in study_area["env"].items():
+        clipped = gdf.iloc[gdf.sindex.query(env_area, predicate="intersects")]
+        if not clipped.empty:
+            env_gdfs[key] = clipped
+
+    return env_gdfs, gdf_edges
+
+
+def parse_max_distance(environment_preferences, default=100.0):
+    """
+    Odczytuje maksymalną odległość od siedlisk (m) z preferencji GUI, domyślnie 100.
+    """
     if environment_preferences and 'max_distance' in environment_preferences:
         try:
-            max_distance = float(environment_preferences['max_distance'])
+            return float(environment_preferences['max_distance'])
         except Exception:
             pass
+    return default
 
-    # 4. Pobieranie dróg
-    centroid = polygon.centroid
-    center_latlon = (centroid.y, centroid.x)
-    G = ox.graph_from_point(center_latlon, dist=buffer_distance, network_type='all', simplify=True, truncate_by_edge=False)
-    gdf_edges = ox.graph_to_gdfs(G, nodes=False, edges=True)
-    gdf_edges = gdf_edges[gdf_edges.intersects(polygon)]
-
-    def flatten(value):
-        if isinstance(value, Iterable) and not isinstance(value, (str, bytes)):
-            result = []
-            for item in value:
-                result.extend(flatten(item))
-            return result
-        else:
-            return [value]
 
-    def should_exclude(highway_value):
-        try:
-            flat_values = flatten(highway_value)
-        except Exception as e:
-            print(f"[ERROR flattening] value={highway_value} → {e}")
+def explode_tag_values(series):
+    """
+    Rozwija (także zagnieżdżone) listowe wartości tagów OSM, np. highway=['track', 'path'].
+    Zwraca serię z indeksem pozycyjnym wiersza — każdy wiersz wejścia ma w niej
+    co najmniej jeden wpis, więc groupby(level=0) odtwarza wszystkie wiersze.
+    """
+    values = pd.Series(series.to_numpy(), dtype=object)
+    while True:
+        exploded = values.explode()
+        if exploded.map(pd.api.types.is_list_like).any():
+            values = exploded
+            continue
+        return exploded
+
+
+def osm_ids(gdf):
+    """
+    Zwraca identyfikatory OSM obiektów jako tekst — z kolumny osmid albo
+    z poziomu indeksu osmid (tak zwraca je osmnx dla obiektów środowiskowych).
+    """
+    if "osmid" in gdf.columns:
+        ids = gdf["osmid"]
+    elif "osmid" in (gdf.index.names or []):
+        ids = gdf.index.get_level_values("osmid").to_series()
+    else:
+        return [""] * len(gdf)
+    return ids.astype(str).tolist()
+
+
+def process_buffer(
+        qgs_geometry, buffer_id, buffer_distance,
+        excluded_highway_types=None, environment_preferences=None, study_area=None, data_source=None, task=None
+):
+    """
+    Pobiera (albo wycina z obszaru badań) drogi i siedliska dla bufora i liczy
+    score krawędzi. Nie dotyka projektu ani interfejsu QGIS, więc może działać
+    w wątku QgsTask — warstwy tworzy potem add_buffer_layers w wątku głównym.
+
+    Surowe dane bufora zostają w pamięci (buffer_data), więc przy kolejnym
+    wywołaniu z innymi typami dróg, siedliskami albo mniejszym zasięgiem
+    przeliczany jest tylko filtr i score.
+
+    Zwraca słownik {"buffer_id", "env": [(klucz, typ geometrii, obiekty)], "roads": obiekty}
+    albo None, gdy zadanie zostało anulowane.
+    """
+    from . import osm_sources
+    from . import buffer_data
+
+    def canceled(progress):
+        if task is None:
             return False
-        for val in flat_values:
-            if val in excluded_highway_types:
-                return True
-        return False
+        task.setProgress(progress)
+        return task.isCanceled()
 
-    gdf_edges = gdf_edges[~gdf_edges['highway'].apply(should_exclude)]
+    if excluded_highway_types is None:
+        excluded_highway_types = []
+    excluded_highway_types = [str(v) for v in excluded_highway_types]
+
+    # 1. Konwersja QGIS geometry -> Shapely Polygon
+    polygon = qgs_to_shapely_polygon(qgs_geometry)
+
+    max_distance = parse_max_distance(environment_preferences)
+
+    if data_source is None:
+        data_source = osm_sources.get_source()
+    key = buffer_data.make_key(data_source, polygon, buffer_distance)
+    data = buffer_data.get(key, max_distance)
+    if data is not None:
+        instrumentation.count("buffer_data_hits")
+    else:
+        # 2. Pobierz warstwy środowiskowe z OSM (albo wytnij z obszaru badań)
+        with instrumentation.stage("habitats", buffer_id):
+            if study_area is not None:
+                env_gdfs_all, gdf_edges = clip_study_area(study_area, polygon, margin=max_distance)
+            else:
+                env_gdfs_all = data_source.habitats(polygon, margin=max_distance)
+        if canceled(30):
+            return None
+
+        # 3. Pobieranie dróg
+        if study_area is None:
+            with instrumentation.stage("roads", buffer_id):
+                gdf_edges = data_source.road_edges(polygon, buffer_distance)
+        rasters = study_area.get("rasters") if study_area is not None else None
+        data = buffer_data.put(key, buffer_data.BufferData(polygon, gdf_edges, env_gdfs_all, max_distance, rasters))
+    instrumentation.count("edges", len(data.edges))
+    if canceled(60):
+        return None
+
+    # 4. Filtr typów dróg i score — ekspozycja na każdą wybraną warstwę środowiskową (raster odległości)
+    result = data.result(buffer_id, excluded_highway_types, environment_preferences, max_distance)
+
+    if canceled(100):
+        return None
+
+    return result
+
+
+def add_buffer_layers(result, crs, iface):
+    """
+    Tworzy warstwy siedlisk i dróg bufora z wyniku process_buffer i dodaje je
+    do projektu. Musi być wywołana w wątku głównym.
+    """
+    buffer_id = result["buffer_id"]
+
+    for key, geom_type, feats in result["env"]:
+        gdf_qgs = QgsVectorLayer(f"{geom_type}?crs=EPSG:4326", key, "memory")
+        prov = gdf_qgs.dataProvider()
+        prov.addAttributes([QgsField("osm_id", QVariant.String)])
+        gdf_qgs.updateFields()
+        prov.addFeatures(feats)
+        gdf_qgs.updateExtents()
+        QgsProject.instance().addMapLayer(gdf_qgs)
 
-    # 5. Warstwa QGIS na drogi
+    # 6. Warstwa QGIS na drogi
     temp_layer = QgsVectorLayer("LineString?crs=" + crs.authid(), f"Drogi transektu {buffer_id}", "memory")
     provider = temp_layer.dataProvider()
     provider.addAttributes([
@@ -158,39 +420,7 @@ def download_osm_roads_for_buffer(
         QgsField("score", QVariant.Double)
     ])
     temp_layer.updateFields()
-
-    features = []
-    for _, row in gdf_edges.iterrows():
-        highway_raw = row.get("highway", "")
-        try:
-            flat_values = flatten(highway_raw)
-            if not flat_values:
-                highway = ""
-            else:
-                highway = str(flat_values[0])
-        except Exception as e:
-            print(f"[ERROR] Failed to flatten highway value: {highway_raw} → {e}")
-            highway = "unknown"
-
-        geom = QgsGeometry.fromWkt(row["geometry"].wkt)
-        score = 0.0
-
-        # 6. Score — bliskość do każdej wybranej warstwy środowiskowej
-        for env_type, index in env_indexes.items():
-            nearest_ids = index.nearestNeighbor(geom.boundingBox().center(), 1)
-            if nearest_ids:
-                layer = env_layers[env_type]
-                nearest_feat = next(layer.getFeatures(QgsFeatureRequest(nearest_ids[0])))
-                dist = geom.distance(nearest_feat.geometry())
-                if dist < max_distance:
-                    score += 1 / (dist + 1)  # im bliżej, tym wyższy score
-
-        feat = QgsFeature()
-        feat.setGeometry(geom)
-        feat.setAttributes([str(highway), score])
-        features.append(feat)
-
-    provider.addFeatures(features)
+    provider.addFeatures(result["roads"])
     temp_layer.updateExtents()
 
     # 7. Stylizacja
@@ -203,5 +433,16 @@ def download_osm_roads_for_buffer(
     temp_layer.setRenderer(renderer)
 
     QgsProject.instance().addMapLayer(temp_layer)
-    iface.messageBar().pushMessage("OSM", f"Added roads for buffer {buffer_id}", level=Qgis.Info)
+    # Postęp pokazuje pasek BufferBatch — bez komunikatu na pasku dla każdego bufora
+    log.info(f"Added roads for buffer {buffer_id}")
+
 
+def download_osm_roads_for_buffer(
+        qgs_geometry, crs, iface, buffer_id, buffer_distance,
+        excluded_highway_types=None, environment_preferences=None, study_area=None, data_source=None
+):
+    result = process_buffer(
+        qgs_geometry, buffer_id, buffer_distance,
+        excluded_highway_types, environment_preferences, study_area, data_source
+    )
+    add_buffer_layers(result, crs, iface)
@@ -0,0 +1,236 @@
+# output_layers.py
+import hashlib
+import json
+import os
+
+from qgis.core import (
+    QgsVectorLayer, QgsVectorFileWriter, QgsProject, QgsFeature, QgsField, QgsFeatureRequest, QgsExpression,
+    QgsRendererCategory, QgsCategorizedSymbolRenderer, QgsLineSymbol, QgsFillSymbol, QgsMarkerSymbol
+)
+from PyQt5.QtCore import QVariant
+
+from . import log
+from .constants import road_styles, habitat_layers
+from .geometry_convert import to_qgs_geometry
+
+
+# Warstwy GeoPackage: nazwa -> (typ geometrii, pola, nazwa w projekcie)
+OUTPUT_LAYERS = {
+    "roads": ("LineString", [("buffer_id", QVariant.Int), ("highway", QVariant.String), ("score", QVariant.Double)],
+              "Drogi (wszystkie bufory)"),
+    "habitat_polygons": ("Polygon", [("buffer_id", QVariant.Int), ("habitat", QVariant.String),
+                                     ("osm_id", QVariant.String)], "Siedliska"),
+    "habitat_points": ("Point", [("buffer_id", QVariant.Int), ("habitat", QVariant.String),
+                                 ("osm_id", QVariant.String)], "Siedliska (punkty)"),
+    "routes": ("LineString", [("buffer_id", QVariant.Int), ("length_m", QVariant.Double)], "Trasy"),
+}
+# Tabela bez geometrii z odciskami przetworzonych punktów (nie jest dodawana do projektu)
+STATE_LAYER = ("buffers", "None", [("buffer_id", QVariant.Int), ("fingerprint", QVariant.String)])
+
+# Kolory siedlisk (klucze z osm_tools.habitat_layers)
+habitat_styles = {
+    'landuse_forest': '0,128,0,120',
+    'natural_water': '0,90,255,120',
+    'natural_cave_entrance': '128,64,0',
+}
+
+
+def fingerprint(point_geometry, buffer_distance, *params):
+    """
+    Odcisk punktu wejściowego: geometria (QgsGeometry), promień bufora i parametry
+    przetwarzania (dowolne wartości serializowalne do JSON, np. wykluczone typy dróg).
+    """
+    payload = json.dumps([float(buffer_distance), params], sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(bytes(point_geometry.asWkb()) + payload).hexdigest()
+
+
+class GeoPackageOutput:
+    """
+    Zapisuje wyniki wszystkich buforów do kilku warstw jednego GeoPackage
+    (drogi, siedliska poligonowe i punktowe, trasy) z polem buffer_id,
+    zamiast tworzyć osobne warstwy tymczasowe dla każdego bufora.
+
+    Warstwy mają indeks przestrzenny (R-tree GeoPackage) i po jednym
+    rendererze kategoryzowanym. Obiekty są dopisywane bezpośrednio przez
+    dostawcę danych, więc metody trzeba wołać w wątku głównym (np. z
+    BufferBatch po zakończeniu zadania). Geometrie są w EPSG:4326.
+
+    Tabela buffers przechowuje odciski (fingerprint) przetworzonych punktów,
+    więc przy ponownym uruchomieniu z tym samym plikiem przetwarzane są tylko
+    punkty nowe, przesunięte albo z innymi parametrami (sync).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.layers = {}
+        self._pending = {}
+
+    def open(self, overwrite=False):
+        """
+        Otwiera istniejące (albo z overwrite=True tworzy od nowa) warstwy i dodaje je do projektu.
+        """
+        name, geom_type, fields = STATE_LAYER
+        uri = f"{self.path}|layername={name}"
+        layer = QgsVectorLayer(uri, name, "ogr") if not overwrite else None
+        if layer is None or not layer.isValid():
+            self._create_layer(name, geom_type, fields)
+            layer = QgsVectorLayer(uri, name, "ogr")
+        if not layer.isValid():
+            raise RuntimeError(f"Nie można otworzyć warstwy {name} w {self.path}")
+        self.layers[name] = layer
+
+        for name, (geom_type, fields, title) in OUTPUT_LAYERS.items():
+            uri = f"{self.path}|layername={name}"
+            for existing in list(QgsProject.instance().mapLayers().values()):
+                if existing.source() == uri:
+                    QgsProject.instance().removeMapLayer(existing.id())
+
+            layer = QgsVectorLayer(uri, title, "ogr") if not overwrite else None
+            if layer is None or not layer.isValid():
+                self._create_layer(name, geom_type, fields)
+                layer = QgsVectorLayer(uri, title, "ogr")
+            if not layer.isValid():
+                raise RuntimeError(f"Nie można otworzyć warstwy {name} w {self.path}")
+
+            self._style(name, layer)
+            QgsProject.instance().addMapLayer(layer)
+            self.layers[name] = layer
+        return self
+
+    def _create_layer(self, name, geom_type, fields):
+        template = QgsVectorLayer(f"{geom_type}?crs=EPSG:4326" if geom_type != "None" else "None", name, "memory")
+        template.dataProvider().addAttributes([QgsField(field, field_type) for field, field_type in fields])
+        template.updateFields()
+
+        options = QgsVectorFileWriter.SaveVectorOptions()
+        options.driverName = "GPKG"
+        options.layerName = name
+        options.layerOptions = ["SPATIAL_INDEX=YES"] if geom_type != "None" else []
+        options.actionOnExistingFile = (QgsVectorFileWriter.CreateOrOverwriteLayer if os.path.exists(self.path)
+                                        else QgsVectorFileWriter.CreateOrOverwriteFile)
+        error = QgsVectorFileWriter.writeAsVectorFormatV2(
+            template, self.path, QgsProject.instance().transformContext(), options)
+        if error[0] != QgsVectorFileWriter.NoError:
+            raise RuntimeError(f"Nie można utworzyć warstwy {name} w {self.path}: {error[1]}")
+
+    def _style(self, name, layer):
+        if name == "roads":
+            categories = [QgsRendererCategory(road_type, QgsLineSymbol.createSimple({"color": color, "width": "0.8"}),
+                                              road_type)
+                          for road_type, color in road_styles.items()]
+            layer.setRenderer(QgsCategorizedSymbolRenderer("highway", categories))
+        elif name == "habitat_polygons":
+            categories = [QgsRendererCategory(key, QgsFillSymbol.createSimple({"color": color, "outline_style": "no"}),
+                                              key)
+                          for key, color in habitat_styles.items() if habitat_layers[key][2] == "Polygon"]
+            layer.setRenderer(QgsCategorizedSymbolRenderer("habitat", categories))
+        elif name == "habitat_points":
+            categories = [QgsRendererCategory(key, QgsMarkerSymbol.createSimple({"color": color, "size": "2.5"}), key)
+                          for key, color in habitat_styles.items() if habitat_layers[key][2] == "Point"]
+            layer.setRenderer(QgsCategorizedSymbolRenderer("habitat", categories))
+        elif name == "routes":
+            layer.renderer().setSymbol(QgsLineSymbol.createSimple({"color": "orange", "width": "1.2"}))
+
+    def _feature(self, name, geometry=None, **values):
+        """
+        Nowy obiekt warstwy name z atrybutami ustawianymi po nazwie pola —
+        warstwy GeoPackage otwarte przez OGR mają na pozycji 0 pole fid,
+        więc atrybutów nie można podawać po kolei.
+        """
+        feat = QgsFeature(self.layers[name].fields())
+        if geometry is not None:
+            feat.setGeometry(geometry)
+        for field, value in values.items():
+            feat.setAttribute(field, value)
+        return feat
+
+    def _add(self, name, features):
+        layer = self.layers[name]
+        if features and not layer.dataProvider().addFeatures(features)[0]:
+            log.error(f"Nie udało się zapisać obiektów do warstwy {name}")
+            return False
+        return True
+
+    def add_buffer_result(self, result):
+        """
+        Dopisuje drogi i siedliska bufora z wyniku osm_tools.process_buffer.
+        Zwraca False, gdy zapis się nie udał albo bufor nie ma dróg — wtedy
+        obiekty bufora są usuwane, a jego odcisk nie jest zapisywany, więc
+        przy następnym uruchomieniu bufor zostanie przetworzony ponownie.
+        """
+        buffer_id = result["buffer_id"]
+        buffer_fingerprint = self._pending.pop(buffer_id, None)
+
+        # Obiekty z process_buffer mają atrybuty po kolei: (highway, score) i (osm_id,)
+        roads = []
+        for feat in result["roads"]:
+            highway, score = feat.attributes()
+            roads.append(self._feature("roads", feat.geometry(), buffer_id=buffer_id, highway=highway, score=score))
+        written = self._add("roads", roads)
+
+        for key, geom_type, feats in result["env"]:
+            name = "habitat_points" if geom_type == "Point" else "habitat_polygons"
+            habitats = [self._feature(name, feat.geometry(), buffer_id=buffer_id, habitat=key,
+                                      osm_id=feat.attributes()[0])
+                        for feat in feats]
+            written = self._add(name, habitats) and written
+
+        if not written or not result["roads"]:
+            if not result["roads"]:
+                log.warning(f"Bufor {buffer_id} → brak dróg, zostanie przetworzony ponownie")
+            self.remove_buffer(buffer_id)  # bez częściowych wyników, które po ponowieniu by się zdublowały
+            return False
+        if buffer_fingerprint is not None:
+            state = self._feature("buffers", buffer_id=buffer_id, fingerprint=buffer_fingerprint)
+            if not self._add("buffers", [state]):
+                self.remove_buffer(buffer_id)
+                return False
+        return True
+
+    def add_route(self, buffer_id, geometry, length):
+        """
+        Dopisuje trasę (geometria Shapely) wyznaczoną dla bufora.
+        """
+        self._add("routes", [self._feature("routes", to_qgs_geometry(geometry), buffer_id=buffer_id,
+                                           length_m=length)])
+
+    def fingerprints(self):
+        """
+        Odciski przetworzonych punktów: {buffer_id: fingerprint}.
+        """
+        return {f["buffer_id"]: f["fingerprint"] for f in self.layers["buffers"].getFeatures()}
+
+    def sync(self, fingerprints):
+        """
+        Porównuje odciski bieżących punktów ({buffer_id: fingerprint}) z zapisanymi.
+        Usuwa wyniki punktów usuniętych i zmienionych i zwraca identyfikatory
+        buforów do przetworzenia (nowe i zmienione).
+        """
+        stored = self.fingerprints()
+        for buffer_id, stored_fingerprint in stored.items():
+            if fingerprints.get(buffer_id) != stored_fingerprint:
+                self.remove_buffer(buffer_id)
+
+        changed = [buffer_id for buffer_id, value in fingerprints.items() if stored.get(buffer_id) != value]
+        self._pending = {buffer_id: fingerprints[buffer_id] for buffer_id in changed}
+        log.info(f"GeoPackage {self.path}: {len(changed)} punktów do przetworzenia, "
+                 f"{len(set(stored) - set(fingerprints))} usuniętych, "
+                 f"{len(fingerprints) - len(changed)} bez zmian")
+        return changed
+
+    def remove_buffer(self, buffer_id):
+        """
+        Usuwa ze wszystkich warstw (także z tabeli odcisków) obiekty bufora.
+        """
+        request = QgsFeatureRequest().setFilterExpression(
+            QgsExpression.createFieldEqualityExpression("buffer_id", buffer_id))
+        request.setNoAttributes().setFlags(QgsFeatureRequest.NoGeometry)
+        for layer in self.layers.values():
+            ids = [f.id() for f in layer.getFeatures(request)]
+            if ids:
+                layer.dataProvider().deleteFeatures(ids)
+
+    def refresh(self):
+        for layer in self.layers.values():
+            layer.updateExtents()
+            layer.triggerRepaint()
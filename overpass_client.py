@@ -0,0 +1,154 @@
+# overpass_client.py
+import os
+import random
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import instrumentation
+from . import log
+
+
+DEFAULT_ENDPOINT = "https://overpass-api.de/api/interpreter"
+# Adres serwera (np. lokalnego mirrora) ustawiany zmienną środowiskową
+ENDPOINT_ENV = "BAT_TRANSECTS_OVERPASS_URL"
+# Publiczne serwery Overpass przydzielają ok. 2 sloty na adres IP
+DEFAULT_MAX_CONCURRENT = 2
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF = 2.0  # s, podwajane przy każdej próbie
+MAX_BACKOFF = 120.0  # s
+DEFAULT_TIMEOUT = 180  # s, także limit [timeout:] zapytania
+RETRY_STATUS = (429, 502, 503, 504)
+USER_AGENT = "bat_transect_plugin (QGIS)"
+
+
+class OverpassError(RuntimeError):
+    pass
+
+
+class OverpassClient:
+    """
+    Klient Overpass API dla wielu wątków (zadania QgsTask).
+
+    Jedna sesja requests (pula połączeń HTTP wielokrotnego użytku), co
+    najwyżej max_concurrent zapytań naraz (semafor wspólny dla wszystkich
+    wątków), przed zapytaniem sprawdzany jest /status serwera — przy braku
+    wolnego slotu klient czeka tyle, ile podaje serwer. Odpowiedzi 429/50x,
+    błędy połączenia i błędy wykonania zgłaszane przez Overpass w treści
+    odpowiedzi są ponawiane z wykładniczym odstępem (z losowym rozrzutem).
+    Serwery bez /status (np. lokalny mirror) są obsługiwane bez tej kontroli.
+    """
+
+    def __init__(self, endpoint=None, max_concurrent=DEFAULT_MAX_CONCURRENT, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff=DEFAULT_BACKOFF, timeout=DEFAULT_TIMEOUT):
+        self.endpoint = endpoint or os.environ.get(ENDPOINT_ENV) or DEFAULT_ENDPOINT
+        self.max_concurrent = max_concurrent
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(max_concurrent, 1))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._slots = threading.BoundedSemaphore(max(max_concurrent, 1))
+        self._status_url = self.endpoint.rsplit("/", 1)[0] + "/status"
+        self._has_status = True
+
+    def query(self, ql):
+        """
+        Wykonuje zapytanie Overpass QL i zwraca treść odpowiedzi (bytes).
+        Do zapytania dopisywany jest nagłówek [timeout:...], jeśli go nie ma.
+        """
+        if "[timeout:" not in ql:
+            ql = f"[timeout:{self.timeout}];" + ql
+
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                delay = min(MAX_BACKOFF, self.backoff * 2 ** (attempt - 1)) * (1 + random.random() / 2)
+                log.debug(f"Overpass: ponowienie {attempt}/{self.max_retries} za {delay:.1f} s ({last_error})")
+                instrumentation.count("overpass_retries")
+                time.sleep(delay)
+
+            with self._slots:
+                self._wait_for_slot()
+                try:
+                    with instrumentation.stage("overpass_request"):
+                        response = self.session.post(self.endpoint, data={"data": ql}, timeout=self.timeout + 30)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    last_error = e
+                    continue
+            instrumentation.count("overpass_requests")
+            # Pobrane bajty liczone przy każdej odpowiedzi (także ponawianej) — niezależnie od zapisu do cache
+            instrumentation.count("overpass_bytes", len(response.content))
+
+            if response.status_code in RETRY_STATUS:
+                last_error = f"HTTP {response.status_code}"
+                continue
+            if response.status_code != 200:
+                raise OverpassError(f"Overpass HTTP {response.status_code}: {response.text[:200]}")
+
+            # Przekroczenie limitu czasu/pamięci po stronie serwera: 200 z komunikatem w <remark>
+            remark = re.search(rb"<remark>\s*(runtime (?:error|remark):[^<]*)</remark>", response.content[-2000:])
+            if remark is not None:
+                last_error = remark.group(1).decode("utf-8", "replace").strip()
+                continue
+            return response.content
+
+        raise OverpassError(f"Overpass nie odpowiedział po {self.max_retries + 1} próbach: {last_error}")
+
+    def _wait_for_slot(self):
+        """
+        Czeka, aż serwer zgłosi wolny slot (wg /status). Bez limitu albo bez /status — od razu.
+        """
+        while self._has_status:
+            try:
+                status = self.session.get(self._status_url, timeout=30)
+            except requests.RequestException:
+                return
+            if status.status_code != 200 or "Rate limit" not in status.text:
+                self._has_status = False
+                return
+
+            limit = re.search(r"Rate limit: (\d+)", status.text)
+            available = re.search(r"(\d+) slots? available now", status.text)
+            if (limit and int(limit.group(1)) == 0) or (available and int(available.group(1)) > 0):
+                return
+            waits = [int(s) for s in re.findall(r"in (-?\d+) seconds", status.text)]
+            pause = max(min(waits), 1) if waits else DEFAULT_BACKOFF
+            log.debug(f"Overpass: brak wolnego slotu, czekam {pause} s")
+            instrumentation.count("overpass_slot_waits")
+            time.sleep(pause)
+
+    def query_many(self, queries):
+        """
+        Wykonuje kilka zapytań równolegle (do max_concurrent naraz) i zwraca odpowiedzi w tej samej kolejności.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        if len(queries) <= 1:
+            return [self.query(q) for q in queries]
+        with ThreadPoolExecutor(max_workers=self.max_concurrent) as pool:
+            return list(pool.map(self.query, queries))
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(endpoint=None):
+    """
+    Zwraca klienta dla adresu serwera (domyślnie z BAT_TRANSECTS_OVERPASS_URL albo publicznego).
+    Klienci są współdzieleni, więc limit równoległych zapytań obowiązuje całą wtyczkę.
+    """
+    endpoint = endpoint or os.environ.get(ENDPOINT_ENV) or DEFAULT_ENDPOINT
+    with _clients_lock:
+        if endpoint not in _clients:
+            _clients[endpoint] = OverpassClient(endpoint)
+        return _clients[endpoint]
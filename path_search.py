@@ -0,0 +1,200 @@
+# path_search.py
+import heapq
+from bisect import bisect_left
+
+import numpy as np
+
+from . import instrumentation
+from . import log
+from .csr_graph import CSRGraph
+
+
+CANCEL_CHECK_INTERVAL = 1024
+# Domyślny limit rozwiniętych etykiet — zabezpieczenie przed zawieszeniem na bardzo dużych warstwach
+DEFAULT_MAX_LABELS = 2_000_000
+
+
+def find_min_length_path(G, min_length=500.0, weight="weight", length="length", max_labels=DEFAULT_MAX_LABELS,
+                         feedback=None):
+    """
+    Szuka najtańszej ścieżki prostej w grafie G (CSRGraph albo networkx)
+    o długości co najmniej min_length.
+
+    Dijkstra na etykietach (koszt, długość, węzły ścieżki): etykiety ze
+    wszystkich węzłów startowych trafiają do jednej kolejki priorytetowej
+    uporządkowanej kosztem (atrybut `weight`). Ścieżki osiągające min_length
+    nie trafiają do kolejki, tylko aktualizują najlepszy wynik; przeszukiwanie
+    kończy się, gdy najtańsza etykieta w kolejce nie jest już tańsza od tego
+    wyniku. Odrzucane są też etykiety, których koszt powiększony o dolne
+    ograniczenie kosztu brakującej długości (najtańsze krawędzie grafu o tej
+    łącznej długości — ścieżka prosta nie użyje krawędzi dwa razy) nie może
+    już poprawić wyniku. Przedłużenie nie może wracać do węzła już leżącego
+    na ścieżce etykiety.
+
+    Przeszukiwanie ma dwa przebiegi:
+
+    1. Szybki: etykieta jest odrzucana, gdy w jej węźle rozwinięto już
+       etykietę nie krótszą (atrybut `length`). Daje dobrą ścieżkę, ale nie
+       zawsze optymalną — jedyne przedłużenie odrzuconej etykiety może
+       prowadzić przez węzły dominującej.
+    2. Dokładny, z kosztem z pierwszego przebiegu jako ograniczeniem:
+       etykieta jest odrzucana tylko wtedy, gdy w jej węźle rozwinięto już
+       nie droższą i nie krótszą etykietę o tym samym zbiorze węzłów ścieżki
+       (inna kolejność tych samych węzłów) — obie mają wtedy te same
+       dozwolone przedłużenia. Przy nieujemnych wagach wynik jest optymalny.
+       Ogólniejsza dominacja (zbiór węzłów dominującej zawarty w zbiorze
+       zdominowanej) prawie nic nie odrzuca, a jej sprawdzanie kosztuje
+       więcej niż rozwinięcie etykiety.
+
+    max_labels ogranicza łączną liczbę rozwiniętych etykiet (None = bez
+    limitu). Po przekroczeniu limitu zwracany jest najlepszy dotychczasowy
+    wynik — może nie być optymalny, co jest zapisywane w logu i liczniku
+    path_search_truncated. Tak samo po anulowaniu przez feedback (QgsFeedback /
+    QgsTask), sprawdzanym co CANCEL_CHECK_INTERVAL etykiet, żeby pętla nie
+    wołała Qt przy każdej.
+
+    Zwraca krotkę (lista węzłów, koszt, długość) albo None, gdy ścieżki brak.
+    """
+    nodes = None
+    if not isinstance(G, CSRGraph):
+        nodes = list(G.nodes())
+        G = CSRGraph.from_networkx(G, weight=weight, attrs=(length,))
+    zeros = np.zeros(G.number_of_edges())
+    edge_weight = G.edge_attrs.get(weight, zeros)
+    edge_length = G.edge_attrs.get(length, zeros)
+
+    # Listy sąsiedztwa (sąsiad, koszt, długość) z tablic CSR — szybsze w pętli od indeksowania NumPy
+    targets = G.indices.tolist()
+    costs = edge_weight[G.edge_of].tolist()
+    steps = edge_length[G.edge_of].tolist()
+    bounds = G.indptr.tolist()
+    adjacency = [list(zip(targets[a:b], costs[a:b], steps[a:b])) for a, b in zip(bounds, bounds[1:])]
+    remaining_cost = _remaining_cost_bound(edge_weight, edge_length)
+
+    best, expanded, truncated = _label_search(
+        adjacency, min_length, remaining_cost, None, False, max_labels, feedback)
+    if not truncated:
+        budget = max_labels - expanded if max_labels is not None else None
+        best, more, truncated = _label_search(
+            adjacency, min_length, remaining_cost, best, True, budget, feedback)
+        expanded += more
+
+    instrumentation.count("path_labels_expanded", expanded)
+    if truncated:
+        instrumentation.count("path_search_truncated")
+        log.warning(f"Wyszukiwanie ścieżki ≥ {min_length:g} m przerwane po {expanded} etykietach — "
+                    + ("wynik może nie być optymalny" if best is not None else "ścieżki nie znaleziono"))
+    if best is None:
+        return None
+
+    best_cost, best_dist, path = best
+    if nodes is not None:
+        path = [nodes[i] for i in path]
+    return path, best_cost, best_dist
+
+
+def _remaining_cost_bound(edge_weight, edge_length):
+    """
+    Funkcja r → dolne ograniczenie kosztu dowolnej ścieżki prostej o długości r:
+    koszt r metrów z najtańszych (na metr) krawędzi grafu.
+    """
+    positive = edge_length > 0
+    rates = edge_weight[positive] / edge_length[positive]
+    order = np.argsort(rates, kind="stable")
+    rates = rates[order].tolist()
+    cum_length = np.cumsum(edge_length[positive][order]).tolist()
+    cum_cost = np.cumsum(edge_weight[positive][order]).tolist()
+    if not rates:
+        return lambda missing: 0.0
+
+    def remaining_cost(missing):
+        i = bisect_left(cum_length, missing)
+        if i == len(cum_length):
+            return cum_cost[-1]
+        before = cum_length[i - 1] if i else 0.0
+        return (cum_cost[i - 1] if i else 0.0) + rates[i] * (missing - before)
+    return remaining_cost
+
+
+def _label_search(adjacency, min_length, remaining_cost, best, exact, max_labels, feedback):
+    """
+    Jeden przebieg find_min_length_path. best to wynik (koszt, długość, węzły)
+    do poprawienia albo None. Zwraca (wynik, rozwinięte etykiety, czy przerwano).
+    """
+    n = len(adjacency)
+    best_cost = best[0] if best is not None else float('inf')
+    best_label = None
+
+    # Etykiety są zdejmowane w kolejności kosztu, więc rozwinięte są nie droższe od
+    # sprawdzanych później. Dokładny przebieg: {węzły ścieżki: długość} w każdym węźle,
+    # szybki: tylko największa rozwinięta długość
+    settled = [{} for _ in range(n)] if exact else [-1.0] * n
+
+    # Etykiety w tablicach równoległych: długość, węzeł, rodzic (koszt jest w kolejce)
+    label_dist = [0.0] * n
+    label_node = list(range(n))
+    label_parent = [-1] * n
+    heap = [(0.0, i) for i in range(n)]
+
+    expanded = 0
+    truncated = False
+    while heap:
+        cost, label_id = heapq.heappop(heap)
+        if cost >= best_cost:
+            break
+
+        u = label_node[label_id]
+        dist = label_dist[label_id]
+        if not exact and settled[u] >= dist:
+            continue  # zdominowana przez tańszą, co najmniej tak samo długą etykietę
+        path_nodes = set()
+        p = label_id
+        while p != -1:
+            path_nodes.add(label_node[p])
+            p = label_parent[p]
+        if exact:
+            path_nodes = frozenset(path_nodes)
+            if settled[u].get(path_nodes, -1.0) >= dist:
+                continue  # te same węzły w innej kolejności, nie taniej i nie dłużej
+            settled[u][path_nodes] = dist
+        else:
+            settled[u] = dist
+
+        expanded += 1
+        if max_labels is not None and expanded > max_labels:
+            truncated = True
+            break
+        if feedback is not None and expanded % CANCEL_CHECK_INTERVAL == 0 and feedback.isCanceled():
+            truncated = True
+            break
+
+        for v, w, l in adjacency[u]:
+            if v in path_nodes:
+                continue  # ścieżka prosta
+            new_cost = cost + w
+            if new_cost >= best_cost:
+                continue
+            new_dist = dist + l
+            if new_dist >= min_length:
+                best_cost = new_cost
+                best_label = (new_dist, v, label_id)
+                continue
+            if new_cost + remaining_cost(min_length - new_dist) >= best_cost:
+                continue
+            if not exact and settled[v] >= new_dist:
+                continue
+            label_dist.append(new_dist)
+            label_node.append(v)
+            label_parent.append(label_id)
+            heapq.heappush(heap, (new_cost, len(label_node) - 1))
+
+    if best_label is None:
+        return best, expanded, truncated
+
+    best_dist, last, parent = best_label
+    path = [last]
+    while parent != -1:
+        path.append(label_node[parent])
+        parent = label_parent[parent]
+    path.reverse()
+    return (best_cost, best_dist, path), expanded, truncated
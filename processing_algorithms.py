@@ -0,0 +1,439 @@
+# processing_algorithms.py
+from qgis.core import (
+    QgsProcessing,
+    QgsProcessingAlgorithm,
+    QgsProcessingException,
+    QgsProcessingMultiStepFeedback,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterFeatureSink,
+    QgsProcessingParameterField,
+    QgsProcessingParameterFile,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterVectorLayer,
+    QgsProcessingUtils,
+    QgsCoordinateReferenceSystem,
+    QgsCoordinateTransform,
+    QgsFeature,
+    QgsFeatureSink,
+    QgsField,
+    QgsFields,
+    QgsUnitTypes,
+    QgsWkbTypes,
+)
+from qgis.PyQt.QtCore import QCoreApplication, QVariant
+
+from . import dependencies
+from . import log
+from .constants import road_styles, habitat_layers, DEFAULT_TIME_BUDGET
+
+
+WGS84 = QgsCoordinateReferenceSystem("EPSG:4326")
+
+# Typy dróg, które można wykluczyć (jak w oknie wtyczki)
+HIGHWAY_TYPES = list(road_styles)
+# Preferencje środowiskowe (wartości z constants.habitat_layers)
+HABITAT_TYPES = list(dict.fromkeys(env_type for _, env_type, _ in habitat_layers.values()))
+
+
+def _to_crs(layer, crs, context, feedback):
+    """
+    Zwraca warstwę w układzie crs — bez zmian albo przeprojektowaną algorytmem
+    native:reprojectlayer. Długości i dopasowanie do grafu dróg działają w układzie
+    warstwy, ale końce transektów muszą być w tym samym układzie co drogi.
+    """
+    if layer.crs() == crs:
+        return layer
+    import processing
+    result = processing.run("native:reprojectlayer", {
+        "INPUT": layer,
+        "TARGET_CRS": crs,
+        "OUTPUT": "TEMPORARY_OUTPUT",
+    }, context=context, feedback=feedback, is_child_algorithm=True)
+    return QgsProcessingUtils.mapLayerFromString(result["OUTPUT"], context)
+
+
+class BatTransectsAlgorithm(QgsProcessingAlgorithm):
+
+    def tr(self, string):
+        return QCoreApplication.translate("Processing", string)
+
+    def createInstance(self):
+        return type(self)()
+
+    def group(self):
+        return self.tr("Transekty")
+
+    def groupId(self):
+        return "transects"
+
+    def prepareAlgorithm(self, parameters, context, feedback):
+        # Rejestracja algorytmów nie ładuje osmnx/geopandas — zależności są sprawdzane dopiero przy uruchomieniu
+        message = dependencies.problems_message()
+        if message is not None:
+            raise QgsProcessingException(message)
+        return True
+
+
+class BufferRoadsAlgorithm(BatTransectsAlgorithm):
+    """
+    Bufory wokół punktów, pobranie dróg i siedlisk z OSM oraz score dróg.
+    """
+
+    INPUT = "INPUT"
+    BUFFER_DISTANCE = "BUFFER_DISTANCE"
+    EXCLUDED_TYPES = "EXCLUDED_TYPES"
+    HABITATS = "HABITATS"
+    MAX_DISTANCE = "MAX_DISTANCE"
+    DATA_SOURCE = "DATA_SOURCE"
+    STUDY_AREA = "STUDY_AREA"
+    OUTPUT_BUFFERS = "OUTPUT_BUFFERS"
+    OUTPUT_ROADS = "OUTPUT_ROADS"
+
+    def name(self):
+        return "bufferroads"
+
+    def displayName(self):
+        return self.tr("Bufory i drogi OSM ze score")
+
+    def shortHelpString(self):
+        return self.tr(
+            "Tworzy bufory wokół punktów, pobiera dla nich drogi i siedliska z OSM "
+            "(albo z lokalnego pliku) i liczy score dróg według bliskości siedlisk. "
+            "Wyniki są w EPSG:4326; drogi mają pole buffer_id."
+        )
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterVectorLayer(
+            self.INPUT, self.tr("Punkty"), [QgsProcessing.TypeVectorPoint]))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.BUFFER_DISTANCE, self.tr("Promień bufora (m)"),
+            QgsProcessingParameterNumber.Double, 500.0, minValue=1.0))
+        self.addParameter(QgsProcessingParameterEnum(
+            self.EXCLUDED_TYPES, self.tr("Wyklucz typy dróg"), HIGHWAY_TYPES,
+            allowMultiple=True, optional=True, defaultValue=[]))
+        self.addParameter(QgsProcessingParameterEnum(
+            self.HABITATS, self.tr("Siedliska"), HABITAT_TYPES,
+            allowMultiple=True, defaultValue=list(range(len(HABITAT_TYPES)))))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.MAX_DISTANCE, self.tr("Maksymalna odległość od siedliska (m)"),
+            QgsProcessingParameterNumber.Double, 100.0, minValue=0.0))
+        self.addParameter(QgsProcessingParameterFile(
+            self.DATA_SOURCE, self.tr("Lokalne dane OSM (.osm, .pbf, .gpkg)"), optional=True))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.STUDY_AREA, self.tr("Pobierz dane OSM jednorazowo dla całego obszaru"), True))
+        self.addParameter(QgsProcessingParameterFeatureSink(
+            self.OUTPUT_BUFFERS, self.tr("Bufory"), QgsProcessing.TypeVectorPolygon))
+        self.addParameter(QgsProcessingParameterFeatureSink(
+            self.OUTPUT_ROADS, self.tr("Drogi"), QgsProcessing.TypeVectorLine))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        from . import osm_sources
+        from . import osm_tools
+
+        layer = self.parameterAsVectorLayer(parameters, self.INPUT, context)
+        if layer is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.INPUT))
+        buffer_distance = self.parameterAsDouble(parameters, self.BUFFER_DISTANCE, context)
+        excluded_types = [HIGHWAY_TYPES[i] for i in self.parameterAsEnums(parameters, self.EXCLUDED_TYPES, context)]
+        habitats = [HABITAT_TYPES[i] for i in self.parameterAsEnums(parameters, self.HABITATS, context)]
+        environment_preferences = {env_type: env_type in habitats for env_type in HABITAT_TYPES}
+        environment_preferences['max_distance'] = self.parameterAsDouble(parameters, self.MAX_DISTANCE, context)
+
+        try:
+            data_source = osm_sources.get_source(self.parameterAsFile(parameters, self.DATA_SOURCE, context))
+        except (FileNotFoundError, ValueError) as e:
+            raise QgsProcessingException(str(e))
+
+        buffer_fields = QgsFields()
+        buffer_fields.append(QgsField("id", QVariant.Int))
+        buffer_sink, buffer_dest = self.parameterAsSink(
+            parameters, self.OUTPUT_BUFFERS, context, buffer_fields, QgsWkbTypes.Polygon, WGS84)
+
+        road_fields = QgsFields()
+        road_fields.append(QgsField("buffer_id", QVariant.Int))
+        road_fields.append(QgsField("highway", QVariant.String))
+        road_fields.append(QgsField("score", QVariant.Double))
+        road_sink, road_dest = self.parameterAsSink(
+            parameters, self.OUTPUT_ROADS, context, road_fields, QgsWkbTypes.LineString, WGS84)
+
+        # Bufory w układzie metrycznym, zapisywane w EPSG:4326
+        source_crs = layer.crs()
+        crs_is_metric = source_crs.mapUnits() == QgsUnitTypes.DistanceMeters
+        buffer_crs = source_crs if crs_is_metric else QgsCoordinateReferenceSystem("EPSG:3857")
+        transform_to_buffer = QgsCoordinateTransform(source_crs, buffer_crs, context.transformContext())
+        transform_to_wgs84 = QgsCoordinateTransform(buffer_crs, WGS84, context.transformContext())
+
+        buffers = []
+        for feature in layer.getFeatures():
+            geom = feature.geometry()
+            if geom.isEmpty():
+                continue
+            # Identyfikator obiektu jak w oknie wtyczki (main.py), nie numer kolejny
+            buffer_id = feature.id()
+            geom.transform(transform_to_buffer)
+            buffer_geom = geom.buffer(buffer_distance, 16)
+            buffer_geom.transform(transform_to_wgs84)
+
+            new_feature = QgsFeature(buffer_fields)
+            new_feature.setGeometry(buffer_geom)
+            new_feature.setAttributes([buffer_id])
+            buffer_sink.addFeature(new_feature, QgsFeatureSink.FastInsert)
+            buffers.append((buffer_id, buffer_geom))
+
+        study_area = None
+        if self.parameterAsBoolean(parameters, self.STUDY_AREA, context) and buffers:
+            feedback.pushInfo(self.tr("Pobieranie danych OSM dla całego obszaru badań..."))
+            try:
+                study_area = osm_tools.download_osm_study_area(
+                    [g for _, g in buffers],
+                    env_margin=osm_tools.parse_max_distance(environment_preferences),
+                    data_source=data_source
+                )
+            except Exception as e:
+                # Bez obszaru badań każdy bufor pobiera dane osobno
+                feedback.reportError(f"Pobieranie obszaru badań nie powiodło się → {e}")
+
+        for index, (buffer_id, buffer_geom) in enumerate(buffers):
+            if feedback.isCanceled():
+                break
+            try:
+                result = osm_tools.process_buffer(
+                    buffer_geom, buffer_id, buffer_distance, excluded_types, environment_preferences,
+                    study_area=study_area, data_source=data_source,
+                    task=log.Progress(feedback, index / len(buffers) * 100, (index + 1) / len(buffers) * 100)
+                )
+            except Exception as e:
+                feedback.reportError(f"Bufor {buffer_id} → {e}")
+                continue
+            if result is None:
+                break
+
+            for feat in result["roads"]:
+                feat.setFields(road_fields, False)
+                feat.setAttributes([buffer_id] + feat.attributes())
+            road_sink.addFeatures(result["roads"], QgsFeatureSink.FastInsert)
+
+        return {self.OUTPUT_BUFFERS: buffer_dest, self.OUTPUT_ROADS: road_dest}
+
+
+class MinLengthPathAlgorithm(BatTransectsAlgorithm):
+    """
+    Najtańsza ścieżka o zadanej minimalnej długości w sieci dróg każdego bufora.
+    """
+
+    INPUT = "INPUT"
+    GROUP_FIELD = "GROUP_FIELD"
+    MIN_LENGTH = "MIN_LENGTH"
+    PREFER_SCORE = "PREFER_SCORE"
+    OUTPUT = "OUTPUT"
+
+    def name(self):
+        return "minlengthpath"
+
+    def displayName(self):
+        return self.tr("Transekt o minimalnej długości")
+
+    def shortHelpString(self):
+        return self.tr(
+            "Szuka w sieci dróg najtańszej ścieżki o długości co najmniej zadanej "
+            "(domyślnie 500 m). Z polem grupowania (np. buffer_id) ścieżka jest "
+            "szukana osobno dla każdej grupy. Wyższy score obniża koszt drogi."
+        )
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterVectorLayer(
+            self.INPUT, self.tr("Drogi"), [QgsProcessing.TypeVectorLine]))
+        self.addParameter(QgsProcessingParameterField(
+            self.GROUP_FIELD, self.tr("Pole grupowania (bufor)"), "buffer_id", self.INPUT, optional=True))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.MIN_LENGTH, self.tr("Minimalna długość (m)"),
+            QgsProcessingParameterNumber.Double, 500.0, minValue=1.0))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.PREFER_SCORE, self.tr("Preferuj drogi z wyższym score"), True))
+        self.addParameter(QgsProcessingParameterFeatureSink(
+            self.OUTPUT, self.tr("Transekty"), QgsProcessing.TypeVectorLine))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        from . import routing_tools
+        from .geometry_convert import to_qgs_geometry
+
+        layer = self.parameterAsVectorLayer(parameters, self.INPUT, context)
+        if layer is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.INPUT))
+        min_length = self.parameterAsDouble(parameters, self.MIN_LENGTH, context)
+        prefer_score = self.parameterAsBoolean(parameters, self.PREFER_SCORE, context)
+        group_field = self.parameterAsString(parameters, self.GROUP_FIELD, context)
+        if group_field and layer.fields().indexOf(group_field) < 0:
+            group_field = ""
+
+        fields = QgsFields()
+        if group_field:
+            fields.append(layer.fields().field(group_field))
+        fields.append(QgsField("length_m", QVariant.Double))
+        sink, dest = self.parameterAsSink(
+            parameters, self.OUTPUT, context, fields, QgsWkbTypes.MultiLineString, layer.crs())
+
+        for value, result in routing_tools.min_length_paths_by_group(
+                layer, group_field, prefer_score=prefer_score, min_length=min_length, feedback=feedback):
+            if not result:
+                feedback.pushInfo(f"Grupa {value}: nie znaleziono ścieżki ≥ {int(min_length)} m")
+                continue
+            merged, path_length = result
+            feat = QgsFeature(fields)
+            geom = to_qgs_geometry(merged)
+            geom.convertToMultiType()
+            feat.setGeometry(geom)
+            feat.setAttributes(([value] if group_field else []) + [path_length])
+            sink.addFeature(feat, QgsFeatureSink.FastInsert)
+
+        return {self.OUTPUT: dest}
+
+
+class ConnectTransectsAlgorithm(BatTransectsAlgorithm):
+    """
+    Łączy transekty w jedną trasę po sieci dróg.
+    """
+
+    INPUT = "INPUT"
+    ROADS = "ROADS"
+    TIME_BUDGET = "TIME_BUDGET"
+    OUTPUT = "OUTPUT"
+
+    def name(self):
+        return "connecttransects"
+
+    def displayName(self):
+        return self.tr("Połącz transekty po drogach")
+
+    def shortHelpString(self):
+        return self.tr(
+            "Ustala kolejność i kierunek przejścia transektów minimalizujące "
+            "przejazdy po sieci dróg i zapisuje transekty z łączącymi je odcinkami. "
+            "Wynik jest w układzie warstwy transektów."
+        )
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterVectorLayer(
+            self.INPUT, self.tr("Transekty"), [QgsProcessing.TypeVectorLine]))
+        self.addParameter(QgsProcessingParameterVectorLayer(
+            self.ROADS, self.tr("Drogi"), [QgsProcessing.TypeVectorLine]))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.TIME_BUDGET, self.tr("Czas optymalizacji kolejności (s)"),
+            QgsProcessingParameterNumber.Double, DEFAULT_TIME_BUDGET, minValue=0.0))
+        self.addParameter(QgsProcessingParameterFeatureSink(
+            self.OUTPUT, self.tr("Połączone transekty"), QgsProcessing.TypeVectorLine))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        from . import road_graph
+        from . import routing_tools
+        from .geodesy import line_lengths
+        from .geometry_convert import to_qgs_geometries
+
+        transect_layer = self.parameterAsVectorLayer(parameters, self.INPUT, context)
+        road_layer = self.parameterAsVectorLayer(parameters, self.ROADS, context)
+        if transect_layer is None or road_layer is None:
+            raise QgsProcessingException(self.tr("Brak warstwy transektów albo dróg."))
+        time_budget = self.parameterAsDouble(parameters, self.TIME_BUDGET, context)
+
+        # Graf dróg w układzie transektów — przeprojektowanie tylko przy różnych układach
+        crs = transect_layer.crs()
+        road_layer = _to_crs(road_layer, crs, context, feedback)
+
+        G = road_graph.build_segment_graph(road_layer)
+        try:
+            path_segments = routing_tools.connect_transects(transect_layer, G, time_budget=time_budget)
+        except ValueError as e:
+            raise QgsProcessingException(str(e))
+
+        fields = QgsFields()
+        fields.append(QgsField("length_m", QVariant.Double))
+        sink, dest = self.parameterAsSink(
+            parameters, self.OUTPUT, context, fields, QgsWkbTypes.LineString, crs)
+
+        lengths = line_lengths(path_segments, crs)
+        for length, qgs_geom in zip(lengths.tolist(), to_qgs_geometries(path_segments)):
+            feat = QgsFeature(fields)
+            feat.setGeometry(qgs_geom)
+            feat.setAttributes([length])
+            sink.addFeature(feat, QgsFeatureSink.FastInsert)
+
+        return {self.OUTPUT: dest}
+
+
+class TransectPipelineAlgorithm(BatTransectsAlgorithm):
+    """
+    Cały proces wtyczki: bufory, drogi ze score, transekty i ich połączenie.
+    """
+
+    INPUT = "INPUT"
+    BUFFER_DISTANCE = "BUFFER_DISTANCE"
+    MIN_LENGTH = "MIN_LENGTH"
+    DATA_SOURCE = "DATA_SOURCE"
+    OUTPUT_ROADS = "OUTPUT_ROADS"
+    OUTPUT_TRANSECTS = "OUTPUT_TRANSECTS"
+    OUTPUT_ROUTE = "OUTPUT_ROUTE"
+
+    def name(self):
+        return "transectpipeline"
+
+    def displayName(self):
+        return self.tr("Wyznacz trasę (cały proces)")
+
+    def shortHelpString(self):
+        return self.tr(
+            "Odpowiednik przycisku \"Wyznacz trasę\": uruchamia kolejno "
+            "bufferroads, minlengthpath i connecttransects."
+        )
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterVectorLayer(
+            self.INPUT, self.tr("Punkty"), [QgsProcessing.TypeVectorPoint]))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.BUFFER_DISTANCE, self.tr("Promień bufora (m)"),
+            QgsProcessingParameterNumber.Double, 500.0, minValue=1.0))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.MIN_LENGTH, self.tr("Minimalna długość transektu (m)"),
+            QgsProcessingParameterNumber.Double, 500.0, minValue=1.0))
+        self.addParameter(QgsProcessingParameterFile(
+            self.DATA_SOURCE, self.tr("Lokalne dane OSM (.osm, .pbf, .gpkg)"), optional=True))
+        self.addParameter(QgsProcessingParameterFeatureSink(
+            self.OUTPUT_ROADS, self.tr("Drogi"), QgsProcessing.TypeVectorLine))
+        self.addParameter(QgsProcessingParameterFeatureSink(
+            self.OUTPUT_TRANSECTS, self.tr("Transekty"), QgsProcessing.TypeVectorLine))
+        self.addParameter(QgsProcessingParameterFeatureSink(
+            self.OUTPUT_ROUTE, self.tr("Trasa"), QgsProcessing.TypeVectorLine))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        import processing
+
+        steps = QgsProcessingMultiStepFeedback(3, feedback)
+
+        roads = processing.run("battransects:bufferroads", {
+            "INPUT": parameters[self.INPUT],
+            "BUFFER_DISTANCE": parameters[self.BUFFER_DISTANCE],
+            "DATA_SOURCE": parameters.get(self.DATA_SOURCE),
+            "OUTPUT_BUFFERS": "TEMPORARY_OUTPUT",
+            "OUTPUT_ROADS": parameters[self.OUTPUT_ROADS],
+        }, context=context, feedback=steps, is_child_algorithm=True)["OUTPUT_ROADS"]
+        if steps.isCanceled():
+            return {}
+
+        steps.setCurrentStep(1)
+        transects = processing.run("battransects:minlengthpath", {
+            "INPUT": roads,
+            "GROUP_FIELD": "buffer_id",
+            "MIN_LENGTH": parameters[self.MIN_LENGTH],
+            "OUTPUT": parameters[self.OUTPUT_TRANSECTS],
+        }, context=context, feedback=steps, is_child_algorithm=True)["OUTPUT"]
+        if steps.isCanceled():
+            return {}
+
+        steps.setCurrentStep(2)
+        route = processing.run("battransects:connecttransects", {
+            "INPUT": transects,
+            "ROADS": roads,
+            "OUTPUT": parameters[self.OUTPUT_ROUTE],
+        }, context=context, feedback=steps, is_child_algorithm=True)["OUTPUT"]
+
+        return {self.OUTPUT_ROADS: roads, self.OUTPUT_TRANSECTS: transects, self.OUTPUT_ROUTE: route}
@@ -0,0 +1,31 @@
+# processing_provider.py
+from qgis.core import QgsProcessingProvider
+from qgis.PyQt.QtGui import QIcon
+
+from .processing_algorithms import (
+    BufferRoadsAlgorithm,
+    MinLengthPathAlgorithm,
+    ConnectTransectsAlgorithm,
+    TransectPipelineAlgorithm,
+)
+
+
+class BatTransectsProvider(QgsProcessingProvider):
+    """
+    Dostawca algorytmów Processing wtyczki — pozwala uruchamiać cały proces
+    bez interfejsu, np. `qgis_process run battransects:transectpipeline -- ...`.
+    """
+
+    def loadAlgorithms(self):
+        for algorithm in (BufferRoadsAlgorithm(), MinLengthPathAlgorithm(),
+                          ConnectTransectsAlgorithm(), TransectPipelineAlgorithm()):
+            self.addAlgorithm(algorithm)
+
+    def id(self):
+        return "battransects"
+
+    def name(self):
+        return "Bat Transects"
+
+    def icon(self):
+        return QIcon(":/icon.png")
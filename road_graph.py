@@ -0,0 +1,166 @@
+# road_graph.py
+import numpy as np
+import shapely
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+from .csr_graph import CSRGraph, range_indices
+from .geodesy import as_pyproj_crs, pair_lengths, part_lengths
+from .geometry_convert import from_qgs_geometries
+
+
+# Tolerancja sklejania węzłów w jednostkach układu warstwy
+GEOGRAPHIC_TOLERANCE = 1e-7  # stopnie (~1 cm)
+PROJECTED_TOLERANCE = 0.01  # metry
+
+_graph_cache = {}
+_watched_layers = set()
+
+
+def read_layer_lines(layer, request=None):
+    """
+    Wczytuje wszystkie linie warstwy (albo wybrane przez QgsFeatureRequest)
+    jednym przebiegiem.
+
+    Zwraca (coords, coord_part, part_feature, features): tablicę współrzędnych
+    wszystkich wierzchołków, numer części (linii) każdego wierzchołka, numer
+    obiektu każdej części oraz listę obiektów warstwy.
+    """
+    features = layer.getFeatures(request) if request is not None else layer.getFeatures()
+    features = [f for f in features if f.hasGeometry()]
+    geoms = from_qgs_geometries([f.geometry() for f in features])
+    parts, part_feature = shapely.get_parts(geoms, return_index=True)
+    coords, coord_part = shapely.get_coordinates(parts, return_index=True)
+    return coords, coord_part, part_feature, features
+
+
+def weld_nodes(coords, tolerance):
+    """
+    Skleja wierzchołki leżące bliżej niż tolerance (drzewo KD + składowe spójne).
+    Zwraca (numery węzłów wierzchołków, współrzędne węzłów) — węzeł leży
+    w pierwszym wierzchołku ze składowej.
+    """
+    n = len(coords)
+    if n == 0:
+        return np.zeros(0, dtype=int), np.zeros((0, 2))
+    pairs = cKDTree(coords).query_pairs(tolerance, output_type="ndarray")
+    adjacency = coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(n, n))
+    _, labels = connected_components(adjacency, directed=False)
+
+    first = np.full(labels.max() + 1, n)
+    np.minimum.at(first, labels, np.arange(n))
+    return labels, coords[first]
+
+
+def _default_tolerance(layer):
+    return GEOGRAPHIC_TOLERANCE if layer.crs().isGeographic() else PROJECTED_TOLERANCE
+
+
+def _heuristic(crs):
+    crs = as_pyproj_crs(crs)
+    if crs.is_geographic:
+        return "geodesic"
+    return "metric" if crs.axis_info and crs.axis_info[0].unit_name == "metre" else False
+
+
+def build_segment_graph(layer, tolerance=None, request=None):
+    """
+    Graf (CSRGraph) z krawędzią dla każdego odcinka między kolejnymi
+    wierzchołkami linii (do łączenia transektów). Wagi to geodezyjne długości
+    odcinków w metrach (geodesy.pair_lengths, zgodnie z układem warstwy),
+    liczone jednym wywołaniem dla wszystkich odcinków. Odcinki nie mają
+    osobnych geometrii — to proste między węzłami.
+    """
+    if tolerance is None:
+        tolerance = _default_tolerance(layer)
+    coords, coord_part, _, _ = read_layer_lines(layer, request)
+    labels, node_coords = weld_nodes(coords, tolerance)
+
+    same_part = coord_part[1:] == coord_part[:-1]
+    a = np.flatnonzero(same_part)
+    b = a + 1
+    a, b = a[labels[a] != labels[b]], b[labels[a] != labels[b]]  # pomiń odcinki zerowe
+
+    lengths = pair_lengths(node_coords[labels[a]], node_coords[labels[b]], layer.crs())
+    G = CSRGraph(node_coords, labels[a], labels[b], {"weight": lengths})
+    # Wagi w metrach — heurystyka A* dla CompactRouter (compact_routing.get_router)
+    G.graph["heuristic"] = _heuristic(layer.crs())
+    G.graph["geographic"] = layer.crs().isGeographic()
+    return G
+
+
+def _score(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def build_feature_graph(layer, prefer_score=True, tolerance=None, request=None):
+    """
+    Graf (CSRGraph) z krawędzią dla każdej linii warstwy (między jej końcami),
+    z długością geodezyjną w metrach (`length`, geodesy.part_lengths — jedno
+    wywołanie dla wszystkich linii) i wagą obniżaną przez atrybut `score`
+    (`weight`) — do wyszukiwania transektu o minimalnej długości. Wierzchołki
+    linii trafiają do płaskiej tablicy geometrii grafu; z równoległych linii
+    zostaje tańsza.
+    """
+    if tolerance is None:
+        tolerance = _default_tolerance(layer)
+    coords, coord_part, part_feature, features = read_layer_lines(layer, request)
+    labels, node_coords = weld_nodes(coords, tolerance)
+
+    part_ids, starts, counts = np.unique(coord_part, return_index=True, return_counts=True)
+    ends = starts + counts - 1
+
+    # linia z <2 punktami albo zamknięta pętla nie jest krawędzią
+    kept = np.flatnonzero((counts >= 2) & (labels[starts] != labels[ends]))
+    lengths = part_lengths(coords, coord_part, layer.crs())[part_ids[kept]]
+
+    # Score z atrybutów obiektu, domyślnie 0; przy prefer_score obniża wagę
+    scores = np.zeros(len(lengths))
+    if 'score' in layer.fields().names():
+        scores = np.array([_score(features[i]['score']) for i in part_feature[part_ids[kept]]], dtype=float)
+    weights = lengths / (1 + np.fmax(scores, 0)) if prefer_score else lengths
+
+    counts = counts[kept]
+    G = CSRGraph(
+        node_coords, labels[starts[kept]], labels[ends[kept]], {"weight": weights, "length": lengths},
+        edge_coords=coords[range_indices(starts[kept], counts)],
+        edge_offsets=np.concatenate(([0], np.cumsum(counts)))
+    )
+    G.graph["geographic"] = layer.crs().isGeographic()
+    return G
+
+
+def _invalidate(layer_id):
+    for key in [k for k in _graph_cache if k[0] == layer_id]:
+        del _graph_cache[key]
+
+
+def _watch_layer(layer):
+    layer_id = layer.id()
+    if layer_id in _watched_layers:
+        return
+    _watched_layers.add(layer_id)
+    for signal in (layer.dataChanged, layer.geometryChanged, layer.attributeValueChanged, layer.willBeDeleted):
+        signal.connect(lambda *args, layer_id=layer_id: _invalidate(layer_id))
+
+
+def get_road_graph(layer, kind="segments", **kwargs):
+    """
+    Zwraca graf dróg dla warstwy z cache; buduje go przy pierwszym użyciu.
+    Cache jest czyszczony sygnałami zmian warstwy (dataChanged, geometryChanged,
+    attributeValueChanged). Zwrócony graf (CSRGraph) jest współdzielony — nie modyfikuj go.
+
+    kind: "segments" (build_segment_graph) albo "features" (build_feature_graph).
+    """
+    key = (layer.id(), kind, tuple(sorted(kwargs.items())))
+    G = _graph_cache.get(key)
+    if G is None:
+        builder = build_segment_graph if kind == "segments" else build_feature_graph
+        G = builder(layer, **kwargs)
+        _watch_layer(layer)
+        _graph_cache[key] = G
+    return G
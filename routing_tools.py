@@ -6,25 +6,60 @@ from qgis.core import (
     QgsFeature, QgsGeometry, QgsVectorLayer, QgsProject, QgsField, Qgis, QgsPointXY
 )
 from PyQt5.QtCore import QVariant
-from qgis.core import QgsDistanceArea
 from qgis.PyQt.QtGui import QColor
 
 from shapely.geometry import LineString
 from qgis.core import (
-    QgsFeature, QgsGeometry, QgsVectorLayer, QgsProject, QgsField, QgsPointXY, Qgis
+    QgsFeature, QgsGeometry, QgsVectorLayer, QgsProject, QgsField, QgsPointXY, Qgis,
+    QgsFeatureRequest, QgsExpression, QgsTask, QgsApplication
 )
 from PyQt5.QtCore import QVariant
 from PyQt5.QtGui import QColor
-from math import radians, cos, sin, asin, sqrt
 
+from . import instrumentation
+from . import log
+from .path_search import find_min_length_path
+from .geometry_convert import to_qgs_geometry, to_qgs_geometries
+from .graph_index import get_graph_index
+from .road_graph import get_road_graph, build_feature_graph
+from .compact_routing import get_router
+from .csr_graph import CSRGraph
+from .geodesy import line_lengths
+from .tour_optimizer import EndpointDistances, optimize_tour, tour_cost, leg, DEFAULT_TIME_BUDGET
 
-def find_min_500m_path_in_layer(layer, iface, prefer_score=True):
+
+# Zadania wyszukiwania w toku — referencje chronią je przed usunięciem przez GC
+_search_tasks = set()
+
+
+def _search_in_task(task, G, min_length):
+    # QgsTask.fromFunction przekazuje zadanie jako pierwszy argument; zadanie służy też jako feedback
+    return min_length_path_geometry(G, min_length=min_length, feedback=task)
+
+
+def find_min_500m_path_in_layer(layer, iface, prefer_score=True, min_length=500.0):
+    """
+    Buduje graf warstwy (w wątku głównym — dostęp do warstwy) i uruchamia
+    wyszukiwanie ścieżki ≥ min_length w zadaniu QgsTask, które można anulować.
+    Wynik trafia do wspólnej warstwy "Wszystkie trasy". Zwraca zadanie.
+
+    Raport "find_min_path" obejmuje budowę grafu i wyszukiwanie w zadaniu —
+    jak w BufferBatch jest kończony dopiero po zakończeniu zadania.
+    """
     if layer is None or layer.geometryType() != 1:
         iface.messageBar().pushMessage("Błąd", "Warstwa musi zawierać linie!", level=Qgis.Critical)
-        return
+        return None
 
-    G = nx.Graph()
-    edge_geoms = {}
+    report = instrumentation.start_run("find_min_path")
+    # Graf jest budowany raz dla warstwy i trzymany w cache do jej zmiany
+    try:
+        with instrumentation.stage("graph_build"):
+            G = get_road_graph(layer, kind="features", prefer_score=prefer_score)
+    except Exception:
+        instrumentation.finish_run(report)
+        raise
+    instrumentation.count("graph_nodes", G.number_of_nodes())
+    instrumentation.count("graph_edges", G.number_of_edges())
 
     # Wspólna warstwa --------------------------------------------------------------------------
     if not hasattr(find_min_500m_path_in_layer, "combined_layer"):
@@ -43,143 +78,109 @@ def find_min_500m_path_in_layer(layer, iface, prefer_score=True):
     combined_layer.triggerRepaint()
     # End of Wspólna warstwa -------------------------------------------------------------------
 
-    iface.messageBar().pushMessage(
-        "DEBUG",
-        f"Węzły: {len(G.nodes())}, krawędzie: {len(G.edges())}",
-        level=Qgis.Info
-    )
-
-    print("[DEBUG] Buduję graf...")
-    for feat in layer.getFeatures():
-        geom = feat.geometry()
-        if not geom:
-            continue
-
-        line = geom.asPolyline()
-        if not line:
-            line = geom.asMultiPolyline()[0]
-        if len(line) < 2:
-            print("[DEBUG] Pominięto geometrię z <2 punktami")
-            continue
-
-        start = tuple(line[0])
-        end = tuple(line[-1])
-        d = QgsDistanceArea()
-        d.setEllipsoid('WGS84')
-
-        #-----------------------------------------------------------------------------
-
-        length = d.measureLength(QgsGeometry.fromPolylineXY([QgsPointXY(p[0], p[1]) for p in line]))
+    log.debug(f"Węzły: {G.number_of_nodes()}, krawędzie: {G.number_of_edges()}, tablice: {G.nbytes / 2 ** 20:.1f} MiB")
 
-        # Pobierz score z atrybutów feature, domyślnie 0
-        score = feat['score'] if 'score' in feat.fields().names() else 0.0
-        try:
-            score = float(score)
-        except:
-            score = 0.0
-
-        # Jeśli preferujemy score, zmodyfikuj wagę
-        if prefer_score and score > 0:
-            weight = length / (1 + score)  # im wyższy score, tym mniejsza "kosztowa" długość
-        else:
-            weight = length
-
-        G.add_edge(start, end, weight=weight, geometry=LineString(line))
-
-        #-------------------------------------------------------------------------------
-
-        edge_geoms[(start, end)] = LineString(line)
-        edge_geoms[(end, start)] = LineString(list(reversed(line)))
-
-    print(f"[DEBUG] Węzły: {len(G.nodes())}, Krawędzie: {len(G.edges())}")
-
-    min_path = None
-    min_length = float('inf')
-    nodes = list(G.nodes())
-
-    for i in range(len(nodes)):
-        for j in range(i + 1, len(nodes)):
-            source = nodes[i]
-            target = nodes[j]
-
-            found_paths = 0
-
-            try:
-                for path in nx.all_simple_paths(G, source=source, target=target, cutoff=10):
-                    found_paths += 1
-                    length = sum(
-                        G.edges[path[k], path[k + 1]]['weight']
-                        for k in range(len(path) - 1)
-                    )
-                    print(f"[DEBUG] Path {source} → {target} przez {len(path)} punktów: {length:.2f} m")
-                    if 500 <= length < min_length:
-                        min_length = length
-                        min_path = path
-
-                iface.messageBar().pushMessage(
-                    "DEBUG", f"Liczba sprawdzonych ścieżek: {found_paths}", level=Qgis.Info
-                )
-            except nx.NetworkXNoPath:
-                continue
-
-    if not min_path:
-        iface.messageBar().pushMessage("Brak trasy", "Nie znaleziono ścieżki ≥ 500 m", level=Qgis.Warning)
-        print("[DEBUG] Nie znaleziono żadnej ścieżki ≥ 500 m")
-        return
-
-    segments = []
-    for i in range(len(min_path) - 1):
-        edge = G.edges[min_path[i], min_path[i + 1]]
-        segments.append(edge['geometry'])
+    def finished(exception, result=None):
+        _search_tasks.discard(task)
+        instrumentation.finish_run(report)
+        if exception is not None:
+            iface.messageBar().pushMessage("Błąd", f"Wyszukiwanie ścieżki nie powiodło się: {exception}",
+                                           level=Qgis.Critical)
+            log.error(f"Wyszukiwanie ścieżki w {layer.name()} → {exception}")
+            return
+        if not result:
+            iface.messageBar().pushMessage("Brak trasy", f"Nie znaleziono ścieżki ≥ {int(min_length)} m",
+                                           level=Qgis.Warning)
+            log.debug(f"Nie znaleziono żadnej ścieżki ≥ {int(min_length)} m")
+            return
 
-    merged = linemerge(segments)
+        merged, path_length = result
 
-    feat = QgsFeature()
-    feat.setGeometry(QgsGeometry.fromWkt(merged.wkt))
-    feat.setAttributes([min_length])
-    combined_layer.dataProvider().addFeature(feat)
-    combined_layer.updateExtents()
-    combined_layer.triggerRepaint()
+        feat = QgsFeature()
+        feat.setGeometry(to_qgs_geometry(merged))
+        feat.setAttributes([path_length])
+        combined_layer.dataProvider().addFeature(feat)
+        combined_layer.updateExtents()
+        combined_layer.triggerRepaint()
+
+        iface.messageBar().pushMessage("OK", f"Znaleziono trasę: {int(path_length)} m", level=Qgis.Success)
+
+    task = QgsTask.fromFunction(
+        f"Bat Transects: ścieżka ≥ {int(min_length)} m ({layer.name()})",
+        _search_in_task, G, min_length,
+        on_finished=finished,
+        flags=QgsTask.CanCancel
+    )
+    _search_tasks.add(task)
+    QgsApplication.taskManager().addTask(task)
+    return task
+
+def min_length_path_geometry(G, min_length=500.0, feedback=None):
+    """
+    Szuka w grafie z build_feature_graph najtańszej ścieżki o długości co
+    najmniej min_length metrów. Zwraca (geometria Shapely, długość) albo None.
+    feedback (QgsFeedback) pozwala przerwać wyszukiwanie.
+    """
+    with instrumentation.stage("path_search"):
+        result = find_min_length_path(G, min_length=min_length, feedback=feedback)
+    if not result:
+        return None
 
-    iface.messageBar().pushMessage("OK", f"Znaleziono trasę: {int(min_length)} m", level=Qgis.Success)
+    min_path, _, path_length = result
+    return linemerge(path_geometry(G, min_path)), path_length
+
+
+def min_length_paths_by_group(layer, group_field=None, prefer_score=True, min_length=500.0, feedback=None,
+                              values=None):
+    """
+    Szuka ścieżki min_length_path_geometry osobno dla każdej wartości pola
+    group_field (np. buffer_id we wspólnej warstwie dróg) albo tylko dla
+    podanych values; bez pola — dla całej warstwy. Generuje pary (wartość,
+    wynik albo None).
+    """
+    if group_field and values is not None:
+        groups = list(values)
+    elif group_field:
+        groups = sorted(layer.uniqueValues(layer.fields().indexOf(group_field)), key=str)
+    else:
+        groups = [None]
+
+    progress = log.Progress(feedback)
+    for index, value in enumerate(groups):
+        if feedback is not None and feedback.isCanceled():
+            break
+        request = None
+        if group_field:
+            request = QgsFeatureRequest().setFilterExpression(
+                QgsExpression.createFieldEqualityExpression(group_field, value))
+
+        with instrumentation.stage("graph_build"):
+            G = build_feature_graph(layer, prefer_score=prefer_score, request=request)
+        yield value, min_length_path_geometry(G, min_length=min_length, feedback=feedback)
+        progress.step(index + 1, len(groups))
 
 # ----------------------------------------------------------------------------------------------
 
-def haversine_distance(p1, p2):
-    lon1, lat1 = p1.x(), p1.y()
-    lon2, lat2 = p2.x(), p2.y()
-    R = 6371000
-    dlon = radians(lon2 - lon1)
-    dlat = radians(lat2 - lat1)
-    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
-    return R * 2 * asin(sqrt(a))
-
 def build_road_graph(road_layer):
-    G = nx.Graph()
-    for feat in road_layer.getFeatures():
-        geom = feat.geometry()
-        line = geom.asPolyline() or geom.asMultiPolyline()[0]
-        if len(line) < 2:
-            continue
-        for i in range(len(line) - 1):
-            p1 = tuple(line[i])
-            p2 = tuple(line[i + 1])
-            dist = QgsGeometry.fromPolylineXY([QgsPointXY(*p1), QgsPointXY(*p2)]).length()
-            G.add_edge(p1, p2, weight=dist, geometry=LineString([p1, p2]))
-    return G
-
-def snap_to_graph(point, G, max_dist=50):
-    nearest = min(G.nodes, key=lambda n: haversine_distance(point, QgsPointXY(*n)))
-    if haversine_distance(point, QgsPointXY(*nearest)) > max_dist:
-        return None
-    return nearest
-
-def shortest_path_geometry(G, p1, p2):
-    try:
-        nodes = nx.shortest_path(G, source=p1, target=p2, weight='weight')
-    except nx.NetworkXNoPath:
-        return []
-
+    return get_road_graph(road_layer, kind="segments")
+
+def snap_to_graph(point, G, max_dist=50, on_edge=False):
+    """
+    Przyciąga punkt do najbliższego węzła grafu (albo, z on_edge=True, do
+    najbliższego punktu na krawędzi, dzieląc ją). Korzysta z indeksu
+    przestrzennego budowanego raz na graf. max_dist jest w metrach (albo
+    w jednostkach układu odwzorowanego warstwy). W CSRGraph (build_road_graph)
+    krawędź dzieli CSRGraph.split_edge — nowy węzeł widzą EndpointDistances
+    i CompactRouter.
+    """
+    index = get_graph_index(G)
+    if on_edge:
+        return index.snap_to_edge(point, max_dist=max_dist)
+    return index.nearest_node(point, max_dist=max_dist)
+
+def path_geometry(G, nodes):
+    if isinstance(G, CSRGraph):
+        return G.path_geometries(nodes)
     geometries = []
     for i in range(len(nodes) - 1):
         u = nodes[i]
@@ -189,13 +190,32 @@ def shortest_path_geometry(G, p1, p2):
             geometries.append(edge_data['geometry'])
     return geometries
 
-def connect_transects_via_osm(transect_layer, road_layer, iface):
-    if not transect_layer or transect_layer.geometryType() != 1:
-        iface.messageBar().pushMessage("Błąd", "Warstwa transektów musi zawierać linie!", level=Qgis.Critical)
-        return
-
-    G = build_road_graph(road_layer)
-
+def shortest_path_geometry(G, p1, p2, accelerated=False):
+    """
+    Geometria najkrótszej trasy p1 → p2. Z accelerated=True trasy szuka
+    CompactRouter (A* na grafie ze zwiniętymi łańcuchami, przygotowanie
+    zapisywane w cache na dysku) — dla grafu z build_road_graph.
+    """
+    try:
+        if accelerated and isinstance(G, CSRGraph):
+            nodes = [G.node_id(n) for n in get_router(G).shortest_path(G.node_key(p1), G.node_key(p2))]
+        elif accelerated:
+            nodes = get_router(G).shortest_path(p1, p2)
+        elif isinstance(G, CSRGraph):
+            nodes = G.shortest_path(p1, p2) or []
+        else:
+            nodes = nx.shortest_path(G, source=p1, target=p2, weight='weight')
+    except nx.NetworkXNoPath:
+        return []
+    return path_geometry(G, nodes)
+
+def connect_transects(transect_layer, G, time_budget=DEFAULT_TIME_BUDGET):
+    """
+    Łączy transekty warstwy trasą po grafie dróg G (build_road_graph).
+    Nie dotyka interfejsu QGIS — zwraca listę geometrii Shapely (transekty
+    i przejazdy między nimi w kolejności trasy), a w razie braku danych albo
+    połączenia rzuca ValueError z opisem.
+    """
     transects = []
     for feat in transect_layer.getFeatures():
         geom = feat.geometry()
@@ -212,62 +232,71 @@ def connect_transects_via_osm(transect_layer, road_layer, iface):
         })
 
     if not transects:
-        iface.messageBar().pushMessage("Brak danych", "Nie znaleziono transektów.", level=Qgis.Warning)
-        return
+        raise ValueError("Nie znaleziono transektów.")
+
+    # Końce wszystkich transektów dopasowane do grafu jednorazowo
+    endpoints = []
+    with instrumentation.stage("snap"):
+        for t in transects:
+            for point in (t['start'], t['end']):
+                node = snap_to_graph(point, G, max_dist=1200)
+                if node is None:
+                    raise ValueError(f"Nie można dopasować transektu {t['id']} do grafu OSM")
+                endpoints.append(node)
+    instrumentation.count("transects", len(transects))
+
+    # Jedna Dijkstra na koniec transektu, potem kolejność i kierunki z 2-opt / Or-opt
+    with instrumentation.stage("distance_matrix"):
+        distances = EndpointDistances(G, endpoints)
+    with instrumentation.stage("tour_optimization"):
+        tour = optimize_tour(distances.matrix, time_budget=time_budget)
+    if log.is_enabled(log.DEBUG):
+        log.debug(f"Kolejność transektów: {[transects[i]['id'] for i, _ in tour]}, "
+                  f"przejazdy: {tour_cost(distances.matrix, tour):.1f}")
 
-    unvisited = transects[1:]
-    current = transects[0]
     path_segments = []
+    for k, (i, reverse) in enumerate(tour):
+        if k > 0:
+            prev = tour[k - 1][0]
+            nodes = distances.path(*leg(tour[k - 1], tour[k]))
+            if nodes is None:
+                raise ValueError(f"Brak drogi pomiędzy {transects[prev]['id']} a {transects[i]['id']}")
+            path_segments.extend(path_geometry(G, nodes))
+
+        line = [(pt.x(), pt.y()) for pt in transects[i]['line']]
+        if reverse:
+            line = list(reversed(line))
+        path_segments.append(LineString(line))
+
+    return path_segments
+
+@instrumentation.measured("connect_transects")
+def connect_transects_via_osm(transect_layer, road_layer, iface, time_budget=DEFAULT_TIME_BUDGET):
+    if not transect_layer or transect_layer.geometryType() != 1:
+        iface.messageBar().pushMessage("Błąd", "Warstwa transektów musi zawierać linie!", level=Qgis.Critical)
+        return
 
-    line_coords = [(pt.x(), pt.y()) for pt in current['line']]
-    if line_coords[0] != (current['start'].x(), current['start'].y()):
-        line_coords = list(reversed(line_coords))
-    path_segments.append(LineString(line_coords))
-
-    while unvisited:
-        nearest = min(unvisited, key=lambda t: haversine_distance(current['end'], t['start']))
-
-        try:
-            p1 = snap_to_graph(current['end'], G, max_dist=1200)
-            p2 = snap_to_graph(nearest['start'], G, max_dist=1200)
-
-            if p1 is None or p2 is None or p1 not in G.nodes or p2 not in G.nodes:
-                iface.messageBar().pushMessage("Brak połączenia",
-                                               f"Brak drogi pomiędzy {current['id']} a {nearest['id']}",
-                                               level=Qgis.Warning)
-                return
-            print(f"[DEBUG] current['end']: {current['end']}, snapped to: {p1}")
-            print(f"[DEBUG] nearest['start']: {nearest['start']}, snapped to: {p2}")
-
-        except ValueError:
-            iface.messageBar().pushMessage("Błąd", "Nie można dopasować punktów do grafu OSM", level=Qgis.Critical)
-            return
-
-        print(f"[DEBUG] Próba połączenia transektów {current['id']} → {nearest['id']} przez {p1} → {p2}")
-        road_path = shortest_path_geometry(G, p1, p2)
-        if not road_path:
-            iface.messageBar().pushMessage("Brak połączenia", f"Brak drogi pomiędzy {current['id']} a {nearest['id']}", level=Qgis.Warning)
-            return
-
-        path_segments.extend(road_path)
-
-        next_line = [(pt.x(), pt.y()) for pt in nearest['line']]
-        if next_line[0] != (nearest['start'].x(), nearest['start'].y()):
-            next_line = list(reversed(next_line))
-        path_segments.append(LineString(next_line))
+    with instrumentation.stage("graph_build"):
+        G = build_road_graph(road_layer)
+    instrumentation.count("graph_nodes", G.number_of_nodes())
+    instrumentation.count("graph_edges", G.number_of_edges())
 
-        current = nearest
-        unvisited.remove(nearest)
+    try:
+        path_segments = connect_transects(transect_layer, G, time_budget=time_budget)
+    except ValueError as e:
+        iface.messageBar().pushMessage("Brak połączenia", str(e), level=Qgis.Warning)
+        return
 
     output = QgsVectorLayer(f"LineString?crs={transect_layer.crs().authid()}", "Połączone transekty (OSM)", "memory")
     provider = output.dataProvider()
     provider.addAttributes([QgsField("length_m", QVariant.Double)])
     output.updateFields()
 
-    for geom in path_segments:
+    lengths = line_lengths(path_segments, transect_layer.crs())
+    for length, qgs_geom in zip(lengths.tolist(), to_qgs_geometries(path_segments)):
         feat = QgsFeature()
-        feat.setGeometry(QgsGeometry.fromWkt(geom.wkt))
-        feat.setAttributes([geom.length])
+        feat.setGeometry(qgs_geom)
+        feat.setAttributes([length])
         provider.addFeature(feat)
 
     output.updateExtents()
@@ -0,0 +1,199 @@
+# tour_optimizer.py
+import time
+
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+
+from .constants import DEFAULT_TIME_BUDGET
+from .csr_graph import CSRGraph
+
+
+MAX_OR_OPT_SEGMENT = 3
+
+
+class EndpointDistances:
+    """
+    Macierz odległości sieciowych między końcami transektów.
+
+    endpoints to lista węzłów grafu (CSRGraph albo networkx): dla transektu i
+    początek to endpoints[2 * i], koniec to endpoints[2 * i + 1]. Dla każdego
+    unikalnego węzła wykonywana jest jedna Dijkstra (scipy.sparse.csgraph na
+    macierzy CSR grafu, zamiast osobnego wyszukiwania dla każdej pary);
+    poprzedniki są zachowywane, więc trasy między końcami odtwarza się bez
+    ponownego szukania. Brak połączenia oznacza odległość inf.
+    """
+
+    def __init__(self, G, endpoints, weight="weight"):
+        self.endpoints = list(endpoints)
+        self._nodes = None
+        if isinstance(G, CSRGraph):
+            self._ids = self.endpoints
+        else:
+            self._nodes = list(G.nodes())
+            index = {node: i for i, node in enumerate(self._nodes)}
+            self._ids = [index[node] for node in self.endpoints]
+            G = CSRGraph.from_networkx(G, weight=weight, attrs=())
+
+        unique = list(dict.fromkeys(self._ids))
+        self._row = {node: i for i, node in enumerate(unique)}
+        dist, self._preds = dijkstra(G.matrix(weight), directed=True, indices=unique, return_predecessors=True)
+
+        rows = [self._row[node] for node in self._ids]
+        self.matrix = dist[np.ix_(rows, self._ids)]
+        # Graf nieskierowany — usuń asymetrię wynikającą z zaokrągleń
+        self.matrix = np.minimum(self.matrix, self.matrix.T)
+
+    def path(self, i, j):
+        """
+        Zwraca listę węzłów trasy z końca i do końca j albo None, gdy brak połączenia.
+        """
+        source, target = self._ids[i], self._ids[j]
+        pred = self._preds[self._row[source]]
+        current = target
+        ids = [current]
+        while current != source:
+            current = int(pred[current])
+            if current < 0:
+                return None
+            ids.append(current)
+        ids.reverse()
+        return ids if self._nodes is None else [self._nodes[k] for k in ids]
+
+
+# Element trasy to (numer transektu, odwrócony); wejście i wyjście to numery końców w macierzy
+
+def _entry(item):
+    return 2 * item[0] + item[1]
+
+
+def _exit(item):
+    return 2 * item[0] + 1 - item[1]
+
+
+def _flip(item):
+    return item[0], not item[1]
+
+
+def leg(a, b):
+    """
+    Zwraca numery końców (wyjście z a, wejście do b) przejazdu między elementami trasy.
+    """
+    return _exit(a), _entry(b)
+
+
+def tour_cost(D, tour):
+    """
+    Koszt przejazdów między kolejnymi transektami trasy (bez samych transektów).
+    """
+    return sum(D[_exit(a), _entry(b)] for a, b in zip(tour, tour[1:]))
+
+
+def _greedy_tour(D, start):
+    n = len(D) // 2
+    tour = [start]
+    unvisited = set(range(n)) - {start[0]}
+    while unvisited:
+        row = D[_exit(tour[-1])]
+        nxt = min(
+            ((t, f) for t in unvisited for f in (False, True)),
+            key=lambda item: row[_entry(item)]
+        )
+        tour.append(nxt)
+        unvisited.remove(nxt[0])
+    return tour
+
+
+def _two_opt(tour, link, deadline):
+    """
+    Odwraca fragment trasy tour[i..j] (wraz z kierunkiem transektów), jeśli skraca trasę.
+    Dla i == j to po prostu zmiana kierunku jednego transektu.
+    """
+    n = len(tour)
+    for i in range(n):
+        if time.monotonic() > deadline:
+            return False
+        prev = tour[i - 1] if i > 0 else None
+        for j in range(i, n):
+            nxt = tour[j + 1] if j < n - 1 else None
+            old = link(prev, tour[i]) + link(tour[j], nxt)
+            new = link(prev, _flip(tour[j])) + link(_flip(tour[i]), nxt)
+            if new < old - 1e-9:
+                tour[i:j + 1] = [_flip(item) for item in reversed(tour[i:j + 1])]
+                return True
+    return False
+
+
+def _or_opt(tour, link, deadline):
+    """
+    Przenosi fragment 1..MAX_OR_OPT_SEGMENT transektów w inne miejsce trasy
+    (opcjonalnie odwrócony), jeśli skraca trasę.
+    """
+    n = len(tour)
+    for size in range(1, min(MAX_OR_OPT_SEGMENT, n - 1) + 1):
+        for i in range(n - size + 1):
+            if time.monotonic() > deadline:
+                return False
+            j = i + size - 1
+            segment = tour[i:j + 1]
+            prev = tour[i - 1] if i > 0 else None
+            nxt = tour[j + 1] if j < n - 1 else None
+            removed = link(prev, nxt) - link(prev, segment[0]) - link(segment[-1], nxt)
+            rest = tour[:i] + tour[j + 1:]
+
+            variants = (segment, [_flip(item) for item in reversed(segment)])
+            for k in range(len(rest) + 1):
+                if k == i:
+                    continue  # pierwotne miejsce (odwrócenie w miejscu obsługuje 2-opt)
+                a = rest[k - 1] if k > 0 else None
+                b = rest[k] if k < len(rest) else None
+                for moved in variants:
+                    added = link(a, moved[0]) + link(moved[-1], b) - link(a, b)
+                    if removed + added < -1e-9:
+                        tour[:] = rest[:k] + moved + rest[k:]
+                        return True
+    return False
+
+
+def optimize_tour(D, time_budget=DEFAULT_TIME_BUDGET):
+    """
+    Ustala kolejność i kierunek przejścia transektów minimalizujący sumę
+    przejazdów między nimi (trasa otwarta, dowolny pierwszy transekt).
+
+    D to macierz odległości między końcami (EndpointDistances.matrix).
+    Startem jest najlepsza trasa zachłanna (najbliższy sąsiad z każdego
+    możliwego początku), poprawiana ruchami 2-opt i Or-opt aż do braku
+    poprawy albo wyczerpania time_budget sekund.
+
+    Zwraca listę (numer transektu, odwrócony).
+    """
+    n = len(D) // 2
+    if n == 0:
+        return []
+    deadline = time.monotonic() + time_budget
+
+    # Brak połączenia zastępowany dużą karą, żeby różnice kosztów pozostały skończone
+    finite = D[np.isfinite(D)]
+    penalty = (finite.max() if finite.size else 1.0) * len(D) * 10 + 1.0
+    D = np.where(np.isfinite(D), D, penalty)
+
+    def link(a, b):
+        if a is None or b is None:
+            return 0.0
+        return D[_exit(a), _entry(b)]
+
+    best = None
+    best_cost = float('inf')
+    for start in ((t, f) for t in range(n) for f in (False, True)):
+        tour = _greedy_tour(D, start)
+        cost = tour_cost(D, tour)
+        if cost < best_cost:
+            best, best_cost = tour, cost
+        if time.monotonic() > deadline:
+            break
+
+    while time.monotonic() <= deadline:
+        if _two_opt(best, link, deadline):
+            continue
+        if not _or_opt(best, link, deadline):
+            break
+    return best